@@ -1,10 +1,12 @@
 import sys
 import os
-import json
 import datetime
 import shutil
 import re
 
+from mp3_index import resolve_audio_source
+from translation_store import TranslationStore
+
 # --- CONFIGURAZIONI GLOBALI ---
 LANGUAGES = ['it', 'en', 'es', 'fr']
 NAV_MARKER = '// ** MARKER: START NEW NAV LINKS **' # Marcatore per main.js
@@ -89,8 +91,11 @@ def update_main_js(repo_root, page_id, nav_key_id, lat, lon, distance):
     except Exception as e:
         print(f"ERRORE aggiornando main.js: {e}")
 
-def update_texts_json_nav(repo_root, page_id, nav_key_id, translations):
-    """Aggiorna i file JSON di traduzione."""
+def update_texts_json_nav(repo_root, page_id, nav_key_id, translations, store=None):
+    """
+    Aggiorna i file JSON di traduzione.
+    Con uno 'store' condiviso (TranslationStore) la scrittura è rimandata al suo flush().
+    """
     current_date = datetime.datetime.now().strftime("%Y-%m-%d")
     
     # SCHEMA COMPLETO (tutte le chiavi inizializzate)
@@ -115,45 +120,46 @@ def update_texts_json_nav(repo_root, page_id, nav_key_id, translations):
         "audioSource": "" 
     }
     
+    owns_store = store is None
+    if owns_store:
+        store = TranslationStore(os.path.join(repo_root, 'data', 'translations'), LANGUAGES)
+
     for lang in LANGUAGES:
-        json_path = os.path.join(repo_root, 'data', 'translations', lang, 'texts.json')
+        json_path = store.path(lang)
         
         try:
-            with open(json_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            
+            if not os.path.exists(json_path):
+                raise FileNotFoundError(json_path)
             # 1. Aggiorna il blocco 'nav'
-            data['nav'][nav_key_id] = translations[lang]
+            if not store.set_path(lang, f"nav.{nav_key_id}", translations[lang]):
+                continue
 
             # 2. Inizializza/Aggiorna il blocco della pagina
-            if page_id not in data:
+            page_block = store.page(lang, page_id)
+            if page_block is None:
                 # Creazione del blocco per la nuova pagina (Schema completo)
                 new_block = NEW_PAGE_SCHEMA.copy()
                 new_block['pageTitle'] = translations[lang]
-                new_block['audioSource'] = f"{lang}/{page_id}.mp3"
+                # Solo se la registrazione esiste già (anche nella lingua di riserva), per evitare un 404
+                new_block['audioSource'] = resolve_audio_source(lang, page_id, audio_dir=os.path.join(repo_root, 'Assets', 'Audio'))
                 
                 # Aggiungi un placeholder per il testo iniziale
                 if lang == 'it' or lang == 'en':
                     new_block['mainText'] = "Testo iniziale per la traduzione."
                 
-                data[page_id] = new_block
+                store.update(lang, page_id, new_block, create_page=True)
                 print(f"✅ Inizializzato NUOVO blocco '{page_id}' in {lang}/texts.json con schema completo.")
             else:
                 # Se la pagina esiste, aggiorna date e assicurati che abbia tutte le chiavi richieste
-                for key, default_value in NEW_PAGE_SCHEMA.items():
-                    if key not in data[page_id]:
-                        data[page_id][key] = default_value
-                        
-                data[page_id]['lastUpdate'] = current_date
+                missing_keys = {key: default_value for key, default_value in NEW_PAGE_SCHEMA.items()
+                                if key not in page_block}
                 
                 # Correggi il titolo: elimina 'title' se presente e usa 'pageTitle'
-                if 'title' in data[page_id]:
-                    del data[page_id]['title'] 
-                data[page_id]['pageTitle'] = translations[lang]
-            
-            with open(json_path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=4, ensure_ascii=False)
+                store.delete(lang, page_id, 'title')
+                store.update(lang, page_id, {**missing_keys, 'lastUpdate': current_date,
+                                             'pageTitle': translations[lang]})
             
+            # Il file viene scritto una sola volta, con flush()
             print(f"✅ Aggiornato nav e schema in {lang}/texts.json")
             
         except FileNotFoundError:
@@ -161,6 +167,12 @@ def update_texts_json_nav(repo_root, page_id, nav_key_id, translations):
         except Exception as e:
             print(f"ERRORE aggiornando JSON per {lang}: {e}")
 
+    if owns_store:
+        try:
+            store.flush()
+        except Exception as e:
+            print(f"ERRORE scrivendo i file JSON: {e}")
+
 def get_target_lang_code(filename):
     """Determina il codice linguistico corretto dal nome del file HTML."""
     match = re.search(r'-([a-z]{2})\.html$', filename)
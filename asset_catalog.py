@@ -0,0 +1,396 @@
+import os
+import re
+import sys
+import json
+import mmap
+import time
+import sqlite3
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple
+
+from PIL import Image
+
+from image_dimensions import read_image_size
+
+# =================================================================
+# CATALOGO PERSISTENTE DEGLI ASSET (SQLite)
+# =================================================================
+# Più strumenti hanno bisogno di sapere quali asset esistono, con dimensione,
+# hash, dimensioni in pixel, coordinate GPS e pagine che li usano; finora
+# ognuno lo ricostruiva camminando in Assets/ o leggendo image_list.txt.
+# Il catalogo conserva tutto in un unico file SQLite:
+#   - assets:     un record per file di Assets/ e public/ (hash SHA-256 calcolato
+#                 con letture mmap in un pool di thread; il record viene
+#                 riusato finché (percorso, dimensione, mtime) non cambiano);
+#   - refs:       indice inverso asset -> chiavi dei texts.json, pagine HTML,
+#                 frammenti, main.js e style.css che lo referenziano;
+#   - ref_sources: (dimensione, mtime) dei file analizzati per i riferimenti,
+#                 così una nuova scansione rilegge solo quelli modificati.
+
+CATALOG_FILE = ".asset_catalog.sqlite"
+# Incrementare quando cambia la logica di estrazione: invalida le righe salvate
+CATALOG_VERSION = 2
+# Cartelle degli asset catalogati (più i file multimediali sparsi nella radice, es. Pugliole.mp3)
+ASSET_ROOTS = ("Assets", "public")
+# Sorgenti dei riferimenti
+TRANSLATIONS_DIR = os.path.join("data", "translations")
+TEXTS_JSON_FILENAME = "texts.json"
+FRAGMENTS_DIR = "text_files"
+SCRIPT_FILES = ("main.js", "style.css")
+# Liste "page_id|chiave|percorso" usate da update_image_sources.py (percorsi relativi ad Assets/images)
+IMAGE_LIST_FILES = ("image_list.txt", "image_list_all.txt")
+IMAGE_LIST_BASE_DIR = "Assets/images"
+
+# Chiavi dei texts.json -> cartella a cui è relativo il valore (come in main.js)
+TEXTS_KEY_DIRS = {"headImage": "public/images", "audioSource": "Assets/Audio"}
+TEXTS_KEY_PREFIX_DIRS = (("imageSource", "Assets/images"), ("mainText", FRAGMENTS_DIR))
+
+HASH_WORKERS = min(8, os.cpu_count() or 1)
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".gif", ".bmp", ".webp")
+AUDIO_EXTENSIONS = (".mp3", ".ogg", ".wav", ".m4a")
+GPS_IFD_TAG = 0x8825
+
+# Attributi HTML con un percorso e url(...) nei CSS
+HTML_REF_REGEX = re.compile(r'\b(?:src|href|poster|data-src)\s*=\s*["\']([^"\']+)["\']', re.IGNORECASE)
+SRCSET_REGEX = re.compile(r'\bsrcset\s*=\s*["\']([^"\']+)["\']', re.IGNORECASE)
+CSS_URL_REGEX = re.compile(r'url\(\s*["\']?([^"\')]+)["\']?\s*\)')
+# Percorsi letterali completi nel JavaScript (quelli costruiti con ${...} restano fuori)
+SCRIPT_PATH_REGEX = re.compile(r'["\'`]((?:Assets|public|text_files|data)/[^"\'`$\s]+\.[A-Za-z0-9]+)["\'`]')
+# Righe di commento nel JavaScript ("//", "/*", " * "): gli esempi nei commenti non sono riferimenti
+SCRIPT_COMMENT_LINE_REGEX = re.compile(r'^[ \t]*(?://|/?\*).*$', re.MULTILINE)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS assets (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    sha256 TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    width INTEGER,
+    height INTEGER,
+    gps_lat REAL,
+    gps_lon REAL
+);
+CREATE INDEX IF NOT EXISTS assets_sha256 ON assets (sha256);
+CREATE TABLE IF NOT EXISTS ref_sources (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS refs (
+    target TEXT NOT NULL,
+    source TEXT NOT NULL,
+    location TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS refs_target ON refs (target);
+CREATE INDEX IF NOT EXISTS refs_source ON refs (source);
+"""
+
+
+def web_path(path: str) -> str:
+    """Percorso normalizzato con '/' (forma usata in tutte le tabelle)."""
+    return os.path.normpath(path).replace(os.sep, "/")
+
+
+def hash_file_mmap(path: str) -> str:
+    """SHA-256 con lettura memory-mapped (hashlib rilascia il GIL: i thread lavorano in parallelo)."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                digest.update(mapped)
+    return digest.hexdigest()
+
+
+def _asset_kind(path: str) -> str:
+    extension = os.path.splitext(path)[1].lower()
+    if extension in IMAGE_EXTENSIONS:
+        return "image"
+    if extension in AUDIO_EXTENSIONS:
+        return "audio"
+    return "other"
+
+
+def _gps_coords(path: str) -> Tuple[Optional[float], Optional[float]]:
+    """Coordinate GPS decimali dall'EXIF (solo intestazione, nessuna decodifica dei pixel)."""
+    try:
+        with Image.open(path) as img:
+            gps = img.getexif().get_ifd(GPS_IFD_TAG)
+    except Exception:
+        return None, None
+    if not gps or 2 not in gps or 4 not in gps:
+        return None, None
+
+    def to_decimal(value, ref):
+        degrees, minutes, seconds = (float(v) for v in value)
+        decimal = degrees + minutes / 60.0 + seconds / 3600.0
+        return -decimal if ref in ("S", "W") else decimal
+
+    try:
+        return to_decimal(gps[2], gps.get(1, "N")), to_decimal(gps[4], gps.get(3, "E"))
+    except (TypeError, ValueError, ZeroDivisionError):
+        return None, None
+
+
+def describe_asset(path: str, size: int, mtime_ns: int) -> Tuple:
+    """Riga della tabella assets per un file (eseguita nei thread del pool)."""
+    kind = _asset_kind(path)
+    width = height = lat = lon = None
+    if kind == "image":
+        dimensions = read_image_size(path)
+        if dimensions:
+            width, height = dimensions
+        lat, lon = _gps_coords(path)
+    return path, size, mtime_ns, hash_file_mmap(path), kind, width, height, lat, lon
+
+
+def texts_key_base(key: str, value: str) -> Optional[str]:
+    """Cartella a cui è relativo il valore di una chiave dei texts.json (None se non è un percorso)."""
+    base = TEXTS_KEY_DIRS.get(key)
+    if base is None:
+        base = next((d for prefix, d in TEXTS_KEY_PREFIX_DIRS
+                     if key.startswith(prefix) and key[len(prefix):].isdigit()), None)
+        if base is None and key == "mainText" and value.endswith(".html"):
+            base = FRAGMENTS_DIR
+    if base == FRAGMENTS_DIR and not value.endswith(".html"):
+        return None
+    return base
+
+
+def _local_target(value: str) -> Optional[str]:
+    """Percorso locale normalizzato di un riferimento (None per URL esterni, ancore, data URI)."""
+    value = value.strip().split("#", 1)[0].split("?", 1)[0]
+    if not value or value.startswith(("data:", "mailto:", "tel:", "javascript:", "//")) or "://" in value:
+        return None
+    if value.startswith("/"):
+        return web_path(value.lstrip("/"))
+    return web_path(value)
+
+
+def extract_references(source: str) -> List[Tuple[str, str]]:
+    """Riferimenti (target, posizione) contenuti in un file sorgente."""
+    refs = []
+    with open(source, 'r', encoding='utf-8', errors='replace') as f:
+        content = f.read()
+
+    if os.path.basename(source) == TEXTS_JSON_FILENAME:
+        try:
+            texts = json.loads(content)
+        except json.JSONDecodeError as e:
+            print(f"ATTENZIONE: {source} non è un JSON valido: {e}")
+            return refs
+        for page_id, page_data in texts.items():
+            if not isinstance(page_data, dict):
+                continue
+            for key, value in page_data.items():
+                if not isinstance(value, str) or not value:
+                    continue
+                base = texts_key_base(key, value)
+                if base is not None:
+                    refs.append((web_path(os.path.join(base, value)), f"{page_id}.{key}"))
+        return refs
+
+    if os.path.basename(source) in IMAGE_LIST_FILES:
+        for line_number, line in enumerate(content.splitlines(), 1):
+            parts = [p.strip() for p in line.split("|")]
+            if line.strip().startswith("#") or len(parts) != 3 or not parts[2]:
+                continue
+            refs.append((web_path(os.path.join(IMAGE_LIST_BASE_DIR, parts[2])), f"riga {line_number}"))
+        return refs
+
+    # I frammenti vengono iniettati nelle pagine alla radice: i percorsi sono relativi alla radice
+    if source.endswith(".html"):
+        values = [(m.group(1), m.start()) for m in HTML_REF_REGEX.finditer(content)]
+        for m in SRCSET_REGEX.finditer(content):
+            values += [(candidate.split()[0], m.start()) for candidate in m.group(1).split(",") if candidate.strip()]
+        values += [(m.group(1), m.start()) for m in CSS_URL_REGEX.finditer(content)]
+    elif source.endswith(".css"):
+        values = [(m.group(1), m.start()) for m in CSS_URL_REGEX.finditer(content)]
+    else:
+        # I commenti vengono svuotati senza togliere gli a capo: i numeri di riga restano validi
+        content = SCRIPT_COMMENT_LINE_REGEX.sub("", content)
+        values = [(m.group(1), m.start()) for m in SCRIPT_PATH_REGEX.finditer(content)]
+
+    for value, offset in values:
+        target = _local_target(value)
+        if target:
+            refs.append((target, f"riga {content.count(chr(10), 0, offset) + 1}"))
+    return refs
+
+
+def reference_sources() -> List[str]:
+    """File che possono contenere riferimenti agli asset."""
+    sources = []
+    if os.path.isdir(TRANSLATIONS_DIR):
+        for lang in sorted(os.listdir(TRANSLATIONS_DIR)):
+            texts_path = os.path.join(TRANSLATIONS_DIR, lang, TEXTS_JSON_FILENAME)
+            if os.path.isfile(texts_path):
+                sources.append(texts_path)
+    sources += sorted(f for f in os.listdir(".") if f.endswith(".html"))
+    if os.path.isdir(FRAGMENTS_DIR):
+        sources += sorted(os.path.join(FRAGMENTS_DIR, f) for f in os.listdir(FRAGMENTS_DIR) if f.endswith(".html"))
+    sources += [f for f in SCRIPT_FILES + IMAGE_LIST_FILES if os.path.isfile(f)]
+    return [web_path(s) for s in sources]
+
+
+def asset_files() -> Dict[str, Tuple[int, int]]:
+    """File catalogati -> (dimensione, mtime_ns)."""
+    paths = []
+    for root in ASSET_ROOTS:
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+            paths += [os.path.join(dirpath, f) for f in filenames if not f.startswith(".")]
+    paths += [f for f in os.listdir(".") if os.path.isfile(f) and not f.startswith(".")
+              and _asset_kind(f) != "other"]
+
+    files = {}
+    for path in paths:
+        st = os.stat(path)
+        files[web_path(path)] = (st.st_size, st.st_mtime_ns)
+    return files
+
+
+class AssetCatalog:
+    """Catalogo degli asset su SQLite. Uso: with AssetCatalog() as catalog: catalog.scan()"""
+
+    def __init__(self, path: str = CATALOG_FILE):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.row_factory = sqlite3.Row
+        self.db.executescript(SCHEMA)
+        if self.db.execute("PRAGMA user_version").fetchone()[0] != CATALOG_VERSION:
+            with self.db:
+                self.db.executescript("DELETE FROM assets; DELETE FROM refs; DELETE FROM ref_sources;")
+                self.db.execute(f"PRAGMA user_version = {CATALOG_VERSION}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.db.close()
+
+    # --- Scansione ---
+
+    def scan(self, workers: int = HASH_WORKERS) -> Dict[str, int]:
+        """
+        Aggiorna il catalogo. Solo i file nuovi o con dimensione/mtime cambiati
+        vengono letti e hashati; i record dei file spariti vengono eliminati.
+        """
+        known = {row["path"]: (row["size"], row["mtime_ns"])
+                 for row in self.db.execute("SELECT path, size, mtime_ns FROM assets")}
+        on_disk = asset_files()
+
+        changed = [(path, size, mtime) for path, (size, mtime) in on_disk.items() if known.get(path) != (size, mtime)]
+        removed = [path for path in known if path not in on_disk]
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            rows = list(executor.map(lambda job: describe_asset(*job), changed))
+
+        with self.db:
+            self.db.executemany("DELETE FROM assets WHERE path = ?", [(p,) for p in removed])
+            self.db.executemany("INSERT OR REPLACE INTO assets VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        refreshed_sources = self._scan_references()
+
+        return {"assets": len(on_disk), "hashed": len(changed), "removed": len(removed),
+                "ref_sources": refreshed_sources}
+
+    def _scan_references(self) -> int:
+        """Rilegge solo le sorgenti dei riferimenti modificate. Restituisce quante."""
+        known = {row["path"]: (row["size"], row["mtime_ns"])
+                 for row in self.db.execute("SELECT path, size, mtime_ns FROM ref_sources")}
+        current = {}
+        for source in reference_sources():
+            st = os.stat(source)
+            current[source] = (st.st_size, st.st_mtime_ns)
+
+        refreshed = 0
+        with self.db:
+            for source in known.keys() - current.keys():
+                self.db.execute("DELETE FROM refs WHERE source = ?", (source,))
+                self.db.execute("DELETE FROM ref_sources WHERE path = ?", (source,))
+            for source, (size, mtime) in current.items():
+                if known.get(source) == (size, mtime):
+                    continue
+                self.db.execute("DELETE FROM refs WHERE source = ?", (source,))
+                self.db.executemany("INSERT INTO refs VALUES (?, ?, ?)",
+                                    [(target, source, location) for target, location in extract_references(source)])
+                self.db.execute("INSERT OR REPLACE INTO ref_sources VALUES (?, ?, ?)", (source, size, mtime))
+                refreshed += 1
+        return refreshed
+
+    # --- Interrogazioni ---
+
+    def asset(self, path: str) -> Optional[Dict[str, Any]]:
+        row = self.db.execute("SELECT * FROM assets WHERE path = ?", (web_path(path),)).fetchone()
+        return dict(row) if row else None
+
+    def assets(self, kind: Optional[str] = None) -> List[Dict[str, Any]]:
+        if kind:
+            rows = self.db.execute("SELECT * FROM assets WHERE kind = ? ORDER BY path", (kind,))
+        else:
+            rows = self.db.execute("SELECT * FROM assets ORDER BY path")
+        return [dict(row) for row in rows]
+
+    def find_by_hash(self, sha256: str) -> List[str]:
+        return [row["path"] for row in self.db.execute("SELECT path FROM assets WHERE sha256 = ? ORDER BY path", (sha256,))]
+
+    def references_to(self, path: str) -> List[Tuple[str, str]]:
+        """Chi referenzia l'asset: lista di (file sorgente, posizione/chiave)."""
+        return [(row["source"], row["location"]) for row in self.db.execute(
+            "SELECT source, location FROM refs WHERE target = ? ORDER BY source, location", (web_path(path),))]
+
+    def references_from(self, source: str) -> List[Tuple[str, str]]:
+        """Cosa referenzia un file sorgente: lista di (target, posizione/chiave)."""
+        return [(row["target"], row["location"]) for row in self.db.execute(
+            "SELECT target, location FROM refs WHERE source = ? ORDER BY target", (web_path(source),))]
+
+    def unreferenced(self) -> List[str]:
+        """Asset che nessuna sorgente nomina direttamente."""
+        return [row["path"] for row in self.db.execute(
+            "SELECT path FROM assets WHERE path NOT IN (SELECT target FROM refs) ORDER BY path")]
+
+    def missing_targets(self) -> List[Tuple[str, str, str]]:
+        """Riferimenti ad asset di Assets/ o public/ che non esistono."""
+        roots = tuple(f"{root}/" for root in ASSET_ROOTS)
+        return [(row["target"], row["source"], row["location"]) for row in self.db.execute(
+            "SELECT target, source, location FROM refs WHERE target NOT IN (SELECT path FROM assets) "
+            "ORDER BY target")
+            if row["target"].startswith(roots)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Aggiorna e interroga il catalogo degli asset.")
+    parser.add_argument("--workers", type=int, default=HASH_WORKERS, help="Thread per l'hashing.")
+    parser.add_argument("--refs", metavar="PERCORSO", help="Mostra chi referenzia l'asset indicato.")
+    parser.add_argument("--unreferenced", action="store_true", help="Elenca gli asset non referenziati.")
+    parser.add_argument("--missing", action="store_true", help="Elenca i riferimenti ad asset inesistenti.")
+    args = parser.parse_args()
+
+    with AssetCatalog() as catalog:
+        started = time.perf_counter()
+        stats = catalog.scan(args.workers)
+        elapsed = time.perf_counter() - started
+        print(f"Catalogo aggiornato in {elapsed:.2f}s: {stats['assets']} asset, {stats['hashed']} letti/hashati, "
+              f"{stats['removed']} rimossi, {stats['ref_sources']} sorgenti di riferimenti rilette.")
+
+        if args.refs:
+            info = catalog.asset(args.refs)
+            if not info:
+                print(f"AVVISO: '{args.refs}' non è nel catalogo.")
+            else:
+                print(f"{info['path']}: {info['size']} byte, sha256 {info['sha256'][:16]}..., "
+                      f"{info['width'] or '-'}x{info['height'] or '-'}")
+            for source, location in catalog.references_to(args.refs):
+                print(f"  <- {source} ({location})")
+        if args.unreferenced:
+            for path in catalog.unreferenced():
+                print(f"  non referenziato: {path}")
+        if args.missing:
+            for target, source, location in catalog.missing_targets():
+                print(f"  mancante: {target} <- {source} ({location})")
+    sys.exit(0)
@@ -0,0 +1,154 @@
+import os
+import re
+import sys
+import time
+import shutil
+import argparse
+from collections import defaultdict
+from typing import Dict, List, Set, Tuple
+
+from asset_catalog import AssetCatalog, web_path, TRANSLATIONS_DIR, TEXTS_JSON_FILENAME
+
+# =================================================================
+# GARBAGE COLLECTOR DEGLI ASSET NON RAGGIUNGIBILI
+# =================================================================
+# Nessuno strumento diceva quali file di Assets/ e public/ (o quali frammenti
+# *_maintextN.html rimasti nella radice) siano ancora usati: il sito da
+# pubblicare continua a crescere. Qui si parte dalle radici vive:
+#   - le pagine <pagina>-<lingua>.html;
+#   - main.js;
+#   - ogni texts.json (mainTextN, imageSourceN, headImage, audioSource...);
+# e si segue il grafo dei riferimenti del catalogo (asset_catalog.py, che lo
+# aggiorna in modo incrementale rileggendo solo i file modificati): le pagine
+# portano a CSS, script, bandiere e ad altre pagine, i texts.json a immagini,
+# audio e frammenti. Tutto ciò che non viene raggiunto è un candidato alla
+# rimozione: di default solo elenco e dimensioni, con --quarantine i file
+# vengono spostati (non cancellati) in .quarantine/<data_ora>/.
+
+# Script sempre vivi (caricati dalle pagine ma anche elencati per sicurezza)
+ROOT_SCRIPTS = ("main.js",)
+# Frammenti HTML lasciati nella radice dalle vecchie versioni della pipeline
+ROOT_FRAGMENT_REGEX = re.compile(r'_maintext\d*\.html$', re.IGNORECASE)
+# File e cartelle mai raccolti: segnaposto git e output rigenerati da altre fasi
+KEEP_FILENAMES = {"gitkeep", ".gitkeep"}
+KEEP_PREFIXES = ("Assets/derivatives/",)
+QUARANTINE_DIR = ".quarantine"
+
+
+def live_pages() -> List[str]:
+    """Pagine <pagina>-<lingua>.html nella radice, per le lingue con un texts.json."""
+    languages = sorted(
+        lang for lang in os.listdir(TRANSLATIONS_DIR)
+        if os.path.isfile(os.path.join(TRANSLATIONS_DIR, lang, TEXTS_JSON_FILENAME))
+    ) if os.path.isdir(TRANSLATIONS_DIR) else []
+    pattern = re.compile(rf'^[\w.]+-(?:{"|".join(map(re.escape, languages))})\.html$') if languages else None
+    return sorted(f for f in os.listdir(".") if pattern and pattern.match(f))
+
+
+def reachability_roots() -> List[str]:
+    roots = live_pages() + [f for f in ROOT_SCRIPTS if os.path.isfile(f)]
+    if os.path.isdir(TRANSLATIONS_DIR):
+        for lang in sorted(os.listdir(TRANSLATIONS_DIR)):
+            texts_path = os.path.join(TRANSLATIONS_DIR, lang, TEXTS_JSON_FILENAME)
+            if os.path.isfile(texts_path):
+                roots.append(texts_path)
+    return [web_path(r) for r in roots]
+
+
+def reachable_files(catalog: AssetCatalog, roots: List[str]) -> Set[str]:
+    """Visita in ampiezza del grafo dei riferimenti a partire dalle radici."""
+    edges: Dict[str, Set[str]] = defaultdict(set)
+    for row in catalog.db.execute("SELECT source, target FROM refs"):
+        edges[row["source"]].add(row["target"])
+
+    reached = set(roots)
+    frontier = list(roots)
+    while frontier:
+        next_frontier = []
+        for source in frontier:
+            for target in edges.get(source, ()):
+                if target not in reached:
+                    reached.add(target)
+                    next_frontier.append(target)
+        frontier = next_frontier
+    return reached
+
+
+def collection_candidates(catalog: AssetCatalog) -> Dict[str, int]:
+    """File che il collector può rimuovere -> dimensione in byte."""
+    candidates = {asset["path"]: asset["size"] for asset in catalog.assets()}
+    for filename in os.listdir("."):
+        if ROOT_FRAGMENT_REGEX.search(filename) and os.path.isfile(filename):
+            candidates[web_path(filename)] = os.path.getsize(filename)
+    return {path: size for path, size in candidates.items()
+            if os.path.basename(path) not in KEEP_FILENAMES and not path.startswith(KEEP_PREFIXES)}
+
+
+def quarantine(paths: List[str]) -> str:
+    """Sposta i file in .quarantine/<data_ora>/ mantenendo i percorsi relativi."""
+    destination_root = os.path.join(QUARANTINE_DIR, time.strftime("%Y%m%d_%H%M%S"))
+    for path in paths:
+        destination = os.path.join(destination_root, path)
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        shutil.move(path, destination)
+    return destination_root
+
+
+def _group(path: str) -> str:
+    """Cartella per il riepilogo (es. Assets/Audio, public/images, radice)."""
+    parts = path.split("/")
+    return "/".join(parts[:2]) if len(parts) > 2 else (parts[0] if len(parts) == 2 else "(radice)")
+
+
+def collect(apply_quarantine: bool = False, verbose: bool = False) -> bool:
+    with AssetCatalog() as catalog:
+        started = time.perf_counter()
+        stats = catalog.scan()
+        roots = reachability_roots()
+        if not roots:
+            print("ERRORE: Nessuna radice trovata (pagine <pagina>-<lingua>.html, main.js, texts.json).")
+            return False
+        reached = reachable_files(catalog, roots)
+        candidates = collection_candidates(catalog)
+        elapsed = time.perf_counter() - started
+
+    dead = sorted(path for path in candidates if path not in reached)
+    by_group: Dict[str, Tuple[int, int]] = {}
+    for path in dead:
+        count, size = by_group.get(_group(path), (0, 0))
+        by_group[_group(path)] = (count + 1, size + candidates[path])
+
+    print(f"Grafo aggiornato ({stats['ref_sources']} sorgenti rilette) e visitato in {elapsed:.2f}s: "
+          f"{len(roots)} radici, {len(reached)} file raggiungibili.")
+    if verbose:
+        for path in dead:
+            print(f"  non raggiungibile: {path} ({candidates[path] / 1024:.0f} KB)")
+
+    total = sum(candidates[path] for path in dead)
+    live_total = sum(size for path, size in candidates.items() if path in reached)
+    print("\n==================================================================")
+    print(f"{'cartella':<24}{'file':>6}{'dimensione':>14}")
+    for group, (count, size) in sorted(by_group.items()):
+        print(f"{group:<24}{count:>6}{size / 1024 / 1024:>11.2f} MB")
+    print(f"{'TOTALE':<24}{len(dead):>6}{total / 1024 / 1024:>11.2f} MB "
+          f"(restano {live_total / 1024 / 1024:.2f} MB raggiungibili)")
+
+    if apply_quarantine and dead:
+        destination = quarantine(dead)
+        print(f"✅ {len(dead)} file spostati in {destination} (per ripristinarli basta spostarli indietro).")
+    elif dead:
+        print("PROVA: nessun file spostato. Usare --quarantine per spostarli, --list per l'elenco completo.")
+    else:
+        print("✅ Tutti gli asset sono raggiungibili.")
+    print("==================================================================")
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Trova (e mette in quarantena) gli asset non più raggiungibili.")
+    parser.add_argument("--quarantine", action="store_true",
+                        help=f"Sposta i file non raggiungibili in {QUARANTINE_DIR}/<data_ora>/.")
+    parser.add_argument("--list", action="store_true", help="Elenca ogni file non raggiungibile.")
+    args = parser.parse_args()
+
+    sys.exit(0 if collect(args.quarantine, args.list) else 1)
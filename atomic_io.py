@@ -0,0 +1,254 @@
+import os
+import json
+import time
+import socket
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+# =================================================================
+# SCRITTURE ATOMICHE E LOCK CONSULTIVI (TEXTS.JSON E ALTRI FILE CONDIVISI)
+# =================================================================
+# Gli script aprivano texts.json con 'w' e ci scrivevano direttamente: un
+# crash (o un secondo passo .bat in esecuzione nello stesso momento) lasciava
+# un file troncato e tutto il sito smetteva di caricarsi. Qui:
+#   - atomic_write_text/atomic_write_json scrivono in un file temporaneo
+#     nella stessa cartella, fanno fsync e lo sostituiscono con os.replace:
+#     chi legge vede sempre il file vecchio o quello nuovo, mai una metà;
+#   - file_lock(percorso) crea "<percorso>.lock" in modo esclusivo (O_EXCL,
+#     funziona anche su Windows) e aspetta al massimo LOCK_TIMEOUT secondi.
+#     Va tenuto per tutto il ciclo lettura -> modifica -> scrittura, così due
+#     fasi che aggiornano lo stesso file non si cancellano le modifiche.
+# I lock escludono anche i thread dello stesso processo e sono rientranti per
+# il thread che li detiene. Il file contiene host e pid del proprietario: un
+# lock di un processo terminato viene rimosso; quelli creati da un'altra
+# macchina solo se non vengono rinnovati da più di STALE_LOCK_SECONDS.
+
+LOCK_SUFFIX = ".lock"
+# Attesa massima per ottenere un lock (secondi)
+LOCK_TIMEOUT = 30.0
+# Intervallo tra due tentativi
+LOCK_POLL_INTERVAL = 0.05
+# Un lock di un'altra macchina non rinnovato da così tanto è abbandonato
+STALE_LOCK_SECONDS = 300.0
+# Ogni quanto chi detiene un lock ne aggiorna l'mtime
+LOCK_REFRESH_INTERVAL = STALE_LOCK_SECONDS / 5
+# Windows: OpenProcess / GetExitCodeProcess
+PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+STILL_ACTIVE = 259
+
+# Lock tenuti dal processo (percorso -> profondità) e lock tra thread per percorso
+_held_locks: Dict[str, int] = {}
+_thread_locks: Dict[str, threading.RLock] = {}
+_held_locks_guard = threading.Lock()
+
+
+def _reset_after_fork():
+    # Un processo figlio (fork) non possiede i lock del padre
+    global _held_locks_guard
+    _held_locks.clear()
+    _thread_locks.clear()
+    _held_locks_guard = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+class LockTimeout(TimeoutError):
+    """Il lock non è stato ottenuto entro il tempo massimo."""
+
+
+def _fsync_directory(directory: str):
+    # Rende persistente anche la rinomina (non supportato su Windows: si ignora)
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def atomic_write_bytes(path: str, data: bytes):
+    """Scrive il file in modo atomico: temporaneo + fsync + os.replace."""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        if os.path.exists(path):
+            # mkstemp crea il file con permessi 0600: si mantengono quelli dell'originale
+            os.chmod(temp_path, os.stat(path).st_mode & 0o777)
+        else:
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(temp_path, 0o666 & ~umask)
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+    _fsync_directory(directory)
+
+
+def atomic_write_text(path: str, text: str, encoding: str = 'utf-8'):
+    atomic_write_bytes(path, text.encode(encoding))
+
+
+def atomic_write_json(path: str, data: Any, indent: int = 4, **dump_options):
+    """Come json.dump(data, f, ensure_ascii=False, indent=4), ma atomico."""
+    dump_options.setdefault("ensure_ascii", False)
+    atomic_write_text(path, json.dumps(data, indent=indent, **dump_options))
+
+
+def _process_alive(pid: int) -> bool:
+    """True se il processo esiste ancora su questa macchina."""
+    if os.name == "nt":
+        # Su Windows os.kill(pid, 0) invierebbe CTRL_C_EVENT: si interroga il processo
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(PROCESS_QUERY_LIMITED_INFORMATION, False, pid)
+        if not handle:
+            return False
+        try:
+            exit_code = ctypes.c_ulong()
+            return bool(kernel32.GetExitCodeProcess(handle, ctypes.byref(exit_code))) and exit_code.value == STILL_ACTIVE
+        finally:
+            kernel32.CloseHandle(handle)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # esiste, ma appartiene a un altro utente
+    return True
+
+
+def _lock_is_stale(lock_path: str, stale_after: float) -> Optional[os.stat_result]:
+    """
+    Lo stat del lock se è abbandonato, altrimenti None. Un lock di questa
+    macchina è abbandonato solo se il processo che lo ha creato non esiste
+    più; per un'altra macchina (cartella condivisa) conta l'età, che chi
+    detiene il lock rinnova ogni LOCK_REFRESH_INTERVAL secondi.
+    """
+    try:
+        st = os.stat(lock_path)
+        with open(lock_path, 'r', encoding='utf-8') as f:
+            owner = f.read().split()
+    except OSError:
+        return None  # appena rilasciato: si riprova subito
+    if len(owner) == 2 and owner[0] == socket.gethostname() and owner[1].startswith("pid="):
+        try:
+            return None if _process_alive(int(owner[1][4:])) else st
+        except ValueError:
+            pass
+    elif not owner and time.time() - st.st_mtime < LOCK_POLL_INTERVAL * 20:
+        return None  # appena creato, il proprietario non l'ha ancora scritto
+    return st if time.time() - st.st_mtime > stale_after else None
+
+
+def _break_stale_lock(lock_path: str, stale: os.stat_result):
+    """
+    Rimuove il lock abbandonato. Lo si rinomina prima con un nome unico e si
+    controlla che sia proprio quello giudicato abbandonato: se nel frattempo
+    un altro processo lo ha rimosso e ne ha creato uno nuovo, quello nuovo
+    viene rimesso al suo posto.
+    """
+    broken_path = f"{lock_path}.{socket.gethostname()}.{os.getpid()}.{threading.get_ident()}.stale"
+    try:
+        os.rename(lock_path, broken_path)
+    except OSError:
+        return  # già rimosso da un altro processo
+    broken = os.stat(broken_path)
+    if (broken.st_ino, broken.st_mtime_ns) != (stale.st_ino, stale.st_mtime_ns):
+        try:
+            os.link(broken_path, lock_path)  # non sovrascrive un lock creato nel frattempo
+        except OSError:
+            pass
+        os.remove(broken_path)
+        return
+    print(f"ATTENZIONE: Lock abbandonato rimosso: {lock_path}")
+    os.remove(broken_path)
+
+
+def _refresh_lock(lock_path: str, released: threading.Event):
+    # Aggiorna l'mtime finché il lock è tenuto: un lock lungo (sync_config) non sembra abbandonato
+    while not released.wait(LOCK_REFRESH_INTERVAL):
+        try:
+            os.utime(lock_path)
+        except OSError:
+            return
+
+
+def _thread_lock(lock_path: str) -> threading.RLock:
+    with _held_locks_guard:
+        return _thread_locks.setdefault(lock_path, threading.RLock())
+
+
+@contextmanager
+def file_lock(path: str, timeout: float = LOCK_TIMEOUT, stale_after: float = STALE_LOCK_SECONDS):
+    """
+    Lock consultivo su 'path' tramite il file "<path>.lock".
+    Esclusivo anche tra i thread dello stesso processo e rientrante per il
+    thread che lo detiene. Solleva LockTimeout se non si ottiene entro
+    'timeout' secondi.
+    """
+    lock_path = os.path.abspath(path) + LOCK_SUFFIX
+    deadline = time.monotonic() + timeout
+    thread_lock = _thread_lock(lock_path)
+    if not thread_lock.acquire(timeout=max(0.0, timeout)):
+        raise LockTimeout(f"Lock non ottenuto entro {timeout:g}s: {lock_path}")
+    try:
+        # Sotto il lock del thread il contatore è toccato solo dal thread che lo detiene
+        if _held_locks.get(lock_path):
+            _held_locks[lock_path] += 1
+            try:
+                yield lock_path
+            finally:
+                _held_locks[lock_path] -= 1
+            return
+
+        os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+        while True:
+            try:
+                fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                stale = _lock_is_stale(lock_path, stale_after)
+                if stale is not None:
+                    _break_stale_lock(lock_path, stale)
+                    continue
+                if time.monotonic() >= deadline:
+                    raise LockTimeout(f"Lock non ottenuto entro {timeout:g}s: {lock_path}")
+                time.sleep(LOCK_POLL_INTERVAL)
+                continue
+            with os.fdopen(fd, 'w') as f:
+                # Chi detiene il lock: serve a riconoscere i lock abbandonati
+                f.write(f"{socket.gethostname()} pid={os.getpid()}\n")
+            break
+
+        _held_locks[lock_path] = 1
+        released = threading.Event()
+        refresher = threading.Thread(target=_refresh_lock, args=(lock_path, released), daemon=True)
+        refresher.start()
+        try:
+            yield lock_path
+        finally:
+            released.set()
+            refresher.join()
+            del _held_locks[lock_path]
+            try:
+                os.remove(lock_path)
+            except OSError:
+                pass
+    finally:
+        thread_lock.release()
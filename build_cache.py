@@ -0,0 +1,217 @@
+import os
+import sys
+import json
+import hashlib
+from typing import Dict, Any, List, Optional, Set
+
+from atomic_io import atomic_write_json, file_lock
+
+# =================================================================
+# CACHE DI BUILD INCREMENTALE (DOCX -> FRAMMENTI / CONFIG / IMMAGINI)
+# =================================================================
+# Il manifest ricorda, per ogni sorgente e per ogni fase della pipeline,
+# l'hash del contenuto, la versione dello strumento e i file prodotti.
+# Se la sorgente è identica byte per byte e gli output esistono ancora,
+# la fase viene saltata del tutto.
+
+# Incrementare quando cambia la logica di conversione/split: invalida tutta la cache.
+TOOL_VERSION = "4"
+
+# Percorso del manifest (nella stessa cartella dei frammenti generati)
+MANIFEST_FILE = os.path.join("text_files", ".build_manifest.json")
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def hash_file(path: str) -> str:
+    """Calcola lo SHA-256 del contenuto di un file (lettura a blocchi)."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_text(text: str) -> str:
+    """SHA-256 di una stringa (per sorgenti già caricate in memoria)."""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class BuildManifest:
+    """
+    Manifest persistente delle build. Le voci sono indicizzate da
+    "<fase>:<chiave sorgente>" e contengono:
+      - hash / tool_version: identità del contenuto sorgente;
+      - size / mtime_ns: per evitare di ricalcolare l'hash se il file non è cambiato;
+      - outputs: {"fragments": [...], "page_config": "...", "images": [...], ...}
+    """
+
+    def __init__(self, path: str = MANIFEST_FILE, tool_version: str = TOOL_VERSION):
+        self.path = path
+        self.tool_version = tool_version
+        self.entries: Dict[str, Dict[str, Any]] = self._load()
+        # Voci registrate o rimosse da questa istanza dall'ultimo salvataggio
+        self._recorded: Set[str] = set()
+        self._forgotten: Set[str] = set()
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f).get("entries", {})
+        except (json.JSONDecodeError, OSError) as e:
+            print(f"ATTENZIONE: Manifest di build illeggibile ({e}). Ricostruzione completa.")
+            return {}
+
+    def save(self):
+        """
+        Salva il manifest solo se è stato modificato. Più fasi possono girare in
+        parallelo sullo stesso manifest: sotto lock il file viene riletto e vi
+        si applicano solo le voci registrate o rimosse da questa istanza.
+        """
+        if not self._recorded and not self._forgotten:
+            return
+        with file_lock(self.path):
+            entries = self._load()
+            for key in self._forgotten:
+                entries.pop(key, None)
+            for key in self._recorded:
+                entries[key] = self.entries[key]
+            atomic_write_json(self.path, {"entries": entries}, indent=2, sort_keys=True)
+        self.entries = entries
+        self._recorded.clear()
+        self._forgotten.clear()
+
+    @staticmethod
+    def _key(stage: str, source: str) -> str:
+        return f"{stage}:{source.replace(os.sep, '/')}"
+
+    def entry(self, stage: str, source: str) -> Optional[Dict[str, Any]]:
+        """Voce registrata per la sorgente nella fase indicata (None se assente)."""
+        return self.entries.get(self._key(stage, source))
+
+    def source_hash(self, stage: str, source: str) -> str:
+        """
+        Hash del file sorgente. Se dimensione e mtime coincidono con quelli
+        registrati, riusa l'hash salvato senza rileggere il file.
+        'source' può avere un qualificatore dopo '#' (es. "file.docx#pagina")
+        quando lo stesso file alimenta più voci.
+        """
+        source_path = _source_file(source)
+        st = os.stat(source_path)
+        entry = self.entry(stage, source)
+        if entry and entry.get("size") == st.st_size and entry.get("mtime_ns") == st.st_mtime_ns:
+            return entry["hash"]
+        return hash_file(source_path)
+
+    def is_up_to_date(self, stage: str, source: str, content_hash: str) -> bool:
+        """True se la sorgente è invariata, la versione coincide e tutti gli output esistono."""
+        entry = self.entries.get(self._key(stage, source))
+        if not entry:
+            return False
+        if entry.get("hash") != content_hash or entry.get("tool_version") != self.tool_version:
+            return False
+        return all(os.path.exists(p) for p in _output_paths(entry.get("outputs", {})))
+
+    def record(self, stage: str, source: str, content_hash: str, outputs: Dict[str, Any],
+               persistent: bool = True):
+        """
+        Registra gli output prodotti da una sorgente in una fase.
+        persistent=False indica una sorgente temporanea (cancellata dopo l'uso):
+        la sua assenza non viene segnalata come input eliminato.
+        """
+        entry = {
+            "hash": content_hash,
+            "tool_version": self.tool_version,
+            "outputs": outputs,
+        }
+        source_path = _source_file(source)
+        if not persistent:
+            entry["persistent"] = False
+        elif os.path.isfile(source_path):
+            st = os.stat(source_path)
+            entry["size"] = st.st_size
+            entry["mtime_ns"] = st.st_mtime_ns
+        key = self._key(stage, source)
+        self.entries[key] = entry
+        self._recorded.add(key)
+        self._forgotten.discard(key)
+
+    def orphaned(self, stage: Optional[str] = None) -> Dict[str, List[str]]:
+        """
+        Sorgenti registrate che non esistono più su disco, con i loro output
+        ancora presenti. Le sorgenti temporanee (persistent=False) sono escluse.
+        """
+        orphans = {}
+        live_outputs = set()
+        for key, entry in self.entries.items():
+            entry_stage, source = key.split(":", 1)
+            if entry.get("persistent") is False or os.path.exists(_source_file(source)):
+                live_outputs.update(_output_paths(entry.get("outputs", {})))
+            elif not stage or entry_stage == stage:
+                orphans[key] = entry
+
+        # Gli output condivisi con sorgenti ancora presenti (es. config.json) non sono residui
+        return {
+            key: [p for p in _output_paths(entry.get("outputs", {}))
+                  if p not in live_outputs and os.path.exists(p)]
+            for key, entry in orphans.items()
+        }
+
+    def forget(self, keys: List[str]):
+        """Rimuove dal manifest le voci indicate (es. dopo aver segnalato le sorgenti eliminate)."""
+        for key in keys:
+            if self.entries.pop(key, None) is not None:
+                self._forgotten.add(key)
+                self._recorded.discard(key)
+
+    def prune_stage(self, stage: str, live_sources) -> int:
+        """
+        Dimentica le voci della fase le cui sorgenti non sono in 'live_sources'
+        (le chiavi sorgente passate a record(), con l'eventuale '#...').
+        Restituisce quante voci sono state rimosse.
+        """
+        live_keys = {self._key(stage, source) for source in live_sources}
+        stale = [key for key in self.entries if key.startswith(f"{stage}:") and key not in live_keys]
+        self.forget(stale)
+        return len(stale)
+
+
+def _source_file(source: str) -> str:
+    """Percorso del file sorgente, senza l'eventuale qualificatore '#...'."""
+    return source.split("#", 1)[0]
+
+
+def _output_paths(outputs: Dict[str, Any]) -> List[str]:
+    """Appiattisce il dizionario degli output in una lista di percorsi di file."""
+    paths = []
+    for value in outputs.values():
+        if isinstance(value, str):
+            paths.append(value)
+        elif isinstance(value, list):
+            paths.extend(v for v in value if isinstance(v, str))
+    return paths
+
+
+def report_orphans(manifest: BuildManifest, stage: Optional[str] = None):
+    """Stampa le sorgenti eliminate e gli output che hanno lasciato sul disco."""
+    orphans = manifest.orphaned(stage)
+    if not orphans:
+        return
+    print(f"\nATTENZIONE: {len(orphans)} sorgenti registrate non esistono più:")
+    for key, outputs in sorted(orphans.items()):
+        print(f"  - {key}")
+        for path in outputs:
+            print(f"      output residuo: {path}")
+
+
+if __name__ == "__main__":
+    manifest = BuildManifest()
+    print(f"Manifest: {manifest.path} ({len(manifest.entries)} voci, tool_version={manifest.tool_version})")
+    report_orphans(manifest)
+    if "--prune" in sys.argv:
+        orphans = manifest.orphaned()
+        manifest.forget(list(orphans))
+        manifest.save()
+        print(f"Rimosse {len(orphans)} voci orfane dal manifest (i file di output NON sono stati cancellati).")
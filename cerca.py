@@ -1,44 +1,72 @@
-import json
 import os
-import sys
+import argparse
+
+from content_index import ContentIndex
+from translation_store import TRANSLATIONS_DIR, TEXTS_JSON_FILENAME
+
+# Interrogazioni sull'indice SQLite dei texts.json (content_index.py), aggiornato
+# automaticamente con i soli file modificati:
+#   python cerca.py carracci                    # blocco della pagina in tutte le lingue
+#   python cerca.py --chiave imageSource        # chiavi che iniziano così, in tutte le pagine
+#   python cerca.py pioggia --testo Bartolomeo  # valori che contengono il testo, pagine pioggia*
+#   python cerca.py --mancante audioSource      # pagine a cui manca la chiave
+
+# Lingue mostrate per un blocco, in quest'ordine
+LINGUE = ['en', 'es', 'fr', 'it']
+
+
+def stampa_blocco(index: ContentIndex, target: str, lingua: str = None):
+    blocchi = index.page(target, lingua)
+    indicizzate = index.languages()
+    for lang in ([lingua] if lingua else LINGUE + [l for l in indicizzate if l not in LINGUE]):
+        print(f"\n--- LINGUA: {lang.upper()} ---")
+        blocco = blocchi.get(lang)
+        if lang not in indicizzate:
+            print(f"File non trovato: {os.path.join(TRANSLATIONS_DIR, lang, TEXTS_JSON_FILENAME)}")
+        elif blocco is None:
+            print(f"Blocco '{target}' non trovato nel file.")
+        elif list(blocco) == [""]:
+            print(blocco[""])
+        else:
+            for chiave, valore in blocco.items():
+                print(f"{chiave:18}: {valore}")
+
+
+def stampa_ricerca(index: ContentIndex, testo: str, chiave: str, pagine: str, lingua: str, limite: int):
+    righe = index.search(f"%{testo}%" if testo else None, chiave, pagine, lingua, limite)
+    for riga in righe:
+        print(f"[{riga['lang']}] {riga['page_id']:18} {riga['key']:18}: {riga['value']}")
+    print(f"\n{len(righe)} risultati.")
+
+
+def stampa_mancanti(index: ContentIndex, chiave: str, lingua: str):
+    mancanti = index.missing_key(chiave, lingua)
+    for lang, page_id in mancanti:
+        print(f"[{lang}] {page_id}")
+    print(f"\n{len(mancanti)} blocchi senza la chiave '{chiave}'.")
+
 
 def cerca_nel_json():
-    # Se passato come argomento da CMD, usa quello, altrimenti chiedi input
-    target = sys.argv[1] if len(sys.argv) > 1 else input("Inserisci il blocco (es. carracci): ").strip()
-    
-    lingue = ['en', 'es', 'fr', 'it']
-    base_path = "data/translations"
-
-    for lingua in lingue:
-        file_path = os.path.join(base_path, lingua, "texts.json")
-        print(f"\n--- LINGUA: {lingua.upper()} ---")
-
-        if not os.path.exists(file_path):
-            print(f"File non trovato: {file_path}")
-            continue
-
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                
-                # Ricerca case-insensitive della chiave
-                # Creiamo un dizionario temporaneo con chiavi minuscole per il confronto
-                data_lower = {k.lower(): v for k, v in data.items()}
-                
-                if target.lower() in data_lower:
-                    blocco = data_lower[target.lower()]
-                    
-                    # Se il blocco è un oggetto (dizionario), lo stampiamo riga per riga
-                    if isinstance(blocco, dict):
-                        for chiave, valore in blocco.items():
-                            print(f"{chiave:18}: {valore}")
-                    else:
-                        print(blocco)
-                else:
-                    print(f"Blocco '{target}' non trovato nel file.")
-                    
-        except Exception as e:
-            print(f"Errore durante la lettura: {e}")
+    parser = argparse.ArgumentParser(description="Cerca nei texts.json di tutte le lingue.")
+    parser.add_argument("blocco", nargs="?",
+                        help="Pagina da mostrare (con --chiave/--testo: prefisso delle pagine in cui cercare).")
+    parser.add_argument("--chiave", help="Solo le chiavi che iniziano così (es. mainText).")
+    parser.add_argument("--testo", help="Valori che contengono il testo (maiuscole/minuscole indifferenti; %% e _ come in LIKE).")
+    parser.add_argument("--mancante", metavar="CHIAVE", help="Elenca i blocchi a cui manca la chiave.")
+    parser.add_argument("--lingua", help="Solo questa lingua.")
+    parser.add_argument("--limite", type=int, default=0, help="Numero massimo di risultati di --chiave/--testo.")
+    args = parser.parse_args()
+
+    with ContentIndex() as index:
+        if args.mancante:
+            stampa_mancanti(index, args.mancante, args.lingua)
+        elif args.chiave or args.testo:
+            stampa_ricerca(index, args.testo, args.chiave, args.blocco, args.lingua, args.limite)
+        else:
+            # Se passato come argomento da CMD, usa quello, altrimenti chiedi input
+            target = args.blocco or input("Inserisci il blocco (es. carracci): ").strip()
+            stampa_blocco(index, target, args.lingua)
+
 
 if __name__ == "__main__":
-    cerca_nel_json()
\ No newline at end of file
+    cerca_nel_json()
@@ -0,0 +1,223 @@
+import os
+import json
+import time
+import sqlite3
+import argparse
+from typing import Any, Dict, List, Optional, Tuple
+
+from translation_store import TRANSLATIONS_DIR, TEXTS_JSON_FILENAME
+
+# =================================================================
+# INDICE PERSISTENTE DEI CONTENUTI DEI TEXTS.JSON (SQLite)
+# =================================================================
+# cerca.py e vedi_chiave_json.py rileggevano tutti i texts.json a ogni
+# interrogazione. Qui ogni valore è una riga (lingua, pagina, chiave, valore)
+# di un file SQLite, con il file di provenienza:
+#   - sources: (dimensione, mtime) di ogni texts.json indicizzato; a ogni
+#     apertura si fa solo uno stat dei file e si reindicizzano quelli cambiati;
+#   - entries: i valori, con la posizione della chiave nella pagina (per
+#     stamparle nell'ordine del file). page() e i prefissi di pagina non
+#     distinguono maiuscole e minuscole; i valori non stringa sono salvati in JSON; un
+#     valore di primo livello che non è un blocco ha chiave "".
+# Interrogazioni: blocco di una pagina, una chiave in tutte le lingue o in
+# tutte le pagine, prefissi di pagina/chiave, LIKE sui valori e pagine a cui
+# manca una chiave (usate da cerca.py e vedi_chiave_json.py).
+
+CONTENT_INDEX_FILE = ".content_index.sqlite"
+# Cambiare la versione svuota l'indice (schema o formato dei valori modificati)
+CONTENT_INDEX_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sources (
+    path TEXT PRIMARY KEY,
+    lang TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS entries (
+    lang TEXT NOT NULL,
+    page_id TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    source TEXT NOT NULL,
+    PRIMARY KEY (lang, page_id, key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS entries_page ON entries (page_id COLLATE NOCASE, key);
+CREATE INDEX IF NOT EXISTS entries_key ON entries (key, page_id);
+CREATE INDEX IF NOT EXISTS entries_source ON entries (source);
+"""
+
+
+def _stored_value(value: Any) -> str:
+    return value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+
+
+def _prefix_range(prefix: str) -> Tuple[str, str]:
+    """Estremi [prefix, limite) per una ricerca per prefisso che usa l'indice."""
+    return prefix, prefix + "\U0010ffff"
+
+
+class ContentIndex:
+    """Indice dei texts.json su SQLite. Uso: with ContentIndex() as index: index.page("carracci")"""
+
+    def __init__(self, path: str = CONTENT_INDEX_FILE, base_dir: str = TRANSLATIONS_DIR, refresh: bool = True):
+        self.path = path
+        self.base_dir = base_dir
+        self.db = sqlite3.connect(path)
+        self.db.row_factory = sqlite3.Row
+        self.db.executescript(SCHEMA)
+        if self.db.execute("PRAGMA user_version").fetchone()[0] != CONTENT_INDEX_VERSION:
+            with self.db:
+                self.db.executescript("DELETE FROM entries; DELETE FROM sources;")
+                self.db.execute(f"PRAGMA user_version = {CONTENT_INDEX_VERSION}")
+        self.refreshed = self.refresh() if refresh else 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.db.close()
+
+    # --- Aggiornamento ---
+
+    def _texts_files(self) -> Dict[str, Tuple[str, int, int]]:
+        """texts.json presenti -> (lingua, dimensione, mtime_ns)."""
+        files = {}
+        if os.path.isdir(self.base_dir):
+            for lang in sorted(os.listdir(self.base_dir)):
+                path = os.path.join(self.base_dir, lang, TEXTS_JSON_FILENAME)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                files[os.path.normpath(path).replace(os.sep, "/")] = (lang, st.st_size, st.st_mtime_ns)
+        return files
+
+    def refresh(self, force: bool = False) -> int:
+        """Reindicizza i texts.json nuovi o modificati e dimentica quelli spariti. Restituisce quanti."""
+        known = {row["path"]: (row["size"], row["mtime_ns"])
+                 for row in self.db.execute("SELECT path, size, mtime_ns FROM sources")}
+        current = self._texts_files()
+        refreshed = 0
+        with self.db:
+            for path in known.keys() - current.keys():
+                self.db.execute("DELETE FROM entries WHERE source = ?", (path,))
+                self.db.execute("DELETE FROM sources WHERE path = ?", (path,))
+            for path, (lang, size, mtime) in current.items():
+                if not force and known.get(path) == (size, mtime):
+                    continue
+                try:
+                    with open(path, 'r', encoding='utf-8') as f:
+                        texts = json.load(f)
+                except (json.JSONDecodeError, OSError) as e:
+                    print(f"ERRORE: Impossibile leggere {path}: {e}")
+                    continue
+                rows = []
+                for page_id, page_data in texts.items():
+                    if isinstance(page_data, dict):
+                        rows += [(lang, page_id, key, _stored_value(value), position, path)
+                                 for position, (key, value) in enumerate(page_data.items())]
+                    else:
+                        rows.append((lang, page_id, "", _stored_value(page_data), 0, path))
+                self.db.execute("DELETE FROM entries WHERE source = ?", (path,))
+                self.db.executemany("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)", rows)
+                self.db.execute("INSERT OR REPLACE INTO sources VALUES (?, ?, ?, ?)", (path, lang, size, mtime))
+                refreshed += 1
+        return refreshed
+
+    # --- Interrogazioni ---
+
+    def languages(self) -> List[str]:
+        return [row["lang"] for row in self.db.execute("SELECT lang FROM sources ORDER BY lang")]
+
+    def page(self, page_id: str, lang: Optional[str] = None) -> Dict[str, Dict[str, str]]:
+        """Blocco della pagina (senza distinguere maiuscole/minuscole) per lingua, nell'ordine del file."""
+        query = "SELECT lang, key, value FROM entries WHERE page_id = ? COLLATE NOCASE"
+        params: List[Any] = [page_id]
+        if lang:
+            query += " AND lang = ?"
+            params.append(lang)
+        blocks: Dict[str, Dict[str, str]] = {}
+        for row in self.db.execute(query + " ORDER BY lang, position", params):
+            blocks.setdefault(row["lang"], {})[row["key"]] = row["value"]
+        return blocks
+
+    def value(self, page_id: str, key: str, lang: str) -> Optional[str]:
+        row = self.db.execute("SELECT value FROM entries WHERE lang = ? AND page_id = ? AND key = ?",
+                              (lang, page_id, key)).fetchone()
+        return row["value"] if row else None
+
+    def key_table(self, key: str, page_id: Optional[str] = None) -> Dict[str, Dict[str, Optional[str]]]:
+        """
+        Tabella pagina -> {lingua: valore} di una chiave, per tutte le pagine
+        (o una sola, con l'id esatto). None dove la pagina esiste ma la
+        chiave manca.
+        """
+        query = "SELECT DISTINCT lang, page_id FROM entries" + (" WHERE page_id = ?" if page_id else "")
+        table: Dict[str, Dict[str, Optional[str]]] = {}
+        for row in self.db.execute(query + " ORDER BY page_id, lang", [page_id] if page_id else []):
+            table.setdefault(row["page_id"], {})[row["lang"]] = None
+        query = "SELECT lang, page_id, value FROM entries WHERE key = ?" + (" AND page_id = ?" if page_id else "")
+        for row in self.db.execute(query, [key, page_id] if page_id else [key]):
+            table[row["page_id"]][row["lang"]] = row["value"]
+        return table
+
+    def search(self, value_like: Optional[str] = None, key_prefix: Optional[str] = None,
+               page_prefix: Optional[str] = None, lang: Optional[str] = None,
+               limit: int = 0) -> List[sqlite3.Row]:
+        """
+        Righe che soddisfano tutti i filtri indicati: LIKE sul valore (senza
+        distinguere maiuscole/minuscole), prefisso di chiave o di pagina, lingua.
+        """
+        clauses, params = [], []
+        if key_prefix:
+            clauses.append("key >= ? AND key < ?")
+            params += _prefix_range(key_prefix)
+        if page_prefix:
+            clauses.append("page_id >= ? COLLATE NOCASE AND page_id < ? COLLATE NOCASE")
+            params += _prefix_range(page_prefix)
+        if lang:
+            clauses.append("lang = ?")
+            params.append(lang)
+        if value_like:
+            clauses.append("value LIKE ?")
+            params.append(value_like)
+        query = "SELECT lang, page_id, key, value, source FROM entries"
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        query += " ORDER BY page_id, key, lang"
+        if limit:
+            query += f" LIMIT {int(limit)}"
+        return self.db.execute(query, params).fetchall()
+
+    def missing_key(self, key: str, lang: Optional[str] = None) -> List[Tuple[str, str]]:
+        """(lingua, pagina) dei blocchi di pagina a cui manca la chiave."""
+        # Una sola scansione nell'ordine della chiave primaria (lingua, pagina)
+        query = "SELECT lang, page_id FROM entries WHERE key != ''"
+        params: List[Any] = []
+        if lang:
+            query += " AND lang = ?"
+            params.append(lang)
+        query += " GROUP BY lang, page_id HAVING SUM(key = ?) = 0 ORDER BY page_id, lang"
+        return [(row["lang"], row["page_id"]) for row in self.db.execute(query, params + [key])]
+
+    def stats(self) -> Dict[str, int]:
+        row = self.db.execute("SELECT COUNT(*) AS entries, COUNT(DISTINCT page_id) AS pages FROM entries").fetchone()
+        return {"languages": len(self.languages()), "pages": row["pages"], "entries": row["entries"]}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Aggiorna l'indice SQLite dei texts.json.")
+    parser.add_argument("--ricostruisci", action="store_true", help="Reindicizza tutti i file, anche se invariati.")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    with ContentIndex(refresh=False) as index:
+        refreshed = index.refresh(force=args.ricostruisci)
+        stats = index.stats()
+    print(f"INDICE CONTENUTI: {refreshed} texts.json reindicizzati in {(time.perf_counter() - started) * 1000:.0f} ms; "
+          f"{stats['languages']} lingue, {stats['pages']} pagine, {stats['entries']} valori.")
@@ -0,0 +1,193 @@
+import os
+import re
+import sys
+import json
+import argparse
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+from asset_catalog import (AssetCatalog, web_path, texts_key_base, TEXTS_JSON_FILENAME,
+                           IMAGE_LIST_FILES, IMAGE_LIST_BASE_DIR)
+from atomic_io import atomic_write_bytes, atomic_write_json, atomic_write_text, file_lock
+
+# =================================================================
+# DEDUPLICAZIONE DEGLI ASSET IDENTICI (con riscrittura dei riferimenti)
+# =================================================================
+# La stessa foto esiste in più copie (es. panorama_bologna.jpg in public/images
+# e in ogni cartella di pagina di Assets/images): il browser la scarica una
+# volta per percorso, e ogni pagina ne paga una copia. Qui, usando l'hash del
+# catalogo (asset_catalog.py):
+#   - i file identici byte per byte vengono raggruppati;
+#   - per ogni gruppo si sceglie un percorso canonico;
+#   - ogni riferimento (texts.json, image_list, pagine HTML, frammenti,
+#     main.js, style.css) viene riscritto verso il canonico;
+#   - le copie vengono eliminate (solo con --apply; di default è una prova).
+# I valori dei texts.json sono relativi a una cartella (imageSourceN ->
+# Assets/images, headImage -> public/images): se il canonico è altrove si
+# scrive il percorso relativo (es. "../../public/images/x.jpg"), che il
+# browser normalizza nello stesso URL e quindi nella stessa voce di cache.
+
+# Solo questi tipi vengono deduplicati (i gitkeep vuoti, per esempio, no)
+DEDUP_KINDS = ("image", "audio")
+# Cartelle generate: i loro file si rigenerano, non si deduplicano
+EXCLUDED_PREFIXES = ("Assets/derivatives/",)
+# Cartelle preferite per la copia canonica (in ordine): le immagini condivise
+# stanno in public/images e Assets/images, non nelle cartelle di pagina
+PREFERRED_DIRS = ("public/images", "Assets/images", "Assets/Audio")
+
+
+def find_duplicate_groups(catalog: AssetCatalog) -> List[List[Dict]]:
+    """Gruppi di asset con lo stesso hash (almeno due file)."""
+    by_hash: Dict[str, List[Dict]] = defaultdict(list)
+    for asset in catalog.assets():
+        if asset["kind"] not in DEDUP_KINDS or not asset["size"] or asset["path"].startswith(EXCLUDED_PREFIXES):
+            continue
+        by_hash[asset["sha256"]].append(asset)
+    return [group for _, group in sorted(by_hash.items()) if len(group) > 1]
+
+
+def choose_canonical(group: List[Dict], catalog: AssetCatalog) -> str:
+    """
+    Copia canonica: la più referenziata; a parità, quella in una cartella
+    condivisa (PREFERRED_DIRS), poi la meno annidata, poi in ordine alfabetico.
+    """
+    def rank(asset):
+        path = asset["path"]
+        directory = os.path.dirname(path)
+        preferred = PREFERRED_DIRS.index(directory) if directory in PREFERRED_DIRS else len(PREFERRED_DIRS)
+        return (-len(catalog.references_to(path)), preferred, path.count("/"), path)
+
+    return min(group, key=rank)["path"]
+
+
+def _relative_value(canonical: str, base_dir: str) -> str:
+    """Valore da scrivere in una chiave relativa a base_dir per puntare al canonico."""
+    return os.path.relpath(canonical, base_dir).replace(os.sep, "/")
+
+
+def _rewrite_texts_json(source: str, replacements: Dict[str, str]) -> int:
+    with file_lock(source):
+        with open(source, 'r', encoding='utf-8') as f:
+            texts = json.load(f)
+        changed = 0
+        for page_data in texts.values():
+            if not isinstance(page_data, dict):
+                continue
+            for key, value in page_data.items():
+                base = texts_key_base(key, value) if isinstance(value, str) and value else None
+                target = web_path(os.path.join(base, value)) if base else None
+                if target in replacements:
+                    page_data[key] = _relative_value(replacements[target], base)
+                    changed += 1
+        if changed:
+            atomic_write_json(source, texts)
+    return changed
+
+
+def _rewrite_image_list(source: str, replacements: Dict[str, str]) -> int:
+    with open(source, 'r', encoding='utf-8') as f:
+        lines = f.read().split("\n")
+    changed = 0
+    for i, line in enumerate(lines):
+        parts = line.split("|")
+        if line.strip().startswith("#") or len(parts) != 3:
+            continue
+        target = web_path(os.path.join(IMAGE_LIST_BASE_DIR, parts[2].strip()))
+        if target in replacements:
+            parts[2] = _relative_value(replacements[target], IMAGE_LIST_BASE_DIR)
+            lines[i] = "|".join(parts)
+            changed += 1
+    if changed:
+        atomic_write_text(source, "\n".join(lines))
+    return changed
+
+
+def _rewrite_text_file(source: str, replacements: Dict[str, str]) -> int:
+    """Sostituisce i percorsi nei file HTML/JS/CSS, solo dove compaiono come valori interi."""
+    with open(source, 'rb') as f:
+        content = f.read().decode('utf-8')
+    changed = 0
+    for old, new in replacements.items():
+        # Delimitato da virgolette, parentesi o spazi, con l'eventuale '/' iniziale (assoluto dalla radice)
+        pattern = re.compile(r'(["\'(`\s=]/?)' + re.escape(old) + r'(?=["\')`\s?#,])')
+        content, count = pattern.subn(lambda m: m.group(1) + new, content)
+        changed += count
+    if changed:
+        atomic_write_bytes(source, content.encode('utf-8'))
+    return changed
+
+
+def rewrite_references(catalog: AssetCatalog, replacements: Dict[str, str], apply: bool) -> Dict[str, int]:
+    """Riscrive (o, in prova, conta) i riferimenti alle copie. Restituisce sorgente -> riferimenti."""
+    by_source: Dict[str, Dict[str, str]] = defaultdict(dict)
+    for duplicate, canonical in replacements.items():
+        for source, _ in catalog.references_to(duplicate):
+            by_source[source][duplicate] = canonical
+
+    rewritten = {}
+    for source, source_replacements in sorted(by_source.items()):
+        if not apply:
+            rewritten[source] = sum(1 for d in source_replacements
+                                    for ref_source, _ in catalog.references_to(d) if ref_source == source)
+            continue
+        name = os.path.basename(source)
+        if name == TEXTS_JSON_FILENAME:
+            rewritten[source] = _rewrite_texts_json(source, source_replacements)
+        elif name in IMAGE_LIST_FILES:
+            rewritten[source] = _rewrite_image_list(source, source_replacements)
+        else:
+            rewritten[source] = _rewrite_text_file(source, source_replacements)
+    return rewritten
+
+
+def dedup(apply: bool = False) -> bool:
+    with AssetCatalog() as catalog:
+        catalog.scan()
+        groups = find_duplicate_groups(catalog)
+        if not groups:
+            print("✅ Nessun asset duplicato.")
+            return True
+
+        replacements: Dict[str, str] = {}
+        removable: List[Tuple[str, int]] = []
+        print(f"Gruppi di file identici: {len(groups)}")
+        for group in groups:
+            canonical = choose_canonical(group, catalog)
+            print(f"\n  canonico: {canonical} ({group[0]['size'] / 1024:.0f} KB)")
+            for asset in group:
+                if asset["path"] == canonical:
+                    continue
+                refs = catalog.references_to(asset["path"])
+                print(f"    copia:  {asset['path']} ({len(refs)} riferimenti)")
+                replacements[asset["path"]] = canonical
+                removable.append((asset["path"], asset["size"]))
+
+        rewritten = rewrite_references(catalog, replacements, apply)
+        removed_bytes = sum(size for _, size in removable)
+
+        print("\n==================================================================")
+        verb = "Riscritti" if apply else "Da riscrivere"
+        print(f"{verb}: {sum(rewritten.values())} riferimenti in {len(rewritten)} file.")
+        for source, count in rewritten.items():
+            print(f"  - {source}: {count}")
+
+        if apply:
+            for path, _ in removable:
+                os.remove(path)
+            # Il catalogo riflette subito il nuovo stato (file eliminati, riferimenti riscritti)
+            catalog.scan()
+            print(f"✅ Eliminate {len(removable)} copie: {removed_bytes / 1024 / 1024:.2f} MB in meno nel sito.")
+        else:
+            print(f"PROVA: {len(removable)} copie eliminabili, {removed_bytes / 1024 / 1024:.2f} MB in meno nel sito. "
+                  f"Eseguire con --apply per applicare.")
+        print("==================================================================")
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Elimina gli asset duplicati riscrivendo i riferimenti.")
+    parser.add_argument("--apply", action="store_true",
+                        help="Riscrive i riferimenti ed elimina le copie (di default mostra solo il piano).")
+    args = parser.parse_args()
+
+    sys.exit(0 if dedup(args.apply) else 1)
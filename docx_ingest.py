@@ -0,0 +1,135 @@
+import os
+import sys
+from typing import List, Tuple
+
+from docx import Document
+
+from docx_to_html_base import DocxHtmlRenderer, UnsupportedDocxContent
+from post_process_html import split_document, save_results, OUTPUT_DIR
+from extract_images import save_images, web_settings_tag, DOCX_DIR, ASSETS_BASE_DIR
+from build_cache import BuildManifest
+
+# =================================================================
+# INGESTIONE DOCX IN UN SOLO PASSAGGIO
+# =================================================================
+# Sostituisce la catena convert_docx_to_html -> extract_images ->
+# LibreOffice + post_process_html, che apriva e analizzava lo stesso
+# pacchetto OOXML tre volte. Qui il DOCX viene aperto UNA volta e in un
+# solo giro sul corpo del documento si ottengono:
+#   - i frammenti HTML (mainTextN) divisi sui marker [SPLIT_BLOCK:...];
+#   - le immagini, associate ai nomi dei marker in ordine di documento;
+#   - il page_config_<lang>_<page_id>.json.
+
+# Nome della fase nel manifest di build (build_cache.py)
+BUILD_STAGE = "docx_ingest"
+
+
+def resolve_docx_path(docx_file: str) -> str:
+    """Accetta sia un percorso esistente sia un nome di file dentro DOCX_DIR."""
+    if os.path.exists(docx_file):
+        return docx_file
+    return os.path.join(DOCX_DIR, docx_file)
+
+
+def ingest_docx(page_id: str, lang: str, docx_path: str,
+                force: bool = False) -> Tuple[bool, int, int]:
+    """
+    Esegue l'ingestione completa di un DOCX.
+    Restituisce (successo, marker trovati, immagini salvate).
+    """
+    page_id = page_id.lower()
+    lang = lang.lower()
+
+    if not os.path.exists(docx_path):
+        print(f"ERRORE: File DOCX non trovato: {docx_path}", file=sys.stderr)
+        return False, 0, 0
+
+    # Cache di build: la chiave include lingua e pagina, che determinano i nomi degli output,
+    # e le impostazioni di estrazione delle immagini (extract_images.WEB_*)
+    manifest = BuildManifest()
+    cache_key = f"{docx_path}#{lang}_{page_id}@{web_settings_tag()}"
+    content_hash = manifest.source_hash(BUILD_STAGE, cache_key)
+    if not force and manifest.is_up_to_date(BUILD_STAGE, cache_key, content_hash):
+        cached = manifest.entry(BUILD_STAGE, cache_key)["outputs"]
+        print(f"DOCX invariato: {len(cached['fragments'])} frammenti e "
+              f"{len(cached['images'])} immagini già aggiornati.")
+        return True, cached["markers"], len(cached["images"])
+
+    # --- UNICA APERTURA E ANALISI DEL PACCHETTO ---
+    try:
+        document = Document(docx_path)
+        renderer = DocxHtmlRenderer(document)
+        renderer.check_supported()
+        body_html = renderer.render_body()
+    except UnsupportedDocxContent as e:
+        print(f"ERRORE: {docx_path} contiene contenuti non gestiti ({e}). "
+              f"Usare la conversione LibreOffice (post_process_html.py).", file=sys.stderr)
+        return False, 0, 0
+    except Exception as e:
+        print(f"ERRORE: Impossibile leggere il documento DOCX '{docx_path}': {e}", file=sys.stderr)
+        return False, 0, 0
+
+    # --- FRAMMENTI, PAGE_CONFIG E NOMI DEI MARKER (una sola scansione dell'HTML in memoria) ---
+    fragments, config_data, marker_names = split_document(body_html, lang, page_id)
+
+    # --- IMMAGINI: la N-esima immagine del documento va al N-esimo marker ---
+    images = _unique_images(renderer.images)
+    print(f"Numero di immagini trovate nel DOCX: {len(images)}")
+    print(f"Numero di marker [SPLIT_BLOCK: ...] trovati: {len(marker_names)}")
+
+    output_dir = os.path.join(ASSETS_BASE_DIR, page_id)
+    os.makedirs(output_dir, exist_ok=True)
+    jobs = [(image_part, os.path.join(output_dir, target_filename))
+            for target_filename, image_part in zip(marker_names, images)]
+    image_paths = []
+    for (_, output_path), (saved_path, outcome) in zip(jobs, save_images(jobs)):
+        if saved_path is None:
+            print(f"ERRORE durante il salvataggio dell'immagine {output_path}: {outcome}", file=sys.stderr)
+            continue
+        image_paths.append(saved_path)
+        print(f"✅ Immagine salvata: {saved_path}")
+
+    if len(images) != len(marker_names):
+        print(f"ATTENZIONE: Trovati {len(marker_names)} marker ma {len(images)} immagini nel documento.",
+              file=sys.stderr)
+
+    written = save_results(fragments, config_data, page_id, lang)
+
+    # Registra solo le ingestioni complete: un DOCX incoerente verrà riprocessato
+    if len(image_paths) == len(marker_names):
+        json_filepath = os.path.join(OUTPUT_DIR, f"page_config_{lang}_{page_id}.json")
+        manifest.record(BUILD_STAGE, cache_key, content_hash, {
+            "fragments": [p for p in written if p != json_filepath],
+            "page_config": json_filepath,
+            "images": image_paths,
+            "markers": len(marker_names),
+        })
+        manifest.save()
+
+    return True, len(marker_names), len(image_paths)
+
+
+def _unique_images(images: List[Tuple[str, object, str]]) -> List[object]:
+    """Parti immagine in ordine di documento, senza ripetere la stessa immagine."""
+    seen = set()
+    parts = []
+    for _, image_part, _ in images:
+        if image_part.partname not in seen:
+            seen.add(image_part.partname)
+            parts.append(image_part)
+    return parts
+
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (4, 5):
+        print(f"Uso: python {sys.argv[0]} [page_id] [lang] [file_docx] [--force]", file=sys.stderr)
+        print(f"Esempio: python {sys.argv[0]} pioggia3 it it-pioggia3.docx", file=sys.stderr)
+        sys.exit(1)
+
+    PAGE_ID = sys.argv[1]
+    LANG = sys.argv[2]
+    DOCX_PATH = resolve_docx_path(sys.argv[3])
+    FORCE = "--force" in sys.argv[4:]
+
+    success, markers, saved = ingest_docx(PAGE_ID, LANG, DOCX_PATH, force=FORCE)
+    sys.exit(0 if success and markers == saved else 1)
@@ -1,45 +1,475 @@
 import sys
 import os
-# IMPORTANTE: Devi assicurarti che la libreria che usi per la conversione sia installata.
-# Ad esempio, se usi python-docx:
-# from docx import Document 
+import re
+import html
+import unicodedata
+from typing import Callable, Dict, List, Optional, Tuple
+
+from docx import Document
+from docx.oxml.ns import qn
+
+# =================================================================
+# CONVERSIONE DOCX -> HTML IN PURO PYTHON (python-docx)
+# =================================================================
+# Sostituisce LibreOffice nel percorso principale: niente processi esterni,
+# pochi millisecondi per documento. Copre titoli, elenchi (anche annidati),
+# collegamenti ipertestuali, tabelle, colori del testo e immagini in linea.
+# I documenti con contenuti non gestiti (oggetti OLE, caselle di testo,
+# formule, altChunk) sollevano UnsupportedDocxContent: il chiamante deve
+# ripiegare su LibreOffice.
+
+# Namespace aggiuntivi non registrati da python-docx per qn()
+NS_A = "http://schemas.openxmlformats.org/drawingml/2006/main"
+NS_R = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+NS_V = "urn:schemas-microsoft-com:vml"
+NS_M = "http://schemas.openxmlformats.org/officeDocument/2006/math"
+NS_WPS = "http://schemas.microsoft.com/office/word/2010/wordprocessingShape"
+
+# Nomi degli stili di paragrafo che diventano titoli (Word in inglese e in italiano)
+HEADING_STYLE_PATTERN = re.compile(r'^(?:heading|titolo)\s*([1-6])$', re.IGNORECASE)
+TITLE_STYLE_NAMES = {"title", "titolo"}
+
+# Stili di elenco usati quando il paragrafo non ha una numerazione esplicita (w:numPr)
+BULLET_STYLE_PATTERN = re.compile(r'^(?:list bullet|elenco puntato)', re.IGNORECASE)
+NUMBER_STYLE_PATTERN = re.compile(r'^(?:list number|elenco numerato)', re.IGNORECASE)
+
+# Elementi che il convertitore non sa rendere senza perdere contenuto
+UNSUPPORTED_ELEMENTS = {
+    qn('w:object'): "oggetto OLE incorporato",
+    qn('w:altChunk'): "contenuto importato (altChunk)",
+    f"{{{NS_M}}}oMath": "formula matematica",
+    f"{{{NS_M}}}oMathPara": "formula matematica",
+    f"{{{NS_WPS}}}txbx": "casella di testo",
+    qn('w:txbxContent'): "casella di testo",
+}
+
+
+class UnsupportedDocxContent(Exception):
+    """Il documento contiene elementi che il convertitore Python non gestisce."""
+
+
+def _is_on(run_props, tag: str) -> Optional[bool]:
+    """Legge una proprietà booleana di formattazione (w:b, w:i, ...) come fa Word."""
+    if run_props is None:
+        return None
+    element = run_props.find(qn(tag))
+    if element is None:
+        return None
+    value = element.get(qn('w:val'))
+    return value not in ("0", "false", "off", "none")
+
+
+def escape_text(text: str) -> str:
+    """Normalizza (NFC) e fa l'escape HTML del testo di un run (spazi unificatori come &nbsp;)."""
+    text = unicodedata.normalize('NFC', text)
+    text = re.sub(r'[\x00-\x08\x0B-\x1F\x7F]', '', text)
+    return html.escape(text, quote=False).replace('\xa0', '&nbsp;')
+
+
+class DocxHtmlRenderer:
+    """
+    Rende in HTML il corpo di un Document python-docx, in ordine di documento.
+
+    Le immagini incontrate sono raccolte in self.images come tuple
+    (rel_id, image_part, src) nell'ordine in cui compaiono; 'image_src' decide
+    il valore dell'attributo src (default: nome del file nel pacchetto DOCX).
+    """
+
+    # Tag HTML usati per la formattazione dei run (come nell'export di LibreOffice)
+    DEFAULT_INLINE_TAGS = {
+        "bold": "b", "italic": "i", "underline": "u", "strike": "s",
+        "superscript": "sup", "subscript": "sub",
+    }
+
+    def __init__(self, document, image_src: Optional[Callable[[str, object], str]] = None,
+                 inline_tags: Optional[Dict[str, str]] = None):
+        self.document = document
+        self.part = document.part
+        self.image_src = image_src or (lambda rel_id, part: os.path.basename(part.partname))
+        self.inline_tags = dict(self.DEFAULT_INLINE_TAGS, **(inline_tags or {}))
+        self.images: List[Tuple[str, object, str]] = []
+        self._numbering_formats: Dict[Tuple[str, str], str] = {}
+        self._style_names: Dict[str, str] = {}
+
+    # --- Documento e blocchi ---
+
+    def check_supported(self):
+        """Solleva UnsupportedDocxContent se il corpo contiene elementi non gestiti."""
+        for element in self.document.element.body.iter():
+            reason = UNSUPPORTED_ELEMENTS.get(element.tag)
+            if reason:
+                raise UnsupportedDocxContent(reason)
+
+    def render_body(self) -> str:
+        """Rende tutti i blocchi del corpo del documento."""
+        return "\n".join(self.render_blocks(self.document.element.body))
+
+    def render_blocks(self, container) -> List[str]:
+        """Rende paragrafi e tabelle di un contenitore (corpo, cella, sdtContent)."""
+        output: List[str] = []
+        list_stack: List[str] = []  # tag degli elenchi aperti ('ul'/'ol'), uno per livello
+
+        def close_lists(level: int = 0):
+            while len(list_stack) > level:
+                output[-1] += f"</li></{list_stack.pop()}>"
+
+        for child in self._block_children(container):
+            if child.tag == qn('w:p'):
+                list_info = self.list_info(child)
+                if list_info:
+                    list_tag, level = list_info
+                    content = self.render_inline(child)
+                    if len(list_stack) > level + 1:
+                        close_lists(level + 1)
+                    if len(list_stack) == level + 1:
+                        if list_stack[-1] != list_tag:
+                            close_lists(level)
+                        else:
+                            output[-1] += "</li>"
+                    while len(list_stack) < level + 1:
+                        output.append(f"<{list_tag}>")
+                        list_stack.append(list_tag)
+                    output.append(f"<li>{content}")
+                    continue
+
+                close_lists()
+                rendered = self.render_paragraph(child)
+                if rendered:
+                    output.append(rendered)
+            elif child.tag == qn('w:tbl'):
+                close_lists()
+                output.append(self.render_table(child))
+
+        close_lists()
+        return output
+
+    def _block_children(self, container):
+        """Figli di blocco, attraversando i controlli contenuto (w:sdt)."""
+        for child in container.iterchildren():
+            if child.tag == qn('w:sdt'):
+                content = child.find(qn('w:sdtContent'))
+                if content is not None:
+                    yield from self._block_children(content)
+            else:
+                yield child
+
+    # --- Paragrafi ---
+
+    def paragraph_style_name(self, p) -> str:
+        p_pr = p.find(qn('w:pPr'))
+        style = p_pr.find(qn('w:pStyle')) if p_pr is not None else None
+        if style is None:
+            return ""
+        style_id = style.get(qn('w:val')) or ""
+        if style_id not in self._style_names:
+            style_element = self.document.styles.element.get_by_id(style_id)
+            name = style_element.name_val if style_element is not None else None
+            self._style_names[style_id] = name or style_id
+        return self._style_names[style_id]
+
+    def render_paragraph(self, p) -> str:
+        """Rende un paragrafo come <hN>, <p> oppure <hr/> (linea orizzontale)."""
+        content = self.render_inline(p).strip()
+        style_name = self.paragraph_style_name(p)
+
+        if not content:
+            # Un paragrafo vuoto con bordo inferiore è la "linea" di Word: separatore del modale
+            p_pr = p.find(qn('w:pPr'))
+            borders = p_pr.find(qn('w:pBdr')) if p_pr is not None else None
+            if borders is not None and borders.find(qn('w:bottom')) is not None:
+                return "<hr/>"
+            return ""
+
+        if style_name.lower() in TITLE_STYLE_NAMES:
+            return f"<h1>{content}</h1>"
+        heading = HEADING_STYLE_PATTERN.match(style_name)
+        if heading:
+            level = heading.group(1)
+            return f"<h{level}>{content}</h{level}>"
+        return f"<p>{content}</p>"
+
+    def list_info(self, p) -> Optional[Tuple[str, int]]:
+        """Restituisce ('ul'|'ol', livello) se il paragrafo è una voce di elenco."""
+        p_pr = p.find(qn('w:pPr'))
+        num_pr = p_pr.find(qn('w:numPr')) if p_pr is not None else None
+        if num_pr is not None:
+            num_id_el = num_pr.find(qn('w:numId'))
+            ilvl_el = num_pr.find(qn('w:ilvl'))
+            num_id = num_id_el.get(qn('w:val')) if num_id_el is not None else None
+            ilvl = ilvl_el.get(qn('w:val')) if ilvl_el is not None else "0"
+            if num_id and num_id != "0":
+                fmt = self._numbering_format(num_id, ilvl)
+                return ("ul" if fmt in ("bullet", "none") else "ol"), int(ilvl)
+
+        style_name = self.paragraph_style_name(p)
+        if BULLET_STYLE_PATTERN.match(style_name):
+            return "ul", 0
+        if NUMBER_STYLE_PATTERN.match(style_name):
+            return "ol", 0
+        return None
+
+    def _numbering_format(self, num_id: str, ilvl: str) -> str:
+        """Formato (w:numFmt) del livello di numerazione, con cache."""
+        key = (num_id, ilvl)
+        if key in self._numbering_formats:
+            return self._numbering_formats[key]
+
+        fmt = "bullet"
+        try:
+            numbering = self.part.numbering_part.element
+        except (NotImplementedError, KeyError):
+            numbering = None
+        if numbering is not None:
+            for num in numbering.findall(qn('w:num')):
+                if num.get(qn('w:numId')) != num_id:
+                    continue
+                abstract_id = num.find(qn('w:abstractNumId')).get(qn('w:val'))
+                for abstract in numbering.findall(qn('w:abstractNum')):
+                    if abstract.get(qn('w:abstractNumId')) != abstract_id:
+                        continue
+                    for lvl in abstract.findall(qn('w:lvl')):
+                        num_fmt = lvl.find(qn('w:numFmt'))
+                        if lvl.get(qn('w:ilvl')) == ilvl and num_fmt is not None:
+                            fmt = num_fmt.get(qn('w:val'))
+                break
+        self._numbering_formats[key] = fmt
+        return fmt
+
+    # --- Contenuto in linea ---
+
+    def render_inline(self, p) -> str:
+        """
+        Rende i run di un paragrafo (anche dentro collegamenti e campi HYPERLINK),
+        unendo i run adiacenti con la stessa formattazione.
+        """
+        pieces: List[Tuple[Tuple, str]] = []  # (formattazione, html) da unire
+        output: List[str] = []
+        field_state = {"instr": "", "link": None, "in_result": False}
+
+        def flush():
+            if not pieces:
+                return
+            current_format, buffer = pieces[0][0], []
+            for fmt, text in pieces:
+                if fmt != current_format:
+                    output.append(self._wrap(current_format, "".join(buffer)))
+                    current_format, buffer = fmt, []
+                buffer.append(text)
+            output.append(self._wrap(current_format, "".join(buffer)))
+            pieces.clear()
+
+        def walk(container, href: Optional[str]):
+            for child in container.iterchildren():
+                tag = child.tag
+                if tag == qn('w:r'):
+                    self._collect_run(child, href or field_state["link"], pieces, output, flush, field_state)
+                elif tag == qn('w:hyperlink'):
+                    walk(child, self._hyperlink_target(child))
+                elif tag in (qn('w:ins'), qn('w:smartTag'), qn('w:fldSimple'), qn('w:customXml')):
+                    link = href
+                    if tag == qn('w:fldSimple'):
+                        link = _field_hyperlink(child.get(qn('w:instr'), "")) or href
+                    walk(child, link)
+                elif tag == qn('w:sdt'):
+                    content = child.find(qn('w:sdtContent'))
+                    if content is not None:
+                        walk(content, href)
+
+        walk(p, None)
+        flush()
+        return "".join(output)
+
+    def _collect_run(self, r, href, pieces, output, flush, field_state):
+        """Aggiunge il contenuto di un run (testo, a capo, immagini) alla coda dei pezzi."""
+        fmt = self._run_format(r, href)
+        for child in r.iterchildren():
+            tag = child.tag
+            if tag == qn('w:fldChar'):
+                kind = child.get(qn('w:fldCharType'))
+                if kind == "begin":
+                    field_state.update(instr="", link=None, in_result=False)
+                elif kind == "separate":
+                    field_state["link"] = _field_hyperlink(field_state["instr"])
+                    field_state["in_result"] = True
+                elif kind == "end":
+                    field_state.update(instr="", link=None, in_result=False)
+                # Cambia il collegamento attivo: i run successivi hanno un formato diverso
+                fmt = self._run_format(r, href or field_state["link"])
+            elif tag == qn('w:instrText'):
+                field_state["instr"] += child.text or ""
+            elif tag == qn('w:t'):
+                if child.text:
+                    pieces.append((fmt, escape_text(child.text)))
+            elif tag == qn('w:tab'):
+                pieces.append((fmt, " "))
+            elif tag in (qn('w:br'), qn('w:cr')):
+                if child.get(qn('w:type')) != "page":
+                    pieces.append((fmt, "<br/>"))
+            elif tag in (qn('w:drawing'), qn('w:pict')):
+                image_html = self._render_images(child)
+                if image_html:
+                    flush()
+                    output.append(image_html)
+
+    def _run_format(self, r, href) -> Tuple:
+        """Chiave di formattazione del run: (bold, italic, ..., colore, href)."""
+        r_pr = r.find(qn('w:rPr'))
+        color = None
+        vert_align = None
+        underline = False
+        if r_pr is not None:
+            color_el = r_pr.find(qn('w:color'))
+            if color_el is not None:
+                value = color_el.get(qn('w:val'))
+                if value and value.lower() != "auto" and re.fullmatch(r'[0-9A-Fa-f]{6}', value):
+                    color = f"#{value.lower()}"
+            va = r_pr.find(qn('w:vertAlign'))
+            if va is not None:
+                vert_align = va.get(qn('w:val'))
+            u = r_pr.find(qn('w:u'))
+            underline = u is not None and u.get(qn('w:val')) not in ("none", "0", "false")
+        return (
+            bool(_is_on(r_pr, 'w:b')),
+            bool(_is_on(r_pr, 'w:i')),
+            underline and not href,  # i link sono già sottolineati dal browser
+            bool(_is_on(r_pr, 'w:strike') or _is_on(r_pr, 'w:dstrike')),
+            vert_align == "superscript",
+            vert_align == "subscript",
+            color,
+            href,
+        )
+
+    def _wrap(self, fmt: Tuple, content: str) -> str:
+        """Applica i tag di formattazione a un testo già con escape."""
+        if not content:
+            return ""
+        bold, italic, underline, strike, sup, sub, color, href = fmt
+        for flag, name in ((sub, "subscript"), (sup, "superscript"), (strike, "strike"),
+                           (underline, "underline"), (italic, "italic"), (bold, "bold")):
+            if flag:
+                tag = self.inline_tags[name]
+                content = f"<{tag}>{content}</{tag}>"
+        if color:
+            content = f'<font color="{color}">{content}</font>'
+        if href:
+            content = f'<a href="{html.escape(href)}">{content}</a>'
+        return content
+
+    def _hyperlink_target(self, hyperlink) -> Optional[str]:
+        rel_id = hyperlink.get(qn('r:id'))
+        anchor = hyperlink.get(qn('w:anchor'))
+        if rel_id and rel_id in self.part.rels:
+            target = self.part.rels[rel_id].target_ref
+            return f"{target}#{anchor}" if anchor else target
+        if anchor:
+            return f"#{anchor}"
+        return None
+
+    def _render_images(self, drawing) -> str:
+        """Rende le immagini in linea di un w:drawing / w:pict."""
+        tags = []
+        rel_ids = [blip.get(f"{{{NS_R}}}embed") for blip in drawing.iter(f"{{{NS_A}}}blip")]
+        rel_ids += [img.get(f"{{{NS_R}}}id") for img in drawing.iter(f"{{{NS_V}}}imagedata")]
+        for rel_id in rel_ids:
+            if not rel_id or rel_id not in self.part.rels:
+                continue
+            image_part = self.part.rels[rel_id].target_part
+            src = self.image_src(rel_id, image_part)
+            self.images.append((rel_id, image_part, src))
+            alt = os.path.basename(src)
+            tags.append(f'<img src="{html.escape(src)}" alt="{html.escape(alt)}">')
+        return "".join(tags)
+
+    # --- Tabelle ---
+
+    def render_table(self, tbl) -> str:
+        rows = []
+        for tr in tbl.findall(qn('w:tr')):
+            cells = []
+            for tc in tr.findall(qn('w:tc')):
+                tc_pr = tc.find(qn('w:tcPr'))
+                attrs = ""
+                if tc_pr is not None:
+                    span = tc_pr.find(qn('w:gridSpan'))
+                    if span is not None and span.get(qn('w:val'), "1") != "1":
+                        attrs = f' colspan="{span.get(qn("w:val"))}"'
+                cell_html = "\n".join(self.render_blocks(tc))
+                cells.append(f"<td{attrs}>{cell_html}</td>")
+            rows.append(f"<tr>{''.join(cells)}</tr>")
+        return "<table>\n" + "\n".join(rows) + "\n</table>"
+
+
+def _field_hyperlink(instruction: str) -> Optional[str]:
+    """Estrae l'URL da un'istruzione di campo 'HYPERLINK "url"' (None se non è un link)."""
+    match = re.match(r'\s*HYPERLINK\s+(\\l\s+)?"([^"]+)"', instruction)
+    if not match:
+        return None
+    # L'opzione \l indica un segnalibro interno al documento
+    return f"#{match.group(2)}" if match.group(1) else match.group(2)
+
+
+def wrap_html_document(body_html: str, title: str = "") -> str:
+    """Avvolge il corpo in un documento HTML completo (come l'output di LibreOffice)."""
+    return (
+        "<!DOCTYPE html>\n<html>\n<head>\n<meta charset=\"utf-8\">\n"
+        f"<title>{html.escape(title)}</title>\n</head>\n"
+        f"<body dir=\"ltr\">\n{body_html}\n</body>\n</html>\n"
+    )
 
 
 # --- DEFINIZIONE DELLA FUNZIONE docx_to_html ---
-def docx_to_html(docx_path):
+def docx_to_html(docx_path, image_dir=None, strict=False):
     """
-    Legge un file docx, applica la logica di conversione e restituisce
-    il contenuto formattato in HTML.
+    Legge un file docx e restituisce il documento HTML completo.
 
-    ATTENZIONE: ADATTA QUESTO BLOCCO con il tuo codice REALMENTE FUNZIONANTE
-    che esegue la conversione da docx a stringa HTML.
+    image_dir: se indicato, le immagini in linea vengono scritte in questa
+    cartella come '<nome_docx>_html_imgN.<ext>' e referenziate con quel nome.
+    strict: se True, un file mancante solleva FileNotFoundError e i contenuti
+    non gestiti UnsupportedDocxContent (usato dal motore con fallback su
+    LibreOffice); altrimenti si restituisce None.
     """
     if not os.path.exists(docx_path):
+        if strict:
+            raise FileNotFoundError(f"File .docx non trovato: {docx_path}")
         print(f"ERRORE Python: File .docx non trovato per il percorso: {docx_path}", file=sys.stderr)
         return None
 
+    base_name = os.path.splitext(os.path.basename(docx_path))[0]
+    image_names: Dict[str, str] = {}
+
+    def image_src(rel_id, image_part):
+        # Stessa immagine referenziata più volte -> stesso file
+        if image_part.partname not in image_names:
+            ext = os.path.splitext(image_part.partname)[1].lower() or ".png"
+            image_names[image_part.partname] = f"{base_name}_html_img{len(image_names) + 1}{ext}"
+        return image_names[image_part.partname]
+
     try:
-        # --------------------------------------------------------------------
-        # INIZIO: LA TUA LOGICA DI CONVERSIONE (Esempio strutturale)
-        # --------------------------------------------------------------------
-        
-        # Esempio usando 'docx.Document':
-        # document = Document(docx_path)
-        # html_content = ""
-        # for para in document.paragraphs:
-        #     html_content += f"<p>{para.text}</p>"
-        
-        # Se non hai ancora la logica, puoi usare questa riga per un test:
-        print("ATTENZIONE: Conversione non implementata. Usando testo placeholder.", file=sys.stderr)
-        html_content = ""
-        
-        # --------------------------------------------------------------------
-        # FINE: LA TUA LOGICA DI CONVERSIONE
-        # --------------------------------------------------------------------
-        
-        return html_content
+        document = Document(docx_path)
+        renderer = DocxHtmlRenderer(document, image_src=image_src)
+        renderer.check_supported()
+        body_html = renderer.render_body()
+
+        if image_dir:
+            os.makedirs(image_dir, exist_ok=True)
+            written = set()
+            for _, image_part, src in renderer.images:
+                if src not in written:
+                    with open(os.path.join(image_dir, src), 'wb') as f:
+                        f.write(image_part.blob)
+                    written.add(src)
 
+        title = document.core_properties.title or base_name
+        return wrap_html_document(body_html, title)
+
+    except UnsupportedDocxContent as e:
+        if strict:
+            raise
+        print(f"ERRORE: {docx_path} contiene contenuti non gestiti ({e}).", file=sys.stderr)
+        return None
     except Exception as e:
+        if strict:
+            raise
         print(f"ERRORE grave durante la conversione di {docx_path}: {e}", file=sys.stderr)
         return None
 # ----------------------------------------------------------------------
@@ -52,40 +482,40 @@ if __name__ == "__main__":
         sys.exit(1)
 
     PAGE_ID_RAW = sys.argv[1]
-    
+
     # Forza l'ID della pagina a MINUSCOLO (protezione dal case-sensitivity)
     PAGE_ID = PAGE_ID_RAW.lower()
-    
+
     # 1. Definizione dei percorsi con la tua directory 'text_files'
     INPUT_DIR = "DOC_DA_CONVERTIRE"
-    OUTPUT_DIR = "text_files" 
-    
+    OUTPUT_DIR = "text_files"
+
     INPUT_FILE = f"maintext_{PAGE_ID}.docx"
     OUTPUT_FILE = f"{PAGE_ID}.html"
-    
+
     docx_path = os.path.join(INPUT_DIR, INPUT_FILE)
     html_path = os.path.join(OUTPUT_DIR, OUTPUT_FILE)
 
     print(f"Tentativo di conversione: {docx_path}")
 
     # 2. Esecuzione della Conversione
-    html_content = docx_to_html(docx_path)
-    
+    html_content = docx_to_html(docx_path, image_dir=OUTPUT_DIR)
+
     # 3. Salvataggio
     if html_content is not None:
         # Assicura che la directory di output (text_files) esista
         os.makedirs(OUTPUT_DIR, exist_ok=True)
-        
+
         try:
             with open(html_path, 'w', encoding='utf-8') as f:
                 f.write(html_content)
             print(f"SUCCESS: Contenuto salvato in {html_path}")
             sys.exit(0)
-            
+
         except Exception as e:
             print(f"ERRORE di scrittura: {e}", file=sys.stderr)
             sys.exit(1)
-            
+
     else:
         # Errore gestito all'interno di docx_to_html
-        sys.exit(1)
\ No newline at end of file
+        sys.exit(1)
@@ -1,18 +1,57 @@
 import sys
 import os
 import re
+import argparse
+from concurrent.futures import ThreadPoolExecutor
 from docx import Document
-from PIL import Image
+from docx.oxml.ns import qn
+from PIL import Image, ImageOps
 from io import BytesIO
 
+from build_cache import BuildManifest
+
 # --- CONFIGURAZIONI ---
 DOCX_DIR = "DOCS_DA_CONVERTIRE"
 ASSETS_BASE_DIR = "Assets/images"
+# Nome della fase nel manifest di build (build_cache.py)
+BUILD_STAGE = "extract_images"
+# Numero massimo di immagini convertite/scritte in parallelo
+MAX_IMAGE_WORKERS = min(8, os.cpu_count() or 1)
 
 # Pattern per identificare il marker e catturare il nome del file desiderato
 # Esempio: [SPLIT_BLOCK: nome_file.jpg]
 SPLIT_BLOCK_PATTERN = r'\[SPLIT_BLOCK:\s*(.+?\.(?:jpg|jpeg|png|gif|bmp))\]'
 
+# Formato Pillow atteso per ogni estensione dei marker
+EXTENSION_FORMATS = {
+    ".jpg": "JPEG", ".jpeg": "JPEG", ".png": "PNG", ".gif": "GIF", ".bmp": "BMP",
+}
+# Formato Pillow dei blob del DOCX, dal content-type della parte immagine
+CONTENT_TYPE_FORMATS = {
+    "image/jpeg": "JPEG", "image/png": "PNG", "image/gif": "GIF",
+    "image/bmp": "BMP", "image/x-ms-bmp": "BMP",
+}
+
+# --- IMMAGINI PRONTE PER IL WEB ---
+# Le foto incollate nei DOCX arrivano spesso dal telefono: 4000px, diversi MB,
+# orientamento solo nell'EXIF (e coordinate GPS nei metadati). In modalità web
+# (predefinita) ogni immagine viene ridotta al lato massimo, ruotata secondo
+# l'EXIF, ripulita dai metadati e ricompressa entro il budget di byte.
+WEB_MAX_DIMENSION = 2000
+WEB_BYTE_BUDGET = 400 * 1024
+# Qualità JPEG provate in ordine finché il file rientra nel budget
+WEB_JPEG_QUALITIES = (85, 80, 75, 70, 65, 60)
+# Se nemmeno la qualità minima basta, il lato viene ridotto di questo fattore
+WEB_SHRINK_FACTOR = 0.8
+WEB_MIN_DIMENSION = 640
+# Fa parte della chiave di cache: cambiare le regole di preparazione rigenera le immagini
+WEB_RULES_VERSION = 2
+
+# Riferimenti alle immagini nel corpo: DrawingML (a:blip) e VML (v:imagedata)
+BLIP_TAG = "{http://schemas.openxmlformats.org/drawingml/2006/main}blip"
+IMAGEDATA_TAG = "{urn:schemas-microsoft-com:vml}imagedata"
+REL_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+
 def get_target_filename(paragraph):
     """Estrae il nome del file immagine dal marker [SPLIT_BLOCK]"""
     match = re.search(SPLIT_BLOCK_PATTERN, paragraph.text, re.IGNORECASE)
@@ -20,7 +59,168 @@ def get_target_filename(paragraph):
         return match.group(1).strip()
     return None
 
-def extract_images_from_docx(page_id, docx_filename):
+def document_image_parts(document):
+    """
+    Parti immagine nell'ordine in cui compaiono nel corpo del documento
+    (posizione dei disegni in linea), senza ripetere la stessa immagine.
+    NOTA: l'ordine di document.part.rels NON è l'ordine del documento.
+    """
+    rels = document.part.rels
+    parts = []
+    seen = set()
+    for element in document.element.body.iter(BLIP_TAG, IMAGEDATA_TAG):
+        rel_id = element.get(f"{REL_NS}embed") if element.tag == BLIP_TAG else element.get(f"{REL_NS}id")
+        if not rel_id or rel_id not in rels or rels[rel_id].is_external:
+            continue
+        image_part = rels[rel_id].target_part
+        if image_part.partname not in seen:
+            seen.add(image_part.partname)
+            parts.append(image_part)
+    return parts
+
+def web_settings_tag(max_dimension=WEB_MAX_DIMENSION, byte_budget=WEB_BYTE_BUDGET):
+    """Etichetta delle impostazioni di estrazione (entra nella chiave della cache di build)."""
+    if not max_dimension and not byte_budget:
+        return "originale"
+    return f"web{max_dimension or 0}x{(byte_budget or 0) // 1024}k.v{WEB_RULES_VERSION}"
+
+def _is_web_ready(img, image_size, target_format, max_dimension, byte_budget):
+    """True se il blob può essere scritto così com'è anche in modalità web."""
+    if max_dimension and max(img.size) > max_dimension:
+        return False
+    if byte_budget and image_size > byte_budget:
+        return False
+    # Metadati (EXIF con orientamento, GPS, XMP...) da eliminare
+    return not any(key in img.info for key in ("exif", "xmp", "XML:com.adobe.xmp", "comment"))
+
+def _encode_web(img, save_format, byte_budget, icc_profile=None):
+    """Codifica l'immagine (già ruotata e ridotta) cercando di restare nel budget."""
+    options = {"icc_profile": icc_profile} if icc_profile else {}
+    buffer = BytesIO()
+    if save_format == "JPEG":
+        for quality in WEB_JPEG_QUALITIES:
+            buffer = BytesIO()
+            img.save(buffer, format="JPEG", quality=quality, optimize=True, progressive=True, **options)
+            if not byte_budget or buffer.tell() <= byte_budget:
+                break
+    elif save_format == "PNG":
+        img.save(buffer, format="PNG", optimize=True, **options)
+    else:
+        img.save(buffer, format=save_format)
+    return buffer.getvalue()
+
+def prepare_web_image(image_bytes, save_format, max_dimension=WEB_MAX_DIMENSION, byte_budget=WEB_BYTE_BUDGET,
+                      label="immagine"):
+    """
+    Restituisce i byte dell'immagine pronta per il web nel formato richiesto:
+    lato massimo 'max_dimension', orientamento EXIF applicato, nessun metadato,
+    JPEG progressivo entro 'byte_budget' (riducendo la qualità e, se serve, il lato).
+    Segnala con un AVVISO ('label' identifica l'immagine) i risultati ancora
+    oltre il budget e le immagini non JPEG ridotte per rientrarvi.
+    """
+    with Image.open(BytesIO(image_bytes)) as original:
+        if original.format == "JPEG" and max_dimension:
+            # Decodifica già ridotta (scala 1/2, 1/4, 1/8) senza mai scendere sotto il lato richiesto
+            original.draft("RGB", (max_dimension, max_dimension))
+        img = ImageOps.exif_transpose(original)
+        if save_format == "JPEG" and img.mode not in ("RGB", "L"):
+            if img.mode in ("RGBA", "LA", "PA", "P") and ("transparency" in img.info or img.mode.endswith("A")):
+                # Il JPEG non ha trasparenza: sfondo bianco
+                rgba = img.convert("RGBA")
+                img = Image.new("RGB", rgba.size, (255, 255, 255))
+                img.paste(rgba, mask=rgba.getchannel("A"))
+            else:
+                img = img.convert("RGB")
+        if max_dimension and max(img.size) > max_dimension:
+            img = img.copy() if img is original else img
+            img.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+
+        # Il nuovo file nasce senza EXIF/XMP: si conserva solo il profilo colore
+        icc_profile = original.info.get("icc_profile")
+        img.info = {}
+
+        data = _encode_web(img, save_format, byte_budget, icc_profile)
+        shrunk = False
+        while byte_budget and len(data) > byte_budget and max(img.size) * WEB_SHRINK_FACTOR >= WEB_MIN_DIMENSION:
+            side = int(max(img.size) * WEB_SHRINK_FACTOR)
+            img = img.copy()
+            img.thumbnail((side, side), Image.LANCZOS)
+            data = _encode_web(img, save_format, byte_budget, icc_profile)
+            shrunk = True
+
+    width, height = img.size
+    if byte_budget and len(data) > byte_budget:
+        print(f"AVVISO: {label}: {len(data) // 1024} KB anche a {width}x{height} ({save_format}), "
+              f"oltre il budget di {byte_budget // 1024} KB.")
+    elif shrunk and save_format != "JPEG":
+        print(f"AVVISO: {label}: ridotta a {width}x{height} per restare nel budget di {byte_budget // 1024} KB "
+              f"in {save_format} (per una foto conviene un marker .jpg).")
+    return data
+
+def save_image(image_bytes, output_path, content_type=None,
+               max_dimension=WEB_MAX_DIMENSION, byte_budget=WEB_BYTE_BUDGET):
+    """
+    Salva il blob di un'immagine del DOCX nel percorso indicato dal marker.
+    In modalità web (max_dimension/byte_budget impostati) l'immagine viene resa
+    pronta per il web con prepare_web_image(), a meno che non lo sia già.
+    Se il formato del blob coincide già con l'estensione richiesta (e, in
+    modalità web, non c'è nulla da ridurre o ripulire), i byte originali
+    vengono scritti così come sono (nessuna decodifica/ricodifica).
+    Restituisce True se è stata necessaria una conversione.
+    """
+    target_format = EXTENSION_FORMATS.get(os.path.splitext(output_path)[1].lower())
+    same_format = target_format and CONTENT_TYPE_FORMATS.get(content_type) == target_format
+    web_mode = bool(max_dimension or byte_budget)
+
+    if same_format and web_mode:
+        # Image.open legge solo l'intestazione: controllo economico
+        with Image.open(BytesIO(image_bytes)) as img:
+            same_format = target_format == "GIF" or _is_web_ready(
+                img, len(image_bytes), target_format, max_dimension, byte_budget)
+
+    if same_format:
+        with open(output_path, 'wb') as f:
+            f.write(image_bytes)
+        return False
+
+    if web_mode and target_format != "GIF":
+        # Le GIF (anche animate) restano fuori: verrebbero appiattite al primo fotogramma
+        data = prepare_web_image(image_bytes, target_format or "JPEG", max_dimension, byte_budget, output_path)
+        with open(output_path, 'wb') as f:
+            f.write(data)
+        return True
+
+    # Formato diverso (o sconosciuto): conversione con Pillow
+    with Image.open(BytesIO(image_bytes)) as img:
+        save_format = target_format or img.format
+        if save_format == "JPEG" and img.mode not in ("RGB", "L", "CMYK"):
+            # Il JPEG non supporta trasparenza/palette
+            img = img.convert("RGB")
+        img.save(output_path, format=save_format)
+    return True
+
+def save_images(jobs, max_dimension=WEB_MAX_DIMENSION, byte_budget=WEB_BYTE_BUDGET):
+    """
+    Salva in parallelo una lista di (image_part, output_path).
+    Restituisce, nello stesso ordine dei job, (output_path, convertita) oppure
+    (None, errore) per le immagini non salvate.
+    """
+    def save(job):
+        image_part, output_path = job
+        try:
+            return output_path, save_image(image_part.blob, output_path, image_part.content_type,
+                                           max_dimension, byte_budget)
+        except Exception as e:
+            return None, e
+
+    if len(jobs) <= 1:
+        return [save(job) for job in jobs]
+    with ThreadPoolExecutor(max_workers=MAX_IMAGE_WORKERS) as executor:
+        # map() conserva l'ordine dei job: il risultato è deterministico
+        return list(executor.map(save, jobs))
+
+def extract_images_from_docx(page_id, docx_filename, force=False,
+                             max_dimension=WEB_MAX_DIMENSION, byte_budget=WEB_BYTE_BUDGET):
     # 1. Normalizzazione del Page ID
     # Questo è fondamentale per la robustezza: garantisce che la cartella sia sempre in minuscolo
     normalized_page_id = page_id.lower()
@@ -30,6 +230,16 @@ def extract_images_from_docx(page_id, docx_filename):
         print(f"ERRORE: File DOCX non trovato: {docx_path}", file=sys.stderr)
         return False, 0, 0
 
+    # Cache di build: se il DOCX è identico e le immagini esistono, non c'è nulla da fare
+    manifest = BuildManifest()
+    # Le impostazioni di estrazione fanno parte della chiave: cambiarle rigenera le immagini
+    cache_key = f"{docx_path}#{normalized_page_id}@{web_settings_tag(max_dimension, byte_budget)}"
+    content_hash = manifest.source_hash(BUILD_STAGE, cache_key)
+    if not force and manifest.is_up_to_date(BUILD_STAGE, cache_key, content_hash):
+        cached = manifest.entry(BUILD_STAGE, cache_key)["outputs"]
+        print(f"DOCX invariato: {len(cached['images'])} immagini già estratte in {os.path.join(ASSETS_BASE_DIR, normalized_page_id)}.")
+        return True, cached["markers"], len(cached["images"])
+
     output_dir = os.path.join(ASSETS_BASE_DIR, normalized_page_id)
     os.makedirs(output_dir, exist_ok=True)
     print(f"Directory di output creata: {output_dir}")
@@ -40,67 +250,67 @@ def extract_images_from_docx(page_id, docx_filename):
         print(f"ERRORE: Impossibile aprire il documento DOCX '{docx_path}': {e}", file=sys.stderr)
         return False, 0, 0
 
+    # 2. Scansione dei paragrafi (anche nelle tabelle) per trovare i marker [SPLIT_BLOCK]
     doc_images = []
-    markers_found = 0
+    for p in document.element.body.iter(qn('w:p')):
+        text = "".join(t.text or "" for t in p.iter(qn('w:t')))
+        doc_images.extend(m.strip() for m in re.findall(SPLIT_BLOCK_PATTERN, text, re.IGNORECASE))
+    markers_found = len(doc_images)
 
-    # 2. Scansione dei paragrafi per trovare i marker [SPLIT_BLOCK]
-    for paragraph in document.paragraphs:
-        target_filename = get_target_filename(paragraph)
-        if target_filename:
-            doc_images.append(target_filename)
-            markers_found += 1
+    # 3. Immagini nell'ordine dei disegni nel corpo del documento
+    image_parts = document_image_parts(document)
 
-    print(f"Numero di immagini trovate nel DOCX: {len(doc_images)}")
+    print(f"Numero di immagini trovate nel DOCX: {len(image_parts)}")
     print(f"Numero di marker [SPLIT_BLOCK: ...] trovati: {markers_found}")
 
-    extracted_count = 0
-
-    # 3. Estrazione dei dati immagine (blb) dal DOCX
-    for rel_id, rel in document.part.rels.items():
-        if "image" in rel.target_ref:
-            try:
-                # *** CORREZIONE DEL BUG: SINTASSI MODERNA PER RECUPERARE IL BLOB ***
-                image_part = rel.target_part
-                image_bytes = image_part.blob
-
-                # 4. Associa l'immagine al nome desiderato
-                if extracted_count < len(doc_images):
-                    target_filename = doc_images[extracted_count]
-                    output_path = os.path.join(output_dir, target_filename)
-
-                    # Utilizza Pillow per aprire e salvare come JPG (o mantenere il formato specificato)
-                    with Image.open(BytesIO(image_bytes)) as img:
-                        # Assicurati che l'estensione nel marker corrisponda al formato di salvataggio (se necessario)
-                        # Qui salviamo come JPG per semplificare, ma Pillow gestisce l'estensione nel nome.
-                        img.save(output_path, format=img.format if not target_filename.lower().endswith('.jpg') else 'jpeg')
-                    
-                    print(f"✅ Immagine estratta e salvata (formato originale/JPG): {output_path}")
-                    extracted_count += 1
-                
-            except Exception as e:
-                # Logga l'errore specifico, ma continua
-                print(f"ERRORE durante l'estrazione di un'immagine: {e}", file=sys.stderr)
-                # Incrementa extracted_count solo se il marker è stato consumato, ma qui non lo facciamo
-                # per mantenere la sincronizzazione con i marker trovati. Continuiamo solo.
-                continue 
+    # 4. Associa la N-esima immagine al N-esimo marker e salva in parallelo
+    jobs = [(image_part, os.path.join(output_dir, target_filename))
+            for target_filename, image_part in zip(doc_images, image_parts)]
+
+    written_paths = []
+    for (_, output_path), (saved_path, outcome) in zip(jobs, save_images(jobs, max_dimension, byte_budget)):
+        if saved_path is None:
+            # Logga l'errore specifico, ma continua
+            print(f"ERRORE durante l'estrazione dell'immagine {output_path}: {outcome}", file=sys.stderr)
+            continue
+        how = "convertita" if outcome else "copiata senza ricodifica"
+        print(f"✅ Immagine estratta e salvata ({how}, {os.path.getsize(saved_path) / 1024:.0f} KB): {saved_path}")
+        written_paths.append(saved_path)
 
+    extracted_count = len(written_paths)
     print(f"\nEstrazione immagini completata. Estratte {extracted_count} immagini.")
+
+    # Registra solo le estrazioni complete: un DOCX incoerente verrà riprocessato
+    if extracted_count == markers_found:
+        manifest.record(BUILD_STAGE, cache_key, content_hash,
+                        {"images": written_paths, "markers": markers_found})
+        manifest.save()
     return True, markers_found, extracted_count
 
 if __name__ == '__main__':
-    if len(sys.argv) != 3:
-        print("Uso: python extract_images.py [ID_pagina] [nome_file_docx]", file=sys.stderr)
-        sys.exit(1)
-        
-    PAGE_ID = sys.argv[1]
-    DOCX_FILE = sys.argv[2]
-    
-    success, markers, extracted = extract_images_from_docx(PAGE_ID, DOCX_FILE)
-    
+    parser = argparse.ArgumentParser(description="Estrae le immagini di un DOCX nelle cartelle di Assets/images.")
+    parser.add_argument("page_id", help="ID della pagina (nome della cartella di destinazione).")
+    parser.add_argument("docx_file", help=f"Nome del file DOCX in {DOCX_DIR}.")
+    parser.add_argument("--max-dim", type=int, default=WEB_MAX_DIMENSION,
+                        help=f"Lato massimo in pixel (default: {WEB_MAX_DIMENSION}).")
+    parser.add_argument("--budget-kb", type=int, default=WEB_BYTE_BUDGET // 1024,
+                        help=f"Dimensione massima per immagine in KB (default: {WEB_BYTE_BUDGET // 1024}).")
+    parser.add_argument("--originale", action="store_true",
+                        help="Salva le immagini a risoluzione piena, senza ricompressione né pulizia dei metadati.")
+    parser.add_argument("--force", action="store_true", help="Ignora la cache di build.")
+    args = parser.parse_args()
+
+    if args.originale:
+        max_dim, budget = None, None
+    else:
+        max_dim, budget = args.max_dim, args.budget_kb * 1024
+
+    success, markers, extracted = extract_images_from_docx(args.page_id, args.docx_file, args.force, max_dim, budget)
+
     if success and markers == extracted:
         sys.exit(0)
     elif success and markers != extracted:
         print(f"ATTENZIONE: Trovati {markers} marker ma estratte {extracted} immagini.", file=sys.stderr)
         sys.exit(1)
     else:
-        sys.exit(1)
\ No newline at end of file
+        sys.exit(1)
@@ -1,69 +1,237 @@
 import os
 import re
-from typing import List
+import sys
+from html.parser import HTMLParser
+from typing import List, Tuple
 
 # Configurazione (deve corrispondere alla cartella di input del key_synchronization_v2.py)
 FRAGMENTS_DIR = "text_files"
 
+# Contenitore radice per l'iniezione (deve essercene esattamente uno)
+WRAPPER_OPEN = '<div class="main-text-content">'
+WRAPPER_CLOSE = '</div>'
+
+# Parti del "guscio" del documento da eliminare: i tag spariscono, il contenuto resta
+SHELL_TAGS = {"html", "body"}
+# Blocchi eliminati insieme al loro contenuto
+DROPPED_BLOCKS = {"head", "title"}
+# Contenuto da non toccare (spazi significativi)
+RAW_TEXT_TAGS = {"pre", "textarea", "script", "style"}
+
+# Spazi bianchi HTML (il carattere \xa0 / &nbsp; NON è compreso: è voluto)
+WHITESPACE_RUN_REGEX = re.compile(r'[ \t\n\r\f]+')
+
+
+def _collapse_whitespace(text: str) -> str:
+    """Riduce ogni sequenza di spazi a '\n' (se contiene un a capo) o a un singolo spazio."""
+    return WHITESPACE_RUN_REGEX.sub(lambda m: "\n" if "\n" in m.group(0) or "\r" in m.group(0) else " ", text)
+
+
+class FragmentNormalizer(HTMLParser):
+    """
+    Normalizzatore a passaggio unico basato sul parser HTML incrementale.
+    In un solo giro sui token:
+      - elimina DOCTYPE, <html>, <head> (con il contenuto), <body> e i commenti;
+      - rimuove i contenitori 'main-text-content' già presenti (anche multipli);
+      - elimina i paragrafi vuoti e comprime gli spazi bianchi.
+    I tag vengono riprodotti con il testo originale: applicare la normalizzazione
+    a un risultato già normalizzato restituisce gli stessi byte (idempotenza).
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        # Pezzi di output: ("tag" | "text" | "raw", contenuto)
+        self.pieces: List[Tuple[str, str]] = []
+        self.dropped_depth = 0
+        self.raw_depth = 0
+        # Per ogni <div> aperto: True se è un contenitore da rimuovere
+        self.div_stack: List[bool] = []
+        # Indice del <p> aperto finché al suo interno c'è solo spazio bianco
+        self.empty_p_start = None
+
+    # --- Emissione ---
+
+    def _emit(self, kind: str, content: str):
+        if self.dropped_depth:
+            return
+        if kind == "text" and self.raw_depth:
+            kind = "raw"
+        self.pieces.append((kind, content))
+        if kind != "text" or content.strip(" \t\n\r\f"):
+            self.empty_p_start = None
+
+    # --- Eventi del parser ---
+
+    def handle_starttag(self, tag, attrs):
+        if tag in DROPPED_BLOCKS:
+            self.dropped_depth += 1
+            return
+        if tag in SHELL_TAGS or self.dropped_depth:
+            return
+        if tag == "div":
+            is_wrapper = "main-text-content" in (dict(attrs).get("class") or "").split()
+            self.div_stack.append(is_wrapper)
+            if is_wrapper:
+                return
+        self._emit("tag", self.get_starttag_text())
+        if tag == "p":
+            self.empty_p_start = len(self.pieces) - 1
+        if tag in RAW_TEXT_TAGS:
+            self.raw_depth += 1
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in SHELL_TAGS or tag in DROPPED_BLOCKS:
+            return
+        self._emit("tag", self.get_starttag_text())
+
+    def handle_endtag(self, tag):
+        if tag in DROPPED_BLOCKS:
+            self.dropped_depth = max(0, self.dropped_depth - 1)
+            return
+        if tag in SHELL_TAGS or self.dropped_depth:
+            return
+        if tag == "div":
+            # </div> senza apertura: verrebbe a chiudere il contenitore (non idempotente)
+            if not self.div_stack or self.div_stack.pop():
+                return
+        if tag == "p" and self.empty_p_start is not None:
+            # Paragrafo con solo spazi bianchi: viene eliminato
+            del self.pieces[self.empty_p_start:]
+            self.empty_p_start = None
+            return
+        if tag in RAW_TEXT_TAGS:
+            self.raw_depth = max(0, self.raw_depth - 1)
+        self._emit("tag", f"</{tag}>")
+
+    def handle_data(self, data):
+        self._emit("text", data)
+
+    def handle_entityref(self, name):
+        self._emit("tag", f"&{name};")
+
+    def handle_charref(self, name):
+        self._emit("tag", f"&#{name};")
+
+    def handle_comment(self, data):
+        # I commenti non servono nei frammenti serviti al browser
+        pass
+
+    def handle_decl(self, decl):
+        # DOCTYPE
+        pass
+
+    def unknown_decl(self, data):
+        pass
+
+    def handle_pi(self, data):
+        pass
+
+    # --- Risultato ---
+
+    def result(self) -> str:
+        """Contenuto normalizzato, avvolto in esattamente un contenitore."""
+        output = []
+        text_run: List[str] = []
+        for kind, content in self.pieces:
+            if kind == "text":
+                text_run.append(content)
+                continue
+            if text_run:
+                output.append(_collapse_whitespace("".join(text_run)))
+                text_run = []
+            output.append(content)
+        if text_run:
+            output.append(_collapse_whitespace("".join(text_run)))
+
+        # <div> rimasti aperti: vengono chiusi prima del contenitore
+        output.append("</div>" * sum(1 for is_wrapper in self.div_stack if not is_wrapper))
+
+        body = "".join(output).strip(" \t\n\r\f")
+        return f"{WRAPPER_OPEN}\n{body}\n{WRAPPER_CLOSE}"
+
+
 def clean_html_fragment(html_content: str) -> str:
     """
     Pulisce il contenuto HTML rimuovendo intestazioni complete (DOCTYPE, head, body)
     e incapsulando il corpo rimanente in un div contenitore.
+    Idempotente: clean_html_fragment(clean_html_fragment(x)) == clean_html_fragment(x).
     """
-    
-    # 1. Rimuovi DOCTYPE e blocchi HEAD
-    # Questo cerca e rimuove tutto dall'inizio fino al primo tag <body>
-    body_match = re.search(r'<body[^>]*>(.*)', html_content, re.DOTALL | re.IGNORECASE)
-    
-    if body_match:
-        # Trovato il corpo, prendiamo il contenuto dopo <body>
-        clean_content = body_match.group(1).strip()
-    else:
-        # Nessun <body> trovato, prendiamo tutto il contenuto e lo puliamo solo dei tag noti
-        clean_content = html_content.strip()
-
-    # 2. Rimuovi i tag </body> e </html> rimanenti alla fine
-    clean_content = re.sub(r'</body[^>]*>\s*</html>\s*$', '', clean_content, flags=re.IGNORECASE | re.DOTALL).strip()
-    
-    # 3. Aggiungi il contenitore radice per l'iniezione
-    final_fragment = f'<div class="main-text-content">\n{clean_content}\n</div>'
-    
-    return final_fragment
+    normalizer = FragmentNormalizer()
+    normalizer.feed(html_content)
+    normalizer.close()
+    return normalizer.result()
+
 
 def process_fragments(directory: str):
     """
     Scorre la directory e pulisce tutti i file HTML che potrebbero essere frammenti.
+    I file già normalizzati non vengono riscritti (mtime e cache restano stabili).
     """
     print(f"Inizio pulizia dei frammenti HTML nella directory: {directory}")
     processed_count = 0
-    
+    unchanged_count = 0
+
     # Assumiamo che tutti i file .html in questa directory siano frammenti da pulire
     html_files = [f for f in os.listdir(directory) if f.endswith(".html")]
-    
+
     if not html_files:
         print("Nessun file HTML trovato da pulire.")
         return
 
     for filename in html_files:
         filepath = os.path.join(directory, filename)
-        
+
         try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                original_content = f.read()
-            
-            cleaned_content = clean_html_fragment(original_content)
-            
+            # Lettura/scrittura in binario: il confronto è byte per byte (niente conversioni CRLF)
+            with open(filepath, 'rb') as f:
+                original_bytes = f.read()
+
+            cleaned_bytes = clean_html_fragment(original_bytes.decode('utf-8')).encode('utf-8')
+
+            if cleaned_bytes == original_bytes:
+                unchanged_count += 1
+                continue
+
             # Scrivi il contenuto pulito sullo stesso file
-            with open(filepath, 'w', encoding='utf-8') as f:
-                f.write(cleaned_content)
-            
+            with open(filepath, 'wb') as f:
+                f.write(cleaned_bytes)
+
             print(f"  - Pulito e aggiornato: {filename}")
             processed_count += 1
-            
+
         except Exception as e:
             print(f"  - ERRORE durante la pulizia di {filename}: {e}")
 
-    print(f"✅ Pulizia completata. {processed_count} file processati.")
+    print(f"✅ Pulizia completata. {processed_count} file aggiornati, {unchanged_count} già normalizzati (non riscritti).")
+
+# Casi limite verificati da --verifica oltre ai file della cartella
+IDEMPOTENCE_CASES = [
+    '<p>x</p></div><p>y</p>',  # </div> senza apertura
+    '<div><p>x</p>',           # <div> mai chiuso
+]
+
+
+def verify_idempotence(directory: str) -> bool:
+    """
+    Controlla, senza scrivere nulla, che una seconda normalizzazione non cambi
+    il risultato per tutti i file HTML della cartella e per IDEMPOTENCE_CASES.
+    """
+    samples = [(repr(case), case) for case in IDEMPOTENCE_CASES]
+    for filename in sorted(f for f in os.listdir(directory) if f.endswith(".html")):
+        with open(os.path.join(directory, filename), 'rb') as f:
+            samples.append((filename, f.read().decode('utf-8')))
+
+    failures = 0
+    for name, content in samples:
+        once = clean_html_fragment(content)
+        if clean_html_fragment(once) != once:
+            print(f"  - ERRORE: normalizzazione non idempotente per {name}")
+            failures += 1
+    print(f"Verifica idempotenza: {len(samples) - failures}/{len(samples)} casi stabili.")
+    return failures == 0
+
 
 if __name__ == "__main__":
-    process_fragments(FRAGMENTS_DIR)
\ No newline at end of file
+    if "--verifica" in sys.argv[1:]:
+        sys.exit(0 if verify_idempotence(FRAGMENTS_DIR) else 1)
+    process_fragments(FRAGMENTS_DIR)
@@ -0,0 +1,284 @@
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, List, Set, Tuple
+
+from PIL import Image, ImageOps
+
+from build_cache import BuildManifest, hash_text
+
+# =================================================================
+# DERIVATI RESPONSIVE DELLE IMMAGINI (WebP + JPEG a più larghezze)
+# =================================================================
+# Gli originali in Assets/images e public/images pesano anche diversi MB e
+# venivano serviti così come sono anche ai telefoni. Questa fase genera, per
+# ogni immagine referenziata, versioni ridotte in WebP e JPEG e un manifest
+# che main.js usa per impostare 'srcset': il browser scarica solo la
+# larghezza che gli serve.
+#
+# I derivati hanno nomi che dipendono dall'hash della sorgente e dai
+# parametri: se l'originale o i parametri cambiano, cambiano anche i nomi
+# (niente cache HTTP obsolete) e i file non più prodotti vengono eliminati.
+
+TRANSLATIONS_DIR = os.path.join("data", "translations")
+TEXTS_JSON_FILENAME = "texts.json"
+# Cartelle delle immagini, come le costruisce main.js
+ASSETS_IMAGES_DIR = "Assets/images"
+PUBLIC_IMAGES_DIR = "public/images"
+# Cartella dei derivati e manifest letto da main.js
+DERIVATIVES_DIR = "Assets/derivatives"
+DERIVATIVES_MANIFEST = os.path.join(DERIVATIVES_DIR, "manifest.json")
+# Nome della fase nel manifest di build (build_cache.py)
+BUILD_STAGE = "image_derivatives"
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".gif", ".bmp", ".webp")
+MAX_IMAGE_SOURCES = 5
+
+# Larghezze generate (solo quelle inferiori alla larghezza dell'originale)
+DERIVATIVE_WIDTHS = (480, 800, 1200, 1600)
+WEBP_QUALITY = 80
+JPEG_QUALITY = 82
+# Larghezza usata per stimare il risparmio su un telefono
+MOBILE_WIDTH = 800
+# Fa parte della chiave di cache: cambiare i parametri rigenera tutto
+DERIVATIVE_PARAMS = f"w={','.join(map(str, DERIVATIVE_WIDTHS))};webp={WEBP_QUALITY};jpeg={JPEG_QUALITY};v=1"
+
+FORMATS = {
+    "webp": {"format": "WEBP", "options": {"quality": WEBP_QUALITY, "method": 6}},
+    "jpeg": {"format": "JPEG", "options": {"quality": JPEG_QUALITY, "optimize": True, "progressive": True}},
+}
+
+
+def web_path(path: str) -> str:
+    """
+    Percorso normalizzato con '/' come separatore (chiave del manifest).
+    main.js normalizza allo stesso modo i percorsi con '..' (es. dopo dedup_assets.py).
+    """
+    return os.path.normpath(path).replace(os.sep, "/")
+
+
+def collect_image_references() -> Dict[str, Set[str]]:
+    """
+    Immagini da elaborare -> pagine che le usano:
+      - headImage (public/images) e imageSourceN (Assets/images) di ogni texts.json;
+      - tutte le immagini nelle sottocartelle di pagina di Assets/images.
+    Vengono restituiti solo i file esistenti.
+    """
+    references: Dict[str, Set[str]] = {}
+
+    def add(path: str, page_id: str):
+        if os.path.isfile(path):
+            references.setdefault(web_path(path), set()).add(page_id)
+
+    if os.path.isdir(TRANSLATIONS_DIR):
+        for lang in sorted(os.listdir(TRANSLATIONS_DIR)):
+            texts_path = os.path.join(TRANSLATIONS_DIR, lang, TEXTS_JSON_FILENAME)
+            if not os.path.isfile(texts_path):
+                continue
+            try:
+                with open(texts_path, 'r', encoding='utf-8') as f:
+                    texts = json.load(f)
+            except (json.JSONDecodeError, OSError) as e:
+                print(f"ATTENZIONE: Impossibile leggere {texts_path}: {e}")
+                continue
+            for page_id, page_data in texts.items():
+                if not isinstance(page_data, dict):
+                    continue
+                if page_data.get("headImage"):
+                    add(os.path.join(PUBLIC_IMAGES_DIR, page_data["headImage"]), page_id)
+                for i in range(1, MAX_IMAGE_SOURCES + 1):
+                    image_source = page_data.get(f"imageSource{i}")
+                    if image_source:
+                        add(os.path.join(ASSETS_IMAGES_DIR, image_source), page_id)
+
+    if os.path.isdir(ASSETS_IMAGES_DIR):
+        for page_id in sorted(os.listdir(ASSETS_IMAGES_DIR)):
+            page_dir = os.path.join(ASSETS_IMAGES_DIR, page_id)
+            if not os.path.isdir(page_dir):
+                continue
+            for filename in sorted(os.listdir(page_dir)):
+                if filename.lower().endswith(IMAGE_EXTENSIONS):
+                    add(os.path.join(page_dir, filename), page_id)
+
+    return references
+
+
+def _target_widths(original_width: int) -> List[int]:
+    """Larghezze da generare: quelle minori dell'originale (almeno una)."""
+    widths = [w for w in DERIVATIVE_WIDTHS if w < original_width]
+    return widths or [original_width]
+
+
+def build_derivatives(source_path: str, cache_tag: str) -> Dict[str, Any]:
+    """
+    Genera i derivati di una immagine (eseguita nei processi worker).
+    Restituisce dimensioni dell'originale e l'elenco dei derivati scritti.
+    """
+    stem = os.path.splitext(os.path.basename(source_path))[0]
+    variants = []
+    with Image.open(source_path) as original:
+        # Le foto da telefono sono spesso ruotate solo tramite EXIF
+        image = ImageOps.exif_transpose(original)
+        width, height = image.size
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "transparency" in image.info or image.mode in ("LA", "PA") else "RGB")
+
+        for target_width in _target_widths(width):
+            target_height = max(1, round(height * target_width / width))
+            resized = image if target_width == width else image.resize(
+                (target_width, target_height), Image.LANCZOS)
+            for fmt, spec in FORMATS.items():
+                output = resized
+                if spec["format"] == "JPEG" and output.mode == "RGBA":
+                    # Il JPEG non ha trasparenza: sfondo bianco
+                    background = Image.new("RGB", output.size, (255, 255, 255))
+                    background.paste(output, mask=output.getchannel("A"))
+                    output = background
+                filename = f"{stem}-{cache_tag}-{target_width}w.{fmt}"
+                output_path = os.path.join(DERIVATIVES_DIR, filename)
+                output.save(output_path, format=spec["format"], **spec["options"])
+                variants.append({
+                    "format": fmt,
+                    "width": target_width,
+                    "path": web_path(output_path),
+                    "bytes": os.path.getsize(output_path),
+                })
+
+    return {"width": width, "height": height, "variants": variants}
+
+
+def _manifest_record(source: str, result: Dict[str, Any]) -> Dict[str, Any]:
+    """Voce del manifest per main.js: candidati srcset per formato, in ordine di larghezza."""
+    record = {"width": result["width"], "height": result["height"]}
+    for fmt in FORMATS:
+        record[fmt] = [
+            {"src": v["path"], "w": v["width"]}
+            for v in sorted(result["variants"], key=lambda v: v["width"]) if v["format"] == fmt
+        ]
+    return record
+
+
+def _mobile_bytes(result: Dict[str, Any]) -> int:
+    """Byte del candidato WebP che un telefono scaricherebbe (larghezza <= MOBILE_WIDTH)."""
+    webp = sorted((v for v in result["variants"] if v["format"] == "webp"), key=lambda v: v["width"])
+    suitable = [v for v in webp if v["width"] <= MOBILE_WIDTH] or webp[:1]
+    return suitable[-1]["bytes"] if suitable else 0
+
+
+def evict_stale(keep: Set[str]) -> Tuple[int, int]:
+    """Elimina i derivati non più prodotti. Restituisce (file eliminati, byte liberati)."""
+    removed = freed = 0
+    manifest_name = os.path.basename(DERIVATIVES_MANIFEST)
+    for filename in os.listdir(DERIVATIVES_DIR):
+        path = web_path(os.path.join(DERIVATIVES_DIR, filename))
+        if filename == manifest_name or path in keep or not os.path.isfile(path):
+            continue
+        freed += os.path.getsize(path)
+        os.remove(path)
+        removed += 1
+    return removed, freed
+
+
+def build_all(workers: int = 0, force: bool = False) -> bool:
+    """Genera i derivati mancanti, aggiorna il manifest e stampa il risparmio per pagina."""
+    references = collect_image_references()
+    if not references:
+        print("AVVISO: Nessuna immagine referenziata trovata.")
+        return True
+
+    os.makedirs(DERIVATIVES_DIR, exist_ok=True)
+    build_manifest = BuildManifest()
+    results: Dict[str, Dict[str, Any]] = {}
+    jobs: Dict[str, Tuple[str, str]] = {}
+
+    # Il qualificatore lega la voce di cache ai parametri di generazione
+    params_tag = hash_text(DERIVATIVE_PARAMS)[:8]
+    live_sources = []
+    for source in sorted(references):
+        cache_source = f"{source}#{params_tag}"
+        live_sources.append(cache_source)
+        source_hash = build_manifest.source_hash(BUILD_STAGE, cache_source)
+        if not force and build_manifest.is_up_to_date(BUILD_STAGE, cache_source, source_hash):
+            results[source] = build_manifest.entry(BUILD_STAGE, cache_source)["outputs"]["result"]
+        else:
+            jobs[source] = (cache_source, source_hash)
+
+    print(f"Immagini referenziate: {len(references)} ({len(references) - len(jobs)} invariate, "
+          f"{len(jobs)} da elaborare).")
+
+    failures = 0
+    started = time.perf_counter()
+    if jobs:
+        with ProcessPoolExecutor(max_workers=workers or None) as executor:
+            futures = {source: executor.submit(build_derivatives, source,
+                                               hash_text(f"{source_hash}|{DERIVATIVE_PARAMS}")[:12])
+                       for source, (_, source_hash) in jobs.items()}
+            for source, future in futures.items():
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"ERRORE: Derivati non generati per {source}: {e}")
+                    failures += 1
+                    continue
+                results[source] = result
+                cache_source, source_hash = jobs[source]
+                build_manifest.record(BUILD_STAGE, cache_source, source_hash, {
+                    "derivatives": [v["path"] for v in result["variants"]],
+                    "result": result,
+                })
+    elapsed = time.perf_counter() - started
+
+    # --- Pulizia: derivati e voci di manifest non più prodotti ---
+    keep = {v["path"] for result in results.values() for v in result["variants"]}
+    removed, freed = evict_stale(keep)
+    build_manifest.prune_stage(BUILD_STAGE, live_sources)
+    build_manifest.save()
+
+    manifest = {source: _manifest_record(source, result) for source, result in sorted(results.items())}
+    manifest_text = json.dumps(manifest, indent=2, ensure_ascii=False, sort_keys=True)
+    previous = None
+    if os.path.exists(DERIVATIVES_MANIFEST):
+        with open(DERIVATIVES_MANIFEST, 'r', encoding='utf-8') as f:
+            previous = f.read()
+    if manifest_text != previous:
+        with open(DERIVATIVES_MANIFEST, 'w', encoding='utf-8') as f:
+            f.write(manifest_text)
+
+    # --- Report: byte risparmiati per pagina (originale vs WebP per telefono) ---
+    per_page: Dict[str, List[int]] = {}
+    for source, result in results.items():
+        original = os.path.getsize(source)
+        mobile = _mobile_bytes(result)
+        for page_id in references[source]:
+            totals = per_page.setdefault(page_id, [0, 0])
+            totals[0] += original
+            totals[1] += mobile
+
+    print("\n==================================================================")
+    print(f"DERIVATI IMMAGINI: {len(jobs) - failures} elaborate in {elapsed:.2f}s, "
+          f"{removed} derivati obsoleti eliminati ({freed / 1024:.0f} KB).")
+    print(f"{'pagina':<20}{'originali':>12}{'WebP ' + str(MOBILE_WIDTH) + 'w':>12}{'risparmio':>12}")
+    total_original = total_mobile = 0
+    for page_id, (original, mobile) in sorted(per_page.items()):
+        total_original += original
+        total_mobile += mobile
+        saved = original - mobile
+        print(f"{page_id:<20}{original / 1024:>10.0f}KB{mobile / 1024:>10.0f}KB"
+              f"{saved / 1024:>9.0f}KB ({saved * 100 / original if original else 0:.0f}%)")
+    print(f"{'TOTALE':<20}{total_original / 1024:>10.0f}KB{total_mobile / 1024:>10.0f}KB"
+          f"{(total_original - total_mobile) / 1024:>9.0f}KB")
+    print(f"Manifest per main.js: {DERIVATIVES_MANIFEST}")
+    print("==================================================================")
+    return failures == 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Genera i derivati responsive (WebP/JPEG) delle immagini.")
+    parser.add_argument("--workers", type=int, default=0, help="Processi in parallelo (default: numero di CPU).")
+    parser.add_argument("--force", action="store_true", help="Rigenera anche i derivati già aggiornati.")
+    args = parser.parse_args()
+
+    sys.exit(0 if build_all(args.workers, args.force) else 1)
@@ -0,0 +1,257 @@
+import os
+import re
+import sys
+import json
+import struct
+import html
+from typing import Dict, Optional, Tuple
+
+from translation_store import TranslationStore
+
+# =================================================================
+# DIMENSIONI INTRINSECHE DELLE IMMAGINI (senza decodifica)
+# =================================================================
+# Le <img> senza width/height provocano spostamenti del layout mentre la
+# pagina si carica, e senza loading="lazy" anche le foto in fondo alla
+# pagina vengono scaricate subito. Questa fase:
+#   - legge larghezza e altezza dalle sole intestazioni dei file
+#     (JPEG, PNG, GIF, WebP, BMP: pochi byte, nessuna decodifica);
+#   - aggiunge width/height/loading/decoding a ogni <img> dei frammenti;
+#   - registra 'imageSizeN' accanto a ogni 'imageSourceN' in texts.json,
+#     usato da main.js per le immagini della pagina.
+
+TRANSLATIONS_DIR = os.path.join("data", "translations")
+TEXTS_JSON_FILENAME = "texts.json"
+# Cartella delle immagini imageSourceN (come in main.js)
+ASSETS_IMAGES_DIR = "Assets/images"
+# Cartelle dei frammenti HTML da aggiornare
+FRAGMENT_DIRS = ("text_files", "HTML_OUTPUT")
+MAX_IMAGE_SOURCES = 5
+# Prefisso della chiave con le dimensioni: NON deve iniziare con 'imageSource',
+# altrimenti sync_config.py la tratterebbe come chiave dinamica da svuotare
+IMAGE_SIZE_KEY_PREFIX = "imageSize"
+
+# Attributi aggiunti ai tag <img> (quelli già presenti non vengono toccati)
+IMG_LOADING_ATTRIBUTES = (("loading", "lazy"), ("decoding", "async"))
+
+IMG_TAG_REGEX = re.compile(r'<img\b[^<>]*>', re.IGNORECASE)
+ATTRIBUTE_REGEX = re.compile(r'([a-zA-Z_:][-a-zA-Z0-9_:.]*)(?:\s*=\s*("[^"]*"|\'[^\']*\'|[^\s"\'=<>`]+))?')
+
+# Marker JPEG "Start Of Frame" che contengono le dimensioni (esclusi DHT/JPG/DAC)
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+# Orientamenti EXIF che scambiano larghezza e altezza (rotazioni di 90°)
+EXIF_TRANSPOSED_ORIENTATIONS = {5, 6, 7, 8}
+EXIF_ORIENTATION_TAG = 0x0112
+
+
+def _jpeg_exif_orientation(segment: bytes) -> int:
+    """Orientamento dal segmento APP1 'Exif' (1 se assente o illeggibile)."""
+    if not segment.startswith(b"Exif\x00\x00") or len(segment) < 14:
+        return 1
+    tiff = segment[6:]
+    endian = {b"II": "<", b"MM": ">"}.get(tiff[:2])
+    if not endian:
+        return 1
+    try:
+        ifd_offset = struct.unpack(endian + "I", tiff[4:8])[0]
+        count = struct.unpack(endian + "H", tiff[ifd_offset:ifd_offset + 2])[0]
+        for i in range(count):
+            entry = tiff[ifd_offset + 2 + 12 * i: ifd_offset + 14 + 12 * i]
+            tag, _, _ = struct.unpack(endian + "HHI", entry[:8])
+            if tag == EXIF_ORIENTATION_TAG:
+                return struct.unpack(endian + "H", entry[8:10])[0]
+    except struct.error:
+        pass
+    return 1
+
+
+def _jpeg_size(f) -> Optional[Tuple[int, int]]:
+    """Scorre i segmenti JPEG fino al primo SOF, saltando i dati con seek()."""
+    orientation = 1
+    f.seek(2)
+    while True:
+        byte = f.read(1)
+        while byte and byte != b"\xff":
+            byte = f.read(1)
+        while byte == b"\xff":
+            byte = f.read(1)
+        if not byte:
+            return None
+        marker = byte[0]
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            continue  # marker senza lunghezza
+        length_bytes = f.read(2)
+        if len(length_bytes) < 2:
+            return None
+        length = struct.unpack(">H", length_bytes)[0]
+        if marker in JPEG_SOF_MARKERS:
+            data = f.read(5)
+            if len(data) < 5:
+                return None
+            height, width = struct.unpack(">HH", data[1:5])
+            if orientation in EXIF_TRANSPOSED_ORIENTATIONS:
+                width, height = height, width
+            return width, height
+        if marker == 0xE1:
+            segment = f.read(length - 2)
+            if orientation == 1:
+                orientation = _jpeg_exif_orientation(segment)
+        else:
+            f.seek(length - 2, os.SEEK_CUR)
+
+
+def read_image_size(path: str) -> Optional[Tuple[int, int]]:
+    """
+    Larghezza e altezza (già ruotate secondo l'EXIF per i JPEG) lette dalle
+    intestazioni del file. None se il formato non è riconosciuto.
+    """
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(32)
+            if head.startswith(b"\x89PNG\r\n\x1a\n") and head[12:16] == b"IHDR":
+                return struct.unpack(">II", head[16:24])
+            if head[:6] in (b"GIF87a", b"GIF89a"):
+                return struct.unpack("<HH", head[6:10])
+            if head.startswith(b"BM"):
+                width, height = struct.unpack("<ii", head[18:26])
+                return width, abs(height)
+            if head.startswith(b"RIFF") and head[8:12] == b"WEBP":
+                chunk = head[12:16]
+                if chunk == b"VP8 ":
+                    width, height = struct.unpack("<HH", head[26:30])
+                    return width & 0x3FFF, height & 0x3FFF
+                if chunk == b"VP8L":
+                    bits = struct.unpack("<I", head[21:25])[0]
+                    return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+                if chunk == b"VP8X":
+                    return (int.from_bytes(head[24:27], "little") + 1,
+                            int.from_bytes(head[27:30], "little") + 1)
+                return None
+            if head.startswith(b"\xff\xd8"):
+                return _jpeg_size(f)
+    except (OSError, struct.error) as e:
+        print(f"ATTENZIONE: Impossibile leggere le dimensioni di {path}: {e}")
+    return None
+
+
+class ImageSizeCache:
+    """Dimensioni già lette nella stessa esecuzione (la stessa foto compare in più lingue)."""
+
+    def __init__(self):
+        self.sizes: Dict[str, Optional[Tuple[int, int]]] = {}
+
+    def get(self, path: str) -> Optional[Tuple[int, int]]:
+        path = os.path.normpath(path)
+        if path not in self.sizes:
+            self.sizes[path] = read_image_size(path) if os.path.isfile(path) else None
+        return self.sizes[path]
+
+
+def _resolve_src(src: str, fragment_dir: str) -> Optional[str]:
+    """Percorso su disco di un src: relativo alla radice del sito o alla cartella del frammento."""
+    src = html.unescape(src).split("?", 1)[0].split("#", 1)[0]
+    if not src or "://" in src or src.startswith("data:"):
+        return None
+    src = src.lstrip("/")
+    for candidate in (src, os.path.join(fragment_dir, src)):
+        if os.path.isfile(candidate):
+            return candidate
+    return None
+
+
+def annotate_img_tags(content: str, fragment_dir: str, sizes: ImageSizeCache) -> Tuple[str, int]:
+    """
+    Aggiunge width/height (se leggibili) e loading/decoding ai tag <img>.
+    Restituisce (nuovo contenuto, tag modificati). Idempotente.
+    """
+    changed = 0
+
+    def replace(match):
+        nonlocal changed
+        tag = match.group(0)
+        attributes = {m.group(1).lower(): m.group(2) for m in ATTRIBUTE_REGEX.finditer(tag[4:])}
+        additions = []
+        src = attributes.get("src")
+        if src and ("width" not in attributes or "height" not in attributes):
+            path = _resolve_src(src.strip("\"'"), fragment_dir)
+            size = sizes.get(path) if path else None
+            if size:
+                additions += [f'{name}="{value}"' for name, value in zip(("width", "height"), size)
+                              if name not in attributes]
+        additions += [f'{name}="{value}"' for name, value in IMG_LOADING_ATTRIBUTES if name not in attributes]
+        if not additions:
+            return tag
+        changed += 1
+        end = len(tag) - (2 if tag.endswith("/>") else 1)
+        return f'{tag[:end].rstrip()} {" ".join(additions)}{tag[end:]}'
+
+    return IMG_TAG_REGEX.sub(replace, content), changed
+
+
+def process_fragment_images(sizes: ImageSizeCache) -> int:
+    """Aggiorna i tag <img> di tutti i frammenti. Restituisce i file riscritti."""
+    rewritten = 0
+    for directory in FRAGMENT_DIRS:
+        if not os.path.isdir(directory):
+            continue
+        for filename in sorted(os.listdir(directory)):
+            if not filename.endswith(".html"):
+                continue
+            filepath = os.path.join(directory, filename)
+            with open(filepath, 'rb') as f:
+                original = f.read()
+            content, changed = annotate_img_tags(original.decode('utf-8'), directory, sizes)
+            if changed:
+                with open(filepath, 'wb') as f:
+                    f.write(content.encode('utf-8'))
+                print(f"  - {filepath}: {changed} immagini aggiornate")
+                rewritten += 1
+    return rewritten
+
+
+def record_image_sizes(sizes: ImageSizeCache) -> int:
+    """
+    Scrive 'imageSizeN' ("LARGHEZZAxALTEZZA", vuoto se l'immagine manca) subito
+    dopo ogni 'imageSourceN' in tutti i texts.json. Restituisce i file riscritti.
+    """
+    if not os.path.isdir(TRANSLATIONS_DIR):
+        print(f"ERRORE: Directory delle traduzioni non trovata: {TRANSLATIONS_DIR}")
+        return 0
+
+    store = TranslationStore(TRANSLATIONS_DIR)
+    for lang in store.languages():
+        try:
+            texts = store.texts(lang)
+        except (json.JSONDecodeError, OSError) as e:
+            print(f"ERRORE: Impossibile leggere {store.path(lang)}: {e}")
+            continue
+        for page_id, page_data in texts.items():
+            if not isinstance(page_data, dict) or not any(
+                    f"imageSource{i}" in page_data for i in range(1, MAX_IMAGE_SOURCES + 1)):
+                continue
+            inserts = {}
+            for key, value in page_data.items():
+                if key.startswith("imageSource") and key[len("imageSource"):].isdigit():
+                    size = sizes.get(os.path.join(ASSETS_IMAGES_DIR, value)) if value else None
+                    inserts[key] = {IMAGE_SIZE_KEY_PREFIX + key[len("imageSource"):]: f"{size[0]}x{size[1]}" if size else ""}
+                    if value and not size:
+                        print(f"AVVISO: Dimensioni non disponibili per '{value}' ({lang}/{page_id}).")
+            # Le imageSizeN vengono sempre riscritte accanto alla loro imageSourceN
+            store.place_keys(lang, page_id, inserts,
+                             [key for key in page_data if key.startswith(IMAGE_SIZE_KEY_PREFIX)])
+
+    written = store.flush()
+    for texts_path in written:
+        print(f"  - {texts_path}: dimensioni aggiornate")
+    return len(written)
+
+
+if __name__ == "__main__":
+    print("Lettura delle dimensioni delle immagini (solo intestazioni)...")
+    size_cache = ImageSizeCache()
+    fragments = process_fragment_images(size_cache)
+    texts_files = record_image_sizes(size_cache)
+    unreadable = sum(1 for size in size_cache.sizes.values() if size is None)
+    print(f"✅ Completato: {len(size_cache.sizes)} immagini lette, {fragments} frammenti e "
+          f"{texts_files} texts.json aggiornati.")
+    sys.exit(1 if unreadable else 0)
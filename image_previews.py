@@ -0,0 +1,179 @@
+import os
+import sys
+import json
+import base64
+import argparse
+from io import BytesIO
+from typing import Dict, Optional
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from build_cache import BuildManifest, hash_text
+from image_dimensions import IMAGE_SIZE_KEY_PREFIX
+from translation_store import TranslationStore
+
+# =================================================================
+# ANTEPRIME LQIP (Low Quality Image Placeholder) NEI TEXTS.JSON
+# =================================================================
+# Finché headImage e le immagini di sezione non sono scaricate la pagina
+# resta vuota. Per ogni immagine referenziata viene calcolata un'anteprima
+# di pochi pixel (WebP, ~100-200 byte in base64) salvata come data URI
+# accanto alla chiave dell'immagine:
+#   headImage    -> headImagePreview
+#   imageSourceN -> imagePreviewN
+# main.js la usa come sfondo dell'<img>: il primo disegno mostra subito i
+# colori dell'immagine, senza richieste aggiuntive (texts.json è già scaricato).
+
+TRANSLATIONS_DIR = os.path.join("data", "translations")
+TEXTS_JSON_FILENAME = "texts.json"
+# Cartelle delle immagini, come le costruisce main.js
+ASSETS_IMAGES_DIR = "Assets/images"
+PUBLIC_IMAGES_DIR = "public/images"
+# Nome della fase nel manifest di build (build_cache.py)
+BUILD_STAGE = "image_previews"
+MAX_IMAGE_SOURCES = 5
+
+# Lato lungo dell'anteprima in pixel e qualità WebP
+PREVIEW_SIZE = 20
+PREVIEW_QUALITY = 50
+# Fa parte della chiave di cache: cambiare i parametri rigenera le anteprime
+PREVIEW_PARAMS = f"size={PREVIEW_SIZE};webp={PREVIEW_QUALITY};v=1"
+
+# Chiave immagine -> (cartella dell'immagine, chiave dell'anteprima).
+# Le chiavi delle anteprime NON iniziano con 'imageSource': sync_config.py
+# svuoterebbe i valori delle chiavi con quel prefisso.
+PREVIEW_KEYS = {"headImage": (PUBLIC_IMAGES_DIR, "headImagePreview")}
+PREVIEW_KEYS.update({f"imageSource{i}": (ASSETS_IMAGES_DIR, f"imagePreview{i}")
+                     for i in range(1, MAX_IMAGE_SOURCES + 1)})
+PREVIEW_KEY_NAMES = {preview_key for _, preview_key in PREVIEW_KEYS.values()}
+
+
+def area_downsample(pixels: np.ndarray, width: int, height: int) -> np.ndarray:
+    """
+    Riduzione per media d'area, vettorizzata: con l'immagine integrale
+    (somme cumulative) la somma di ogni blocco costa quattro letture.
+    """
+    source_height, source_width = pixels.shape[:2]
+    integral = np.pad(pixels.astype(np.float64).cumsum(0).cumsum(1), ((1, 0), (1, 0), (0, 0)))
+    ys = np.arange(height + 1) * source_height // height
+    xs = np.arange(width + 1) * source_width // width
+    sums = (integral[ys[1:]][:, xs[1:]] - integral[ys[:-1]][:, xs[1:]]
+            - integral[ys[1:]][:, xs[:-1]] + integral[ys[:-1]][:, xs[:-1]])
+    areas = np.outer(np.diff(ys), np.diff(xs))[..., None]
+    return np.clip(np.rint(sums / areas), 0, 255).astype(np.uint8)
+
+
+def compute_preview(path: str) -> str:
+    """Anteprima dell'immagine come data URI WebP di PREVIEW_SIZE pixel sul lato lungo."""
+    with Image.open(path) as original:
+        # Decodifica JPEG già ridotta (1/8): basta qualche decina di pixel
+        original.draft("RGB", (PREVIEW_SIZE * 4, PREVIEW_SIZE * 4))
+        image = ImageOps.exif_transpose(original)
+        if image.mode != "RGB":
+            rgba = image.convert("RGBA")
+            image = Image.new("RGB", rgba.size, (255, 255, 255))
+            image.paste(rgba, mask=rgba.getchannel("A"))
+        pixels = np.asarray(image)
+
+    source_height, source_width = pixels.shape[:2]
+    scale = PREVIEW_SIZE / max(source_width, source_height)
+    width = max(1, min(source_width, round(source_width * scale)))
+    height = max(1, min(source_height, round(source_height * scale)))
+
+    buffer = BytesIO()
+    Image.fromarray(area_downsample(pixels, width, height)).save(buffer, format="WEBP", quality=PREVIEW_QUALITY)
+    return "data:image/webp;base64," + base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+class PreviewCache:
+    """Anteprime calcolate o riprese dal manifest di build (per hash della sorgente)."""
+
+    def __init__(self, force: bool = False):
+        self.manifest = BuildManifest()
+        self.force = force
+        self.params_tag = hash_text(PREVIEW_PARAMS)[:8]
+        self.previews: Dict[str, Optional[str]] = {}
+        self.computed = 0
+
+    def get(self, path: str) -> Optional[str]:
+        path = os.path.normpath(path).replace(os.sep, "/")
+        if path in self.previews:
+            return self.previews[path]
+        preview = None
+        if os.path.isfile(path):
+            cache_source = f"{path}#{self.params_tag}"
+            source_hash = self.manifest.source_hash(BUILD_STAGE, cache_source)
+            if not self.force and self.manifest.is_up_to_date(BUILD_STAGE, cache_source, source_hash):
+                preview = self.manifest.entry(BUILD_STAGE, cache_source)["outputs"]["result"]["preview"]
+            else:
+                try:
+                    preview = compute_preview(path)
+                except Exception as e:
+                    print(f"ERRORE: Anteprima non calcolata per {path}: {e}")
+                else:
+                    self.manifest.record(BUILD_STAGE, cache_source, source_hash, {"result": {"preview": preview}})
+                    self.computed += 1
+        self.previews[path] = preview
+        return preview
+
+    def save(self):
+        # Le voci delle immagini non più referenziate (o con altri parametri) vengono dimenticate
+        self.manifest.prune_stage(BUILD_STAGE, [f"{path}#{self.params_tag}" for path in self.previews])
+        self.manifest.save()
+
+
+def record_previews(previews: PreviewCache) -> int:
+    """
+    Scrive le anteprime subito dopo headImage/imageSourceN in tutti i texts.json
+    (valore vuoto se l'immagine manca). Restituisce i file riscritti.
+    """
+    if not os.path.isdir(TRANSLATIONS_DIR):
+        print(f"ERRORE: Directory delle traduzioni non trovata: {TRANSLATIONS_DIR}")
+        return 0
+
+    store = TranslationStore(TRANSLATIONS_DIR)
+    for lang in store.languages():
+        try:
+            texts = store.texts(lang)
+        except (json.JSONDecodeError, OSError) as e:
+            print(f"ERRORE: Impossibile leggere {store.path(lang)}: {e}")
+            continue
+        for page_id, page_data in texts.items():
+            if not isinstance(page_data, dict) or not any(key in page_data for key in PREVIEW_KEYS):
+                continue
+            # L'anteprima va dopo la sua immagine (e dopo imageSizeN, se presente:
+            # stesso ordine che produce image_dimensions.py, così le due fasi non si alternano)
+            inserts = {}
+            for image_key, (image_dir, preview_key) in PREVIEW_KEYS.items():
+                if image_key not in page_data:
+                    continue
+                size_key = image_key.replace("imageSource", IMAGE_SIZE_KEY_PREFIX)
+                anchor = size_key if size_key != image_key and size_key in page_data else image_key
+                image_value = page_data[image_key]
+                preview = previews.get(os.path.join(image_dir, image_value)) if image_value else None
+                inserts[anchor] = {preview_key: preview or ""}
+                if image_value and not preview:
+                    print(f"AVVISO: Anteprima non disponibile per '{image_value}' ({lang}/{page_id}).")
+            store.place_keys(lang, page_id, inserts, PREVIEW_KEY_NAMES)
+
+    written = store.flush()
+    for texts_path in written:
+        print(f"  - {texts_path}: anteprime aggiornate")
+    return len(written)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Calcola le anteprime LQIP delle immagini e le salva nei texts.json.")
+    parser.add_argument("--force", action="store_true", help="Ricalcola anche le anteprime già aggiornate.")
+    args = parser.parse_args()
+
+    preview_cache = PreviewCache(force=args.force)
+    texts_files = record_previews(preview_cache)
+    preview_cache.save()
+
+    sizes = [len(p) for p in preview_cache.previews.values() if p]
+    average = sum(sizes) // len(sizes) if sizes else 0
+    print(f"✅ Completato: {len(preview_cache.previews)} immagini, {preview_cache.computed} anteprime calcolate "
+          f"(media {average} byte), {texts_files} texts.json aggiornati.")
+    sys.exit(0)
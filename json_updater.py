@@ -3,15 +3,21 @@ import sys
 import os
 import re
 
-def update_json_file(lang_code, key_path, input_txt_file):
+from translation_store import TranslationStore
+
+def update_json_file(lang_code, key_path, input_txt_file, store=None):
     """
     Legge un file JSON, aggiorna un valore basandosi sul contenuto di un file .txt.
     1. Esegue la pulizia aggressiva dei riferimenti immagine (anche se circondati da HTML o punti e virgola).
     2. Gestisce la conversione \n -> <br> SOLO per il testo puro.
     3. Utilizza i percorsi assoluti corretti (data/translations/lang).
+    Con uno 'store' condiviso (TranslationStore) la scrittura è rimandata al suo flush().
     """
     script_dir = os.path.dirname(os.path.abspath(__file__))
-    json_path = os.path.join(script_dir, 'data', 'translations', lang_code, 'texts.json')
+    owns_store = store is None
+    if owns_store:
+        store = TranslationStore(os.path.join(script_dir, 'data', 'translations'))
+    json_path = store.path(lang_code)
     
     # --- 1. Leggi il Contenuto Pulito dal file .txt ---
     full_txt_path = os.path.join(script_dir, input_txt_file) 
@@ -27,7 +33,8 @@ def update_json_file(lang_code, key_path, input_txt_file):
         print(f"ERRORE durante la lettura del file TXT: {e}", file=sys.stderr)
         return False
         
-    print(f"DEBUG: Valore RAW letto dal TXT (prime 100 char):\n{new_value[:100].replace('\n', '\\n')}")
+    preview = new_value[:100].replace('\n', '\\n')
+    print(f"DEBUG: Valore RAW letto dal TXT (prime 100 char):\n{preview}")
         
     # --- 2. PULIZIA AGGRESSIVA: Rimuovi i riferimenti a file immagine ---
     
@@ -41,7 +48,8 @@ def update_json_file(lang_code, key_path, input_txt_file):
     # Pulizia degli a capo superflui lasciati dalla rimozione
     cleaned_value = re.sub(r'\n{2,}', '\n\n', cleaned_value)
 
-    print(f"DEBUG: Valore dopo la pulizia immagine (prime 100 char):\n{cleaned_value[:100].replace('\n', '\\n')}")
+    preview = cleaned_value[:100].replace('\n', '\\n')
+    print(f"DEBUG: Valore dopo la pulizia immagine (prime 100 char):\n{preview}")
 
     # --- 3. Conversione Cruciale: \n in <br> (SOLO per testo non HTML) ---
     
@@ -59,41 +67,33 @@ def update_json_file(lang_code, key_path, input_txt_file):
     
     print(f"DEBUG: Valore PRONTO per JSON:\n{html_ready_value}")
 
-    # --- 4. Leggi e Aggiorna il File JSON ---
+    # --- 4. Leggi e Aggiorna il File JSON (caricato una sola volta dallo store) ---
     print(f"DEBUG: Tentativo di leggere il JSON da: {json_path}")
-    try:
-        with open(json_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-    except FileNotFoundError:
+    if not os.path.exists(json_path):
         print(f"ERRORE: File JSON non trovato. Verifica il percorso: {json_path}", file=sys.stderr)
         return False
+    try:
+        store.texts(lang_code)
     except json.JSONDecodeError as e:
         print(f"ERRORE: Il file JSON non è valido ({json_path}): {e}", file=sys.stderr)
         return False
 
     # Aggiorna e Scrivi
-    keys = key_path.split('.')
-    current_data = data
-    
     try:
-        for key in keys[:-1]:
-            current_data = current_data[key]
-            
-        current_data[keys[-1]] = html_ready_value
+        if not store.set_path(lang_code, key_path, html_ready_value):
+            print(f"ERRORE: Chiave non trovata nel JSON: {key_path}", file=sys.stderr)
+            return False
         print(f"DEBUG: Aggiornamento chiave '{key_path}' con nuovo valore OK.")
 
-        print(f"DEBUG: Tentativo di scrittura del JSON modificato in: {json_path}")
-        with open(json_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=4, ensure_ascii=False)
+        if owns_store:
+            print(f"DEBUG: Tentativo di scrittura del JSON modificato in: {json_path}")
+            store.flush()
         
         # Log di successo
         truncated_value = html_ready_value[:60].replace('<br>', ' ').strip()
         print(f"✅ Aggiornato con successo: '{key_path}'. Contenuto: '{truncated_value}...'")
         return True
     
-    except KeyError:
-        print(f"ERRORE: Chiave non trovata nel JSON: {key_path}", file=sys.stderr)
-        return False
     except Exception as e:
         print(f"ERRORE durante la scrittura del file JSON: {e}", file=sys.stderr)
         return False
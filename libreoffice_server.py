@@ -0,0 +1,197 @@
+import os
+import sys
+import time
+import uuid
+import shutil
+import tempfile
+import threading
+import subprocess
+from typing import Optional
+
+# =================================================================
+# ISTANZA LIBREOFFICE "CALDA" PER CONVERSIONI DOCX -> HTML IN SERIE
+# =================================================================
+# Invece di lanciare 'soffice --convert-to' per ogni file (avvio a freddo
+# di diversi secondi ogni volta), avviamo UNA sola istanza headless in ascolto
+# su una pipe locale e le inviamo i documenti tramite il bridge UNO.
+#
+# NOTA: Il modulo 'uno' è disponibile solo nel Python fornito con LibreOffice.
+# Su Windows eseguire lo script con:
+#   "C:\Program Files\LibreOffice\program\python.exe" process_all_pages.py --engine server
+# Se 'uno' non è importabile, UNO_AVAILABLE è False e il chiamante deve
+# ripiegare sulla conversione per-file.
+
+try:
+    import uno
+    from com.sun.star.beans import PropertyValue
+    UNO_AVAILABLE = True
+except ImportError:
+    uno = None
+    PropertyValue = None
+    UNO_AVAILABLE = False
+
+# Filtro di esportazione HTML di Writer (lo stesso usato da '--convert-to html')
+HTML_EXPORT_FILTER = "HTML (StarWriter)"
+# Secondi massimi di attesa per l'avvio del server e per una singola conversione
+STARTUP_TIMEOUT = 60
+CONVERSION_TIMEOUT = 120
+
+
+def _property(name, value):
+    """Crea una PropertyValue UNO (equivalente di un argomento con nome)."""
+    prop = PropertyValue()
+    prop.Name = name
+    prop.Value = value
+    return prop
+
+
+class LibreOfficeServer:
+    """
+    Gestisce un processo soffice headless in ascolto su una pipe UNO.
+    Il processo viene riavviato automaticamente se una conversione si blocca
+    o se il bridge UNO cade. Usare come context manager per garantirne lo
+    spegnimento a fine batch.
+    """
+
+    def __init__(self, soffice_path: str, profile_dir: Optional[str] = None,
+                 conversion_timeout: int = CONVERSION_TIMEOUT):
+        self.soffice_path = soffice_path
+        self.conversion_timeout = conversion_timeout
+        self.pipe_name = f"quartiereporto_{uuid.uuid4().hex[:12]}"
+        # Profilo utente privato: evita conflitti con un LibreOffice già aperto
+        # dall'utente (e, più avanti, con altre istanze in parallelo).
+        self._owns_profile = profile_dir is None
+        self.profile_dir = profile_dir or tempfile.mkdtemp(prefix="lo_profile_")
+        self.process = None
+        self.desktop = None
+        self.restarts = 0
+
+    # --- Ciclo di vita del processo ---
+
+    def start(self):
+        """Avvia soffice in ascolto sulla pipe e attende che il bridge UNO risponda."""
+        if not UNO_AVAILABLE:
+            raise RuntimeError("Modulo 'uno' non disponibile: eseguire con il Python di LibreOffice.")
+
+        profile_url = uno.systemPathToFileUrl(os.path.abspath(self.profile_dir))
+        command = [
+            self.soffice_path,
+            '--headless', '--invisible', '--nologo', '--norestore', '--nodefault',
+            f'--accept=pipe,name={self.pipe_name};urp;StarOffice.ComponentContext',
+            f'-env:UserInstallation={profile_url}',
+        ]
+        print(f"Avvio server LibreOffice (pipe: {self.pipe_name})...")
+        self.process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+        local_ctx = uno.getComponentContext()
+        resolver = local_ctx.ServiceManager.createInstanceWithContext(
+            "com.sun.star.bridge.UnoUrlResolver", local_ctx)
+        connection_url = f"uno:pipe,name={self.pipe_name};urp;StarOffice.ComponentContext"
+
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        while True:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"soffice è terminato in avvio (codice {self.process.returncode}).")
+            try:
+                ctx = resolver.resolve(connection_url)
+                self.desktop = ctx.ServiceManager.createInstanceWithContext("com.sun.star.frame.Desktop", ctx)
+                print("Server LibreOffice pronto.")
+                return
+            except Exception:
+                if time.monotonic() > deadline:
+                    self._kill()
+                    raise RuntimeError(f"Il server LibreOffice non ha risposto entro {STARTUP_TIMEOUT} secondi.")
+                time.sleep(0.25)
+
+    def _kill(self):
+        """Termina il processo soffice senza attendere il bridge UNO."""
+        self.desktop = None
+        if self.process and self.process.poll() is None:
+            self.process.kill()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                pass
+        self.process = None
+
+    def restart(self):
+        """Riavvia il server dopo un blocco o una caduta del bridge."""
+        print("ATTENZIONE: Riavvio del server LibreOffice...")
+        self._kill()
+        self.restarts += 1
+        self.start()
+
+    def stop(self):
+        """Chiude LibreOffice in modo ordinato (con kill di sicurezza) e pulisce il profilo temporaneo."""
+        if self.desktop is not None:
+            try:
+                self.desktop.terminate()
+            except Exception:
+                # Il bridge si chiude insieme al processo: l'eccezione è attesa
+                pass
+        if self.process is not None:
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                pass
+        self._kill()
+        if self._owns_profile:
+            shutil.rmtree(self.profile_dir, ignore_errors=True)
+        print("Server LibreOffice arrestato.")
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
+
+    # --- Conversione ---
+
+    def _convert_once(self, docx_path: str, html_output_path: str):
+        """Carica il documento nell'istanza attiva e lo esporta in HTML."""
+        source_url = uno.systemPathToFileUrl(os.path.abspath(docx_path))
+        target_url = uno.systemPathToFileUrl(os.path.abspath(html_output_path))
+        document = self.desktop.loadComponentFromURL(
+            source_url, "_blank", 0, (_property("Hidden", True), _property("ReadOnly", True)))
+        if document is None:
+            raise RuntimeError("LibreOffice non è riuscito ad aprire il documento.")
+        try:
+            document.storeToURL(target_url, (_property("FilterName", HTML_EXPORT_FILTER),))
+        finally:
+            document.close(True)
+
+    def convert(self, docx_path: str, html_output_path: str) -> bool:
+        """
+        Converte un DOCX in HTML. Se la conversione supera il timeout o il bridge
+        cade, il server viene riavviato e la conversione ritentata una volta.
+        """
+        for attempt in (1, 2):
+            if self.process is None or self.process.poll() is not None:
+                self.restart()
+
+            outcome = {}
+
+            def worker():
+                try:
+                    self._convert_once(docx_path, html_output_path)
+                    outcome['ok'] = True
+                except Exception as e:
+                    outcome['error'] = e
+
+            thread = threading.Thread(target=worker, daemon=True)
+            thread.start()
+            thread.join(self.conversion_timeout)
+
+            if thread.is_alive():
+                print(f"ERRORE: Conversione bloccata oltre {self.conversion_timeout}s (tentativo {attempt}).", file=sys.stderr)
+                self.restart()
+                continue
+            if outcome.get('ok') and os.path.exists(html_output_path):
+                return True
+
+            print(f"ERRORE CONVERSIONE (server, tentativo {attempt}): {outcome.get('error')}", file=sys.stderr)
+            # Un errore del bridge (es. DisposedException) richiede un nuovo processo
+            self.restart()
+        return False
@@ -120,15 +120,157 @@ async function fetchFileContent(filePath) {
 }
 
 
+// ===========================================
+// IMMAGINI RESPONSIVE (derivati WebP/JPEG)
+// ===========================================
+// Il manifest è generato da image_derivatives.py: per ogni immagine
+// (chiave = percorso usato qui, es. "Assets/images/cavaticcio/x.jpg")
+// elenca i derivati per formato e larghezza.
+
+const DERIVATIVES_MANIFEST_PATH = 'Assets/derivatives/manifest.json';
+let derivativesManifestPromise = null;
+
+/**
+ * Carica il manifest dei derivati una sola volta per sessione.
+ * @returns {Promise<Object>} Il manifest (vuoto se assente o non leggibile).
+ */
+function loadDerivativesManifest() {
+    if (!derivativesManifestPromise) {
+        derivativesManifestPromise = fetch(DERIVATIVES_MANIFEST_PATH)
+            .then(response => response.ok ? response.json() : {})
+            .catch(() => ({}));
+    }
+    return derivativesManifestPromise;
+}
+
+// Il supporto WebP viene verificato una volta (tutti i browser recenti lo hanno)
+const SUPPORTS_WEBP = (() => {
+    try {
+        return document.createElement('canvas').toDataURL('image/webp').startsWith('data:image/webp');
+    } catch (e) {
+        return false;
+    }
+})();
+
+/**
+ * Risolve i segmenti '.' e '..' di un percorso relativo (es. i valori dei
+ * texts.json riscritti da dedup_assets.py: "Assets/images/../../public/images/x.jpg").
+ * @param {string} path Il percorso da normalizzare.
+ * @returns {string} Il percorso normalizzato (chiave del manifest dei derivati).
+ */
+function normalizeAssetPath(path) {
+    const parts = [];
+    for (const part of path.split('/')) {
+        if (part === '..') {
+            parts.pop();
+        } else if (part && part !== '.') {
+            parts.push(part);
+        }
+    }
+    return parts.join('/');
+}
+
+/**
+ * Imposta src e, se disponibili, srcset/sizes dai derivati responsive.
+ * L'originale resta in src come fallback.
+ * @param {HTMLImageElement} imageElement L'elemento <img>.
+ * @param {string} imagePath Il percorso dell'originale.
+ * @param {Object} manifest Il manifest dei derivati.
+ * @param {string} sizes Il valore dell'attributo sizes.
+ */
+function applyResponsiveImage(imageElement, imagePath, manifest, sizes = '100vw') {
+    const entry = imagePath ? manifest[normalizeAssetPath(imagePath)] : null;
+    const candidates = entry ? entry[SUPPORTS_WEBP ? 'webp' : 'jpeg'] : null;
+
+    if (candidates && candidates.length) {
+        imageElement.srcset = candidates.map(c => `${c.src} ${c.w}w`).join(', ');
+        imageElement.sizes = sizes;
+    } else {
+        imageElement.removeAttribute('srcset');
+        imageElement.removeAttribute('sizes');
+    }
+    imageElement.src = imagePath;
+}
+
+/**
+ * Mostra l'anteprima LQIP (data URI da image_previews.py) come sfondo
+ * dell'immagine finché l'originale non è caricato: nessuna richiesta in più.
+ * @param {HTMLImageElement} imageElement L'elemento <img>.
+ * @param {string} preview Il data URI dell'anteprima (vuoto se assente).
+ */
+function applyImagePreview(imageElement, preview) {
+    if (!preview || (imageElement.complete && imageElement.naturalWidth > 0)) {
+        imageElement.style.backgroundImage = '';
+        return;
+    }
+    imageElement.style.backgroundImage = `url("${preview}")`;
+    imageElement.style.backgroundSize = 'cover';
+    imageElement.style.backgroundPosition = 'center';
+    imageElement.addEventListener('load', () => {
+        imageElement.style.backgroundImage = '';
+    }, { once: true });
+}
+
+
 // ===========================================
 // FUNZIONI AUDIO (Corrette per argomenti locali)
 // ===========================================
 
+// Riproduzione a segmenti (mp3_segmenter.py): parte dopo il primo segmento e scarica
+// i successivi in sequenza. Senza MediaSource per audio/mpeg si usa il file intero.
+const SUPPORTS_MSE_MP3 = typeof MediaSource !== 'undefined' && MediaSource.isTypeSupported('audio/mpeg');
+
+const appendSegment = function (sourceBuffer, data) {
+    return new Promise((resolve, reject) => {
+        sourceBuffer.addEventListener('updateend', resolve, { once: true });
+        sourceBuffer.addEventListener('error', reject, { once: true });
+        sourceBuffer.appendBuffer(data);
+    });
+};
+
+const attachSegmentedAudio = function (audioPlayer) {
+    const playlistUrl = audioPlayer.dataset.playlist;
+    const fallbackSrc = audioPlayer.dataset.fallbackSrc;
+    delete audioPlayer.dataset.playlist;
+
+    const mediaSource = new MediaSource();
+    const objectUrl = URL.createObjectURL(mediaSource);
+    audioPlayer.src = objectUrl;
+    mediaSource.addEventListener('sourceopen', async () => {
+        URL.revokeObjectURL(objectUrl);
+        try {
+            const playlist = await (await fetch(playlistUrl)).json();
+            const sourceBuffer = mediaSource.addSourceBuffer('audio/mpeg');
+            sourceBuffer.mode = 'sequence';
+            mediaSource.duration = playlist.duration;
+            const fetchSegment = (segment) => fetch(segment.src).then(response => {
+                if (!response.ok) throw new Error(`${segment.src}: ${response.status}`);
+                return response.arrayBuffer();
+            });
+            // Il segmento successivo si scarica mentre il precedente viene accodato
+            let pending = fetchSegment(playlist.segments[0]);
+            for (let i = 0; i < playlist.segments.length; i++) {
+                const data = await pending;
+                pending = i + 1 < playlist.segments.length ? fetchSegment(playlist.segments[i + 1]) : null;
+                await appendSegment(sourceBuffer, data);
+            }
+            mediaSource.endOfStream();
+        } catch (error) {
+            console.error('Riproduzione a segmenti non riuscita, uso il file intero:', error);
+            audioPlayer.src = fallbackSrc;
+            audioPlayer.play();
+        }
+    }, { once: true });
+};
+
 const toggleAudioPlayback = function (audioPlayer, playButton) {
     const currentPlayText = playButton.dataset.playText || "Ascolta";
     const currentPauseText = playButton.dataset.pauseText || "Pausa";
 
     if (audioPlayer.paused) {
+        if (audioPlayer.dataset.playlist) {
+            attachSegmentedAudio(audioPlayer);
+        }
         audioPlayer.play();
         playButton.textContent = currentPauseText;
         playButton.classList.replace('play-style', 'pause-style');
@@ -352,9 +494,11 @@ async function loadContent(lang) {
         updateHTMLContent('headerTitle', pageData.pageTitle);
 
         // AGGIORNAMENTO IMMAGINE DI FONDO TESTATA
+        const derivativesManifest = await loadDerivativesManifest();
         const headerImage = document.getElementById('headImage');
         if (headerImage && pageData.headImage) {
-            headerImage.src = `public/images/${pageData.headImage}`; // CORRETTO (usa headImage)
+            applyResponsiveImage(headerImage, `public/images/${pageData.headImage}`, derivativesManifest); // CORRETTO (usa headImage)
+            applyImagePreview(headerImage, pageData.headImagePreview);
             headerImage.alt = pageData.pageTitle || "Immagine di testata";
         }
 
@@ -387,11 +531,28 @@ async function loadContent(lang) {
                 currentAudioPlayer.pause();
                 currentAudioPlayer.currentTime = 0;
             }
-            currentPlayButton.textContent = pageData.playAudioButton;
-            currentPlayButton.dataset.playText = pageData.playAudioButton;
+            // Durata già nota da texts.json (mp3_index.py): niente download finché non si preme play
+            let playText = pageData.playAudioButton;
+            if (pageData.audioDuration) {
+                const totalSeconds = Math.round(pageData.audioDuration);
+                const seconds = String(totalSeconds % 60).padStart(2, '0');
+                playText = `${playText} (${Math.floor(totalSeconds / 60)}:${seconds})`;
+            }
+            currentPlayButton.textContent = playText;
+            currentPlayButton.dataset.playText = playText;
             currentPlayButton.dataset.pauseText = pageData.pauseAudioButton;
+            currentPlayButton.style.display = '';
+            currentAudioPlayer.preload = pageData.audioDuration ? 'none' : 'metadata';
             currentAudioPlayer.src = `Assets/Audio/${pageData.audioSource}`; // <-- CORREZIONE
-            currentAudioPlayer.load();
+            currentAudioPlayer.dataset.fallbackSrc = currentAudioPlayer.src;
+            if (SUPPORTS_MSE_MP3 && pageData.audioPlaylist) {
+                currentAudioPlayer.dataset.playlist = pageData.audioPlaylist;
+            } else {
+                delete currentAudioPlayer.dataset.playlist;
+            }
+            if (!pageData.audioDuration) {
+                currentAudioPlayer.load();
+            }
             currentPlayButton.classList.remove('pause-style');
             currentPlayButton.classList.add('play-style');
         } else if (currentPlayButton) {
@@ -408,8 +569,24 @@ async function loadContent(lang) {
             const fullImagePath = imageSource ? `Assets/images/${imageSource}` : '';
 
             if (imageElement) {
-                // USA IL PERCORSO COMPLETO
-                imageElement.src = fullImagePath;
+                // Dimensioni intrinseche (da image_dimensions.py): riservano lo spazio
+                // prima del download ed evitano lo spostamento del layout
+                const imageSize = pageData[`imageSize${i}`]; // es. "1472x662"
+                const [imageWidth, imageHeight] = imageSize ? imageSize.split('x') : [];
+                if (imageWidth && imageHeight) {
+                    imageElement.width = Number(imageWidth);
+                    imageElement.height = Number(imageHeight);
+                } else {
+                    imageElement.removeAttribute('width');
+                    imageElement.removeAttribute('height');
+                }
+                // Le immagini della pagina sono sotto la testata: caricamento differito
+                imageElement.loading = 'lazy';
+                imageElement.decoding = 'async';
+
+                // USA IL PERCORSO COMPLETO (con i derivati responsive, se presenti)
+                applyResponsiveImage(imageElement, fullImagePath, derivativesManifest);
+                applyImagePreview(imageElement, pageData[`imagePreview${i}`]);
                 // Nasconde l'elemento se non c'è una sorgente
                 imageElement.style.display = imageSource ? 'block' : 'none';
                 imageElement.alt = pageData.pageTitle || `Immagine ${i}`;
@@ -3,6 +3,8 @@ import os
 import sys
 from typing import Dict, Any
 
+from translation_store import TranslationStore
+
 # Definizioni dei percorsi
 # Directory base che contiene le cartelle delle lingue (es. 'it', 'en')
 BASE_TRANSLATION_DIR = os.path.join('data', 'translations') 
@@ -29,17 +31,6 @@ def load_json(filepath: str) -> Dict[str, Any] | None:
         print(f"ERRORE inatteso durante il caricamento di '{filepath}': {e}")
         return None
 
-def save_json(filepath: str, data: Dict[str, Any]):
-    """Salva il file JSON con gestione degli errori."""
-    try:
-        # Crea la directory se non esiste (es. 'data/translations/it')
-        os.makedirs(os.path.dirname(filepath), exist_ok=True)
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=4)
-        print(f"✅ File '{filepath}' salvato con successo.")
-    except Exception as e:
-        print(f"ERRORE: Impossibile salvare '{filepath}': {e}")
-
 def main():
     """
     Funzione principale. Applica gli override manuali per la PAGE_ID passata, 
@@ -65,48 +56,46 @@ def main():
         sys.exit(0)
     
     global_modified = False
+    # I texts.json vengono letti una volta e scritti una volta alla fine
+    store = TranslationStore(BASE_TRANSLATION_DIR)
     
     # 3. Itera su tutte le lingue definite negli override per la pagina corrente
     for lang, overrides in page_overrides.items():
         lang = lang.lower() # Assicura che la lingua sia minuscola per il path
         
-        # 3a. Costruisci il percorso del file texts.json specifico per lingua
+        # 3a. Percorso del file texts.json specifico per lingua
         # Esempio: data/translations/it/texts.json
-        lang_texts_path = os.path.join(BASE_TRANSLATION_DIR, lang, TEXTS_FILENAME)
+        lang_texts_path = store.path(lang)
         
         print(f"\nProcessing lingua '{lang}' | Target file: {lang_texts_path}")
         
-        # 3b. Carica il file texts.json specifico (Target). 
-        texts_data = load_json(lang_texts_path)
-        if texts_data is None:
+        # 3b. Carica il file texts.json specifico (Target); se manca parte vuoto.
+        try:
+            texts_data = store.texts(lang)
+        except Exception as e:
+            print(f"ERRORE: Impossibile decodificare il JSON da '{lang_texts_path}': {e}")
             print(f"AVVISO: Impossibile caricare o inizializzare '{lang_texts_path}'. Saltato.")
             continue
 
         # 3c. Assicurati che la pagina esista nel file texts.json (specifico per lingua)
         if page_id not in texts_data:
             print(f"AVVISO: La pagina '{page_id}' non esiste in '{lang_texts_path}'. Aggiungo il nodo.")
-            texts_data[page_id] = {}
         
-        # 3d. Applica gli override
-        page_data = texts_data[page_id]
-        applied_keys = []
-        modified = False
-
-        for key, value in overrides.items():
-            # Applica l'override se la chiave non esiste o se il valore è diverso
-            if page_data.get(key) != value:
-                page_data[key] = value
-                applied_keys.append(key)
-                modified = True
-                global_modified = True
+        # 3d. Applica gli override (solo le chiavi assenti o con un valore diverso)
+        applied_keys = store.update(lang, page_id, overrides, create_page=True)
         
-        # 3e. Salva il file texts.json specifico per lingua se ci sono state modifiche
-        if modified:
-            save_json(lang_texts_path, texts_data)
+        if applied_keys:
+            global_modified = True
             print(f"  - Override applicati per '{lang}': {', '.join(applied_keys)}")
         else:
             print(f"  - Nessuna modifica da applicare in '{lang_texts_path}' per la pagina '{page_id}'.")
 
+    # 3e. Salva una sola volta i texts.json modificati
+    try:
+        for path in store.flush():
+            print(f"✅ File '{path}' salvato con successo.")
+    except Exception as e:
+        print(f"ERRORE: Impossibile salvare i texts.json: {e}")
 
     if global_modified:
         print(f"\n🎉 Aggiornamento manuale COMPLETATO. Almeno un file texts.json è stato modificato.")
@@ -0,0 +1,324 @@
+import os
+import sys
+import json
+import mmap
+import argparse
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from build_cache import BuildManifest, hash_text
+from translation_store import TranslationStore
+
+# =================================================================
+# INDICE DEGLI MP3 (DURATA, BITRATE, TABELLA DI SEEK) NEI TEXTS.JSON
+# =================================================================
+# main.js imposta audioPlayer.src = Assets/Audio/<audioSource> e deve
+# scaricare l'inizio del file per conoscerne la durata; inoltre sync_config.py
+# e add_page.py scrivevano un audioSource "<lingua>/<pagina>.mp3" anche quando
+# il file non esiste (404 garantito). Qui un parser dei frame MPEG in puro
+# Python legge ogni file di Assets/Audio/<lingua>/ e registra accanto ad
+# audioSource:
+#   audioDuration  -> durata in secondi
+#   audioBitrate   -> bitrate medio in kbps
+#   audioBytes     -> dimensione del file
+#   audioSeekTable -> "secondi:offset" ogni SEEK_TABLE_INTERVAL secondi
+# Se il file di audioSource non esiste si prova la lingua di riserva
+# (AUDIO_FALLBACK_LANGUAGE), altrimenti il valore viene svuotato e main.js
+# nasconde il pulsante.
+
+AUDIO_DIR = os.path.join("Assets", "Audio")
+TRANSLATIONS_DIR = os.path.join("data", "translations")
+TEXTS_JSON_FILENAME = "texts.json"
+# Nome della fase nel manifest di build (build_cache.py)
+BUILD_STAGE = "mp3_index"
+# Lingua della registrazione usata quando manca quella della pagina
+AUDIO_FALLBACK_LANGUAGE = "it"
+# Un punto della tabella di seek ogni N secondi (basta per un seek "a grana grossa")
+SEEK_TABLE_INTERVAL = 10
+# Fa parte della chiave di cache: cambiare i parametri rianalizza i file
+INDEX_PARAMS = f"seek={SEEK_TABLE_INTERVAL};v=1"
+
+# Chiavi scritte nei texts.json, nell'ordine, subito dopo audioSource
+AUDIO_INDEX_KEYS = ("audioDuration", "audioBitrate", "audioBytes", "audioSeekTable")
+
+# --- Tabelle dell'header MPEG audio (ISO 11172-3 / 13818-3) ---
+# Indice versione (bit 19-20): 0 = MPEG 2.5, 2 = MPEG 2, 3 = MPEG 1 (1 riservato)
+SAMPLE_RATES = {
+    3: (44100, 48000, 32000),
+    2: (22050, 24000, 16000),
+    0: (11025, 12000, 8000),
+}
+# (MPEG 1?, layer) -> bitrate in kbps per indice 1..14
+BITRATES = {
+    (True, 1): (32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (True, 2): (32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (True, 3): (32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (False, 1): (32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (False, 2): (8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (False, 3): (8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+
+
+def parse_frame_header(header: int) -> Optional[Tuple[int, int, int]]:
+    """
+    Decodifica un header di frame a 32 bit.
+    Restituisce (lunghezza del frame in byte, campioni, frequenza) o None se non valido.
+    """
+    if header >> 21 != 0x7FF:
+        return None
+    version = (header >> 19) & 0x3
+    layer = 4 - ((header >> 17) & 0x3)
+    bitrate_index = (header >> 12) & 0xF
+    rate_index = (header >> 10) & 0x3
+    # Versione/layer riservati, bitrate "free" o non valido, frequenza riservata
+    if version == 1 or layer == 4 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    mpeg1 = version == 3
+    bitrate = BITRATES[(mpeg1, layer)][bitrate_index - 1] * 1000
+    sample_rate = SAMPLE_RATES[version][rate_index]
+    padding = (header >> 9) & 0x1
+
+    if layer == 1:
+        return (12 * bitrate // sample_rate + padding) * 4, 384, sample_rate
+    samples = 1152 if (layer == 2 or mpeg1) else 576
+    return samples // 8 * bitrate // sample_rate + padding, samples, sample_rate
+
+
+def _audio_bounds(data) -> Tuple[int, int]:
+    """Inizio e fine dei dati audio, esclusi i tag ID3v2 in testa e ID3v1/APE in coda."""
+    start, end = 0, len(data)
+    # Possono esserci più tag ID3v2 consecutivi; dimensione "syncsafe" (7 bit per byte)
+    while data[start:start + 3] == b"ID3" and start + 10 <= end:
+        size = 0
+        for byte in data[start + 6:start + 10]:
+            size = (size << 7) | (byte & 0x7F)
+        footer = 10 if data[start + 5] & 0x10 else 0
+        start += 10 + size + footer
+    if end - start >= 128 and data[end - 128:end - 125] == b"TAG":
+        end -= 128
+    if end - start >= 32 and data[end - 32:end - 24] == b"APETAGEX":
+        ape_size = int.from_bytes(data[end - 20:end - 16], "little")
+        has_header = data[end - 9] & 0x80
+        end -= ape_size + (32 if has_header else 0)
+    return min(start, end), end
+
+
+def _is_info_frame(data, offset: int, header: int) -> bool:
+    """True per il frame Xing/Info/VBRI dei file VBR: non contiene audio e non va contato."""
+    mpeg1 = (header >> 19) & 0x3 == 3
+    mono = (header >> 6) & 0x3 == 3
+    side_info = (17 if mono else 32) if mpeg1 else (9 if mono else 17)
+    tag = data[offset + 4 + side_info:offset + 8 + side_info]
+    return tag in (b"Xing", b"Info") or data[offset + 36:offset + 40] == b"VBRI"
+
+
+def iter_frames(data, offset: int, end: int) -> Iterator[Tuple[int, int, int, int, int]]:
+    """
+    Frame audio tra offset ed end: (offset, lunghezza, campioni, frequenza, header).
+    Salta i dati spuri tra i frame e il frame Xing/Info/VBRI iniziale.
+    """
+    first_frame = None
+    while offset + 4 <= end:
+        header = int.from_bytes(data[offset:offset + 4], "big")
+        parsed = parse_frame_header(header)
+        if parsed is None or offset + parsed[0] > end:
+            if first_frame is not None and parsed is None and data[offset:offset + 3] in (b"TAG", b"APE"):
+                break
+            # Dati spuri: si cerca il prossimo byte di sincronismo
+            offset = data.find(b"\xff", offset + 1, end)
+            if offset < 0:
+                break
+            continue
+        length, samples, sample_rate = parsed
+        if first_frame is None:
+            # Il primo frame è valido solo se anche il successivo lo è (evita falsi sincronismi)
+            following = data[offset + length:offset + length + 4]
+            if len(following) == 4 and parse_frame_header(int.from_bytes(following, "big")) is None:
+                offset = data.find(b"\xff", offset + 1, end)
+                if offset < 0:
+                    break
+                continue
+            first_frame = offset
+            if _is_info_frame(data, offset, header):
+                offset += length
+                continue
+        yield offset, length, samples, sample_rate, header
+        offset += length
+
+
+def scan_mp3(path: str) -> Optional[Dict]:
+    """
+    Percorre i frame del file leggendo solo i 4 byte di ogni header.
+    Restituisce durata, bitrate medio, dimensione e tabella di seek (None se non è un MP3).
+    """
+    size = os.path.getsize(path)
+    if not size:
+        return None
+    audio_bytes = 0
+    frames = 0
+    seconds = 0.0
+    next_seek = 0.0
+    seek_table: List[Tuple[int, int]] = []
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        for offset, length, samples, sample_rate, _ in iter_frames(data, *_audio_bounds(data)):
+            if seconds >= next_seek:
+                seek_table.append((int(round(seconds)), offset))
+                next_seek += SEEK_TABLE_INTERVAL
+            frames += 1
+            audio_bytes += length
+            seconds += samples / sample_rate
+
+    if not frames:
+        return None
+    return {
+        "duration": round(seconds, 3),
+        "bitrate": round(audio_bytes * 8 / seconds / 1000) if seconds else 0,
+        "bytes": size,
+        "frames": frames,
+        "seekTable": seek_table,
+    }
+
+
+def format_seek_table(seek_table: List) -> str:
+    """Tabella di seek compatta per i texts.json: "0:417 10:160417 20:320417"."""
+    return " ".join(f"{second}:{offset}" for second, offset in seek_table)
+
+
+class Mp3Index:
+    """Analisi dei file audio, riprese dal manifest di build se il file è invariato."""
+
+    def __init__(self, force: bool = False):
+        self.manifest = BuildManifest()
+        self.force = force
+        self.params_tag = hash_text(INDEX_PARAMS)[:8]
+        self.entries: Dict[str, Optional[Dict]] = {}
+        self.scanned = 0
+
+    def get(self, path: str) -> Optional[Dict]:
+        path = os.path.normpath(path).replace(os.sep, "/")
+        if path in self.entries:
+            return self.entries[path]
+        entry = None
+        if os.path.isfile(path):
+            cache_source = f"{path}#{self.params_tag}"
+            source_hash = self.manifest.source_hash(BUILD_STAGE, cache_source)
+            if not self.force and self.manifest.is_up_to_date(BUILD_STAGE, cache_source, source_hash):
+                entry = self.manifest.entry(BUILD_STAGE, cache_source)["outputs"]["result"]
+            else:
+                try:
+                    entry = scan_mp3(path)
+                except (OSError, ValueError) as e:
+                    print(f"ERRORE: Impossibile analizzare {path}: {e}")
+                else:
+                    if entry is None:
+                        print(f"ATTENZIONE: Nessun frame MPEG trovato in {path}.")
+                    self.manifest.record(BUILD_STAGE, cache_source, source_hash, {"result": entry})
+                    self.scanned += 1
+        self.entries[path] = entry
+        return entry
+
+    def index_all(self) -> Dict[str, Dict]:
+        """Analizza tutti gli MP3 di Assets/Audio/<lingua>/."""
+        indexed = {}
+        if not os.path.isdir(AUDIO_DIR):
+            print(f"ERRORE: Directory audio non trovata: {AUDIO_DIR}")
+            return indexed
+        for lang in sorted(os.listdir(AUDIO_DIR)):
+            lang_dir = os.path.join(AUDIO_DIR, lang)
+            if not os.path.isdir(lang_dir):
+                continue
+            for filename in sorted(os.listdir(lang_dir)):
+                if filename.lower().endswith(".mp3"):
+                    entry = self.get(os.path.join(lang_dir, filename))
+                    if entry:
+                        indexed[f"{lang}/{filename}"] = entry
+        return indexed
+
+    def save(self):
+        # Le voci dei file eliminati (o analizzati con altri parametri) vengono dimenticate
+        self.manifest.prune_stage(BUILD_STAGE, [f"{path}#{self.params_tag}" for path in self.entries])
+        self.manifest.save()
+
+
+def audio_exists(audio_source: str, audio_dir: str = AUDIO_DIR) -> bool:
+    return bool(audio_source) and os.path.isfile(os.path.join(audio_dir, audio_source))
+
+
+def resolve_audio_source(lang: str, page_id: str, current: str = "", audio_dir: str = AUDIO_DIR) -> str:
+    """
+    Valore di audioSource che punta a un file esistente: quello attuale, poi
+    <lingua>/<pagina>.mp3, poi lo stesso file nella lingua di riserva.
+    Stringa vuota se non esiste nessuna registrazione (main.js nasconde il pulsante).
+    """
+    candidates = []
+    for name in (os.path.basename(current) if current else "", f"{page_id.lower()}.mp3"):
+        if name:
+            candidates += [f"{lang.lower()}/{name}", f"{AUDIO_FALLBACK_LANGUAGE}/{name}"]
+    if current:
+        candidates.insert(0, current)
+    for candidate in candidates:
+        if audio_exists(candidate, audio_dir):
+            return candidate
+    return ""
+
+
+def record_audio_index(index: Mp3Index) -> int:
+    """
+    Corregge audioSource e scrive i metadati audio in tutti i texts.json
+    (le chiavi vengono rimosse se l'audio manca). Restituisce i file riscritti.
+    """
+    if not os.path.isdir(TRANSLATIONS_DIR):
+        print(f"ERRORE: Directory delle traduzioni non trovata: {TRANSLATIONS_DIR}")
+        return 0
+
+    store = TranslationStore(TRANSLATIONS_DIR)
+    for lang in store.languages():
+        try:
+            texts = store.texts(lang)
+        except (json.JSONDecodeError, OSError) as e:
+            print(f"ERRORE: Impossibile leggere {store.path(lang)}: {e}")
+            continue
+        for page_id, page_data in texts.items():
+            if not isinstance(page_data, dict) or "audioSource" not in page_data:
+                continue
+            current = page_data["audioSource"] or ""
+            audio_source = resolve_audio_source(lang, page_id, current)
+            if audio_source != current:
+                if audio_source:
+                    print(f"AVVISO: {lang}/{page_id}: audioSource '{current}' -> '{audio_source}'.")
+                else:
+                    print(f"AVVISO: {lang}/{page_id}: audio '{current}' inesistente, audioSource svuotato.")
+            entry = index.get(os.path.join(AUDIO_DIR, audio_source)) if audio_source else None
+
+            store.set(lang, page_id, "audioSource", audio_source)
+            metadata = {
+                "audioDuration": round(entry["duration"], 2),
+                "audioBitrate": entry["bitrate"],
+                "audioBytes": entry["bytes"],
+                "audioSeekTable": format_seek_table(entry["seekTable"]),
+            } if entry else {}
+            # Senza audio i metadati vengono rimossi
+            store.place_keys(lang, page_id, {"audioSource": metadata}, AUDIO_INDEX_KEYS)
+
+    written = store.flush()
+    for texts_path in written:
+        print(f"  - {texts_path}: metadati audio aggiornati")
+    return len(written)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Analizza gli MP3 e salva durata, bitrate e tabella di seek nei texts.json.")
+    parser.add_argument("--force", action="store_true", help="Rianalizza anche i file già indicizzati.")
+    args = parser.parse_args()
+
+    mp3_index = Mp3Index(force=args.force)
+    indexed = mp3_index.index_all()
+    for audio_path, audio in indexed.items():
+        minutes, seconds = divmod(audio["duration"], 60)
+        print(f"  {audio_path:<48}{int(minutes):>3}:{seconds:05.2f}{audio['bitrate']:>6} kbps"
+              f"{audio['bytes'] / 1024:>9.0f} KB{len(audio['seekTable']):>5} punti")
+    texts_files = record_audio_index(mp3_index)
+    mp3_index.save()
+
+    print(f"✅ Completato: {len(indexed)} file audio ({mp3_index.scanned} analizzati), "
+          f"{texts_files} texts.json aggiornati.")
+    sys.exit(0)
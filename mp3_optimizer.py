@@ -0,0 +1,286 @@
+import os
+import sys
+import mmap
+import time
+import bisect
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from atomic_io import atomic_write_bytes
+from build_cache import BuildManifest, hash_text
+from mp3_index import (AUDIO_DIR, Mp3Index, parse_frame_header, iter_frames, record_audio_index,
+                       _audio_bounds, _is_info_frame)
+
+# =================================================================
+# OTTIMIZZAZIONE DEL CONTENITORE MP3 (SENZA RICODIFICA)
+# =================================================================
+# Le narrazioni escono dagli editor con tag ID3v2 (a volte con copertina),
+# tag ID3v1/APE in coda e byte di riempimento: il turista li scarica prima
+# del primo frame audio. Qui ogni file di Assets/Audio/<lingua>/ viene
+# riscritto con i soli frame audio, copiati byte per byte (nessuna
+# ricodifica, nessuna perdita), preceduti da un frame Xing/Info nuovo con
+# numero di frame, dimensione e TOC a 100 punti: con i file VBR il browser
+# può saltare subito a qualsiasi punto senza leggere il file dall'inizio.
+# Il tag LAME del vecchio frame Info (ritardo dell'encoder, riempimento,
+# guadagno) viene ricopiato: senza, il browser non elimina i campioni di
+# silenzio aggiunti dall'encoder. I file CBR senza frame Info non ne
+# ricevono uno, e i file che contengono già solo i frame audio non vengono
+# riscritti: cambierebbe soltanto il frame Info.
+# I file già ottimizzati (hash del contenuto nel manifest di build) vengono
+# saltati; alla fine i metadati audio dei texts.json (mp3_index.py) vengono
+# riallineati alle nuove dimensioni.
+
+# Nome della fase nel manifest di build (build_cache.py)
+BUILD_STAGE = "mp3_optimizer"
+# Fa parte della chiave di cache: cambiare il formato dell'header riottimizza i file
+OPTIMIZER_PARAMS = "xing=frames,bytes,toc,lame;v=2"
+
+# Campi presenti nel frame Xing: numero di frame, byte, TOC
+XING_FLAGS = 0x1 | 0x2 | 0x4
+XING_TOC_POINTS = 100
+# Flag del campo "qualità" (4 byte dopo la TOC)
+XING_QUALITY_FLAG = 0x8
+# Estensione LAME dopo i campi Xing: identificativo dell'encoder in testa,
+# lunghezza della musica a +28, CRC del frame Info a +34 (36 byte in tutto)
+LAME_ENCODER_IDS = (b"LAME", b"Lavf", b"Lavc")
+LAME_TAG_SIZE = 36
+LAME_MUSIC_LENGTH_OFFSET = 28
+LAME_TAG_CRC_OFFSET = 34
+# Bit dell'header: indice di bitrate, padding, protezione CRC (1 = assente)
+HEADER_BITRATE_MASK = 0xF << 12
+HEADER_PADDING_BIT = 1 << 9
+HEADER_NO_CRC_BIT = 1 << 16
+
+
+def _side_info_size(header: int) -> int:
+    mpeg1 = (header >> 19) & 0x3 == 3
+    mono = (header >> 6) & 0x3 == 3
+    return (17 if mono else 32) if mpeg1 else (9 if mono else 17)
+
+
+def _crc16(data: bytes) -> int:
+    """CRC-16 del tag LAME (polinomio 0x8005, bit riflessi, valore iniziale 0)."""
+    crc = 0
+    for byte in data:
+        crc ^= byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+    return crc
+
+
+def find_info_frame(data, start: int, first_audio: int) -> Optional[Tuple[int, int]]:
+    """(offset, header) del frame Xing/Info/VBRI che precede il primo frame audio, se c'è."""
+    offset = data.find(b"\xff", start, first_audio)
+    while offset >= 0:
+        header = int.from_bytes(data[offset:offset + 4], "big")
+        parsed = parse_frame_header(header)
+        if parsed and offset + parsed[0] == first_audio and _is_info_frame(data, offset, header):
+            return offset, header
+        offset = data.find(b"\xff", offset + 1, first_audio)
+    return None
+
+
+def read_info_extension(data, offset: int, header: int) -> Tuple[int, bytes]:
+    """
+    Campi del vecchio frame Xing/Info che seguono la TOC: qualità e tag LAME.
+    Restituisce (flag da aggiungere, byte da ricopiare dopo la TOC).
+    """
+    position = offset + 4 + _side_info_size(header)
+    if data[position:position + 4] not in (b"Xing", b"Info"):
+        return 0, b""  # VBRI: nessuna estensione LAME
+    flags = int.from_bytes(data[position + 4:position + 8], "big")
+    position += 8 + 4 * bool(flags & 0x1) + 4 * bool(flags & 0x2) + XING_TOC_POINTS * bool(flags & 0x4)
+    quality = bytes(data[position:position + 4]) if flags & XING_QUALITY_FLAG else b""
+    position += len(quality)
+    lame = bytes(data[position:position + LAME_TAG_SIZE])
+    if lame[:4] not in LAME_ENCODER_IDS or len(lame) < LAME_TAG_SIZE:
+        lame = b""
+    return flags & XING_QUALITY_FLAG, quality + lame
+
+
+def build_info_frame(template_header: int, frames: List[Tuple[int, int, int]], vbr: bool,
+                     extension: Tuple[int, bytes] = (0, b"")) -> bytes:
+    """
+    Frame Xing (VBR) o Info (CBR) con lo stesso formato del primo frame audio.
+    'frames' è la lista (lunghezza, campioni, frequenza) dei frame audio;
+    'extension' è il risultato di read_info_extension() sul vecchio frame.
+    """
+    extra_flags, tail = extension
+    side_info = _side_info_size(template_header)
+    needed = 4 + side_info + 4 + 4 + 4 + 4 + XING_TOC_POINTS + len(tail)
+    base = (template_header & ~(HEADER_BITRATE_MASK | HEADER_PADDING_BIT)) | HEADER_NO_CRC_BIT
+    # Il bitrate più basso il cui frame contiene tutti i campi
+    for bitrate_index in range(1, 15):
+        header = base | (bitrate_index << 12)
+        frame_length = parse_frame_header(header)[0]
+        if frame_length >= needed:
+            break
+    else:
+        raise ValueError("frame troppo piccolo per l'header Xing")
+
+    # Posizione (in byte, dall'inizio del frame Info) e istante d'inizio di ogni frame audio
+    starts, times = [], []
+    position, seconds = frame_length, 0.0
+    for length, samples, sample_rate in frames:
+        starts.append(position)
+        times.append(seconds)
+        position += length
+        seconds += samples / sample_rate
+    total_bytes = position
+
+    toc = bytearray()
+    for i in range(XING_TOC_POINTS):
+        index = min(bisect.bisect_left(times, seconds * i / XING_TOC_POINTS), len(starts) - 1)
+        toc.append(min(255, starts[index] * 256 // total_bytes))
+
+    body = bytearray(header.to_bytes(4, "big") + bytes(side_info) + (b"Xing" if vbr else b"Info")
+                     + (XING_FLAGS | extra_flags).to_bytes(4, "big") + len(frames).to_bytes(4, "big")
+                     + total_bytes.to_bytes(4, "big") + bytes(toc) + tail)
+    lame_start = len(body) - LAME_TAG_SIZE
+    if body[lame_start:lame_start + 4] in LAME_ENCODER_IDS:
+        # Lunghezza e CRC del tag LAME si riferiscono al nuovo frame
+        music_length = lame_start + LAME_MUSIC_LENGTH_OFFSET
+        body[music_length:music_length + 4] = total_bytes.to_bytes(4, "big")
+        crc = lame_start + LAME_TAG_CRC_OFFSET
+        body[crc:crc + 2] = _crc16(body[:crc]).to_bytes(2, "big")
+    return bytes(body) + bytes(frame_length - len(body))
+
+
+def optimize_file(path: str, dry_run: bool = False) -> Dict[str, Any]:
+    """
+    Riscrive il file con il nuovo frame Info e i soli frame audio. I file
+    senza tag né dati spuri (con un frame Info, o CBR) restano invariati.
+    Restituisce dimensioni prima/dopo, byte di tag e l'hash del contenuto finale.
+    """
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        start, end = _audio_bounds(data)
+        frames, chunks, bitrates = [], [], set()
+        template_header = None
+        for offset, length, samples, sample_rate, header in iter_frames(data, start, end):
+            if template_header is None:
+                template_header, first_audio = header, offset
+            frames.append((length, samples, sample_rate))
+            chunks.append(data[offset:offset + length])
+            bitrates.add((header >> 12) & 0xF)
+        if template_header is None:
+            raise ValueError("nessun frame MPEG audio")
+        before = len(data)
+        tag_bytes = start + (len(data) - end)
+        info = find_info_frame(data, start, first_audio)
+        extension = read_info_extension(data, *info) if info else (0, b"")
+        # Solo frame audio, contigui, preceduti al più dal frame Info
+        only_audio = (info[0] if info else first_audio) == 0 and end == before and \
+            b"".join(chunks) == data[first_audio:end]
+        original_hash = hashlib.sha256(data).hexdigest()
+
+    vbr = len(bitrates) > 1
+    if only_audio and (info or not vbr):
+        # Cambierebbe solo il frame Info (o ne verrebbe aggiunto uno a un CBR): il file resta com'è
+        return {"before": before, "after": before, "tag_bytes": 0, "frames": len(frames),
+                "vbr": vbr, "changed": False, "hash": original_hash}
+
+    # A un CBR senza frame Info non ne viene aggiunto uno: sarebbe più grande dei tag rimossi
+    info_frame = build_info_frame(template_header, frames, vbr, extension) if info or vbr else b""
+    optimized = info_frame + b"".join(chunks)
+    changed = len(optimized) != before or hashlib.sha256(optimized).hexdigest() != original_hash
+    if changed and not dry_run:
+        atomic_write_bytes(path, optimized)
+    return {
+        "before": before,
+        "after": len(optimized),
+        "tag_bytes": tag_bytes,
+        "frames": len(frames),
+        "vbr": vbr,
+        "changed": changed,
+        "hash": hashlib.sha256(optimized).hexdigest(),
+    }
+
+
+def audio_files() -> List[str]:
+    """MP3 di Assets/Audio/<lingua>/."""
+    paths = []
+    if os.path.isdir(AUDIO_DIR):
+        for lang in sorted(os.listdir(AUDIO_DIR)):
+            lang_dir = os.path.join(AUDIO_DIR, lang)
+            if os.path.isdir(lang_dir):
+                paths += [os.path.join(lang_dir, name).replace(os.sep, "/")
+                          for name in sorted(os.listdir(lang_dir)) if name.lower().endswith(".mp3")]
+    return paths
+
+
+def optimize_all(workers: int = 0, force: bool = False, dry_run: bool = False) -> bool:
+    paths = audio_files()
+    if not paths:
+        print(f"AVVISO: Nessun MP3 trovato in {AUDIO_DIR}.")
+        return True
+
+    build_manifest = BuildManifest()
+    params_tag = hash_text(OPTIMIZER_PARAMS)[:8]
+    jobs: Dict[str, str] = {}
+    live_sources = []
+    for path in paths:
+        cache_source = f"{path}#{params_tag}"
+        live_sources.append(cache_source)
+        source_hash = build_manifest.source_hash(BUILD_STAGE, cache_source)
+        if force or not build_manifest.is_up_to_date(BUILD_STAGE, cache_source, source_hash):
+            jobs[path] = cache_source
+
+    print(f"File MP3: {len(paths)} ({len(paths) - len(jobs)} già ottimizzati, {len(jobs)} da elaborare).")
+
+    results: Dict[str, Dict[str, Any]] = {}
+    failures = 0
+    started = time.perf_counter()
+    if jobs:
+        with ProcessPoolExecutor(max_workers=workers or None) as executor:
+            futures = {path: executor.submit(optimize_file, path, dry_run) for path in jobs}
+            for path, future in futures.items():
+                try:
+                    results[path] = future.result()
+                except Exception as e:
+                    print(f"ERRORE: {path} non ottimizzato: {e}")
+                    failures += 1
+                    continue
+                if not dry_run:
+                    # L'hash registrato è quello del file riscritto: alla prossima esecuzione viene saltato
+                    build_manifest.record(BUILD_STAGE, jobs[path], results[path]["hash"],
+                                          {"result": {"frames": results[path]["frames"]}})
+    elapsed = time.perf_counter() - started
+
+    if not dry_run:
+        build_manifest.prune_stage(BUILD_STAGE, live_sources)
+        build_manifest.save()
+
+    changed = {path: result for path, result in results.items() if result["changed"]}
+    print("\n==================================================================")
+    print(f"{'file':<48}{'prima':>10}{'dopo':>10}{'tag':>9}{'tipo':>6}")
+    for path, result in changed.items():
+        print(f"{path[len(AUDIO_DIR) + 1:]:<48}{result['before'] / 1024:>8.0f}KB{result['after'] / 1024:>8.0f}KB"
+              f"{result['tag_bytes'] / 1024:>7.1f}KB{'VBR' if result['vbr'] else 'CBR':>6}")
+    before = sum(r["before"] for r in changed.values())
+    after = sum(r["after"] for r in changed.values())
+    verb = "da riscrivere" if dry_run else "riscritti"
+    print(f"OTTIMIZZAZIONE MP3: {len(changed)} file {verb} in {elapsed:.2f}s, "
+          f"{(before - after) / 1024:.1f} KB risparmiati ({before / 1024 / 1024:.2f} MB -> {after / 1024 / 1024:.2f} MB).")
+    if dry_run and changed:
+        print("PROVA: nessun file modificato.")
+    print("==================================================================")
+
+    if changed and not dry_run:
+        # Dimensioni e offset di seek dei file riscritti cambiano: si riallineano i texts.json
+        mp3_index = Mp3Index()
+        mp3_index.index_all()
+        record_audio_index(mp3_index)
+        mp3_index.save()
+    return failures == 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rimuove tag, copertine e riempimento dagli MP3 e aggiunge la TOC Xing.")
+    parser.add_argument("--workers", type=int, default=0, help="Processi in parallelo (default: numero di CPU).")
+    parser.add_argument("--force", action="store_true", help="Rielabora anche i file già ottimizzati.")
+    parser.add_argument("--prova", action="store_true", help="Mostra solo i byte risparmiabili, senza riscrivere.")
+    args = parser.parse_args()
+
+    sys.exit(0 if optimize_all(args.workers, args.force, args.prova) else 1)
@@ -0,0 +1,229 @@
+import os
+import sys
+import json
+import mmap
+import hashlib
+import argparse
+from typing import Any, Dict, List, Set, Tuple
+
+from atomic_io import atomic_write_bytes, atomic_write_text
+from build_cache import BuildManifest, hash_text
+from mp3_index import AUDIO_DIR, AUDIO_INDEX_KEYS, TRANSLATIONS_DIR, TEXTS_JSON_FILENAME, iter_frames, _audio_bounds
+from translation_store import TranslationStore
+
+# =================================================================
+# SEGMENTI MP3 PER LA RIPRODUZIONE PROGRESSIVA
+# =================================================================
+# Le narrazioni lunghe (pittoricarracci, cavaticcio...) sono un unico MP3:
+# con una connessione debole la riproduzione si blocca. Qui ogni file
+# referenziato da un audioSource viene diviso ai confini dei frame (nessuna
+# ricodifica) in segmenti di circa SEGMENT_DURATION secondi:
+#   - ogni segmento si chiama con l'hash del suo contenuto, quindi una
+#     registrazione invariata mantiene gli stessi segmenti (e la cache HTTP);
+#   - per ogni pagina e lingua viene scritta una playlist JSON
+#     (Assets/derivatives/audio/<lingua>/<pagina>.json) con durata e segmenti,
+#     indicata nei texts.json dalla chiave audioPlaylist.
+# main.js, se il browser supporta MediaSource per audio/mpeg, avvia la
+# riproduzione dopo il primo segmento e scarica i successivi in sequenza;
+# altrimenti usa il file intero.
+
+# Cartella dei segmenti (dentro i derivati: né la deduplicazione né il GC la toccano)
+SEGMENTS_DIR = "Assets/derivatives/audio"
+# Nome della fase nel manifest di build (build_cache.py)
+BUILD_STAGE = "mp3_segmenter"
+# Durata indicativa di un segmento in secondi (il taglio cade sul primo confine di frame successivo)
+SEGMENT_DURATION = 10
+# Fa parte della chiave di cache: cambiare i parametri risegmenta i file
+SEGMENT_PARAMS = f"duration={SEGMENT_DURATION};v=1"
+# Chiave dei texts.json con il percorso della playlist
+PLAYLIST_KEY = "audioPlaylist"
+
+
+def split_mp3(path: str) -> Dict[str, Any]:
+    """
+    Divide il file in segmenti ai confini dei frame e li scrive in SEGMENTS_DIR
+    (solo se non esistono già). Restituisce durata totale e segmenti.
+    """
+    segments: List[Dict[str, Any]] = []
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        chunks, chunk_seconds, start = [], 0.0, 0.0
+
+        def flush():
+            payload = b"".join(chunks)
+            name = f"{hashlib.sha256(payload).hexdigest()[:16]}.mp3"
+            segment_path = f"{SEGMENTS_DIR}/{name}"
+            # Un segmento troncato (esecuzione interrotta) non ha la dimensione attesa: si riscrive
+            if not os.path.isfile(segment_path) or os.path.getsize(segment_path) != len(payload):
+                atomic_write_bytes(segment_path, payload)
+            segments.append({"src": segment_path, "start": round(start, 3),
+                             "duration": round(chunk_seconds, 3), "bytes": len(payload)})
+
+        for offset, length, samples, sample_rate, _ in iter_frames(data, *_audio_bounds(data)):
+            chunks.append(data[offset:offset + length])
+            chunk_seconds += samples / sample_rate
+            if chunk_seconds >= SEGMENT_DURATION:
+                flush()
+                start += chunk_seconds
+                chunks, chunk_seconds = [], 0.0
+        if chunks:
+            flush()
+            start += chunk_seconds
+
+    if not segments:
+        raise ValueError("nessun frame MPEG audio")
+    return {"duration": round(start, 3), "segments": segments}
+
+
+def collect_audio_sources() -> Tuple[Dict[str, List[Tuple[str, str]]], bool]:
+    """
+    audioSource referenziati nei texts.json -> lista di (lingua, pagina), e
+    False se qualche texts.json non era leggibile (l'elenco è incompleto).
+    """
+    sources: Dict[str, List[Tuple[str, str]]] = {}
+    complete = True
+    if not os.path.isdir(TRANSLATIONS_DIR):
+        print(f"ERRORE: Directory delle traduzioni non trovata: {TRANSLATIONS_DIR}")
+        return sources, False
+    for lang in sorted(os.listdir(TRANSLATIONS_DIR)):
+        texts_path = os.path.join(TRANSLATIONS_DIR, lang, TEXTS_JSON_FILENAME)
+        if not os.path.isfile(texts_path):
+            continue
+        try:
+            with open(texts_path, 'r', encoding='utf-8') as f:
+                texts = json.load(f)
+        except (json.JSONDecodeError, OSError) as e:
+            print(f"ERRORE: Impossibile leggere {texts_path}: {e}")
+            complete = False
+            continue
+        for page_id, page_data in texts.items():
+            audio_source = page_data.get("audioSource") if isinstance(page_data, dict) else None
+            if audio_source and os.path.isfile(os.path.join(AUDIO_DIR, audio_source)):
+                path = os.path.normpath(os.path.join(AUDIO_DIR, audio_source)).replace(os.sep, "/")
+                sources.setdefault(path, []).append((lang, page_id))
+    return sources, complete
+
+
+def playlist_path(lang: str, page_id: str) -> str:
+    return f"{SEGMENTS_DIR}/{lang}/{page_id}.json"
+
+
+def _write_if_changed(path: str, content: str) -> bool:
+    if os.path.isfile(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            if f.read() == content:
+                return False
+    atomic_write_text(path, content)
+    return True
+
+
+def record_playlists(playlists: Dict[Tuple[str, str], str]) -> int:
+    """
+    Scrive audioPlaylist dopo audioSource (e dopo i metadati di mp3_index.py)
+    in tutti i texts.json; la chiave viene rimossa se la pagina non ha segmenti.
+    """
+    store = TranslationStore(TRANSLATIONS_DIR)
+    for lang in store.languages():
+        try:
+            texts = store.texts(lang)
+        except (json.JSONDecodeError, OSError) as e:
+            print(f"ERRORE: Impossibile leggere {store.path(lang)}: {e}")
+            continue
+        for page_id, page_data in texts.items():
+            if not isinstance(page_data, dict) or ("audioSource" not in page_data and PLAYLIST_KEY not in page_data):
+                continue
+            playlist = playlists.get((lang, page_id))
+            anchor = [key for key in ("audioSource",) + AUDIO_INDEX_KEYS if key in page_data][-1:]
+            store.place_keys(lang, page_id, {anchor[0]: {PLAYLIST_KEY: playlist}} if playlist and anchor else {},
+                             [PLAYLIST_KEY])
+
+    written = store.flush()
+    for texts_path in written:
+        print(f"  - {texts_path}: playlist audio aggiornate")
+    return len(written)
+
+
+def evict_stale(keep: Set[str]) -> Tuple[int, int]:
+    """Elimina segmenti e playlist non più prodotti. Restituisce (file eliminati, byte liberati)."""
+    removed = freed = 0
+    for directory, _, filenames in os.walk(SEGMENTS_DIR):
+        for filename in filenames:
+            path = os.path.join(directory, filename).replace(os.sep, "/")
+            if path in keep:
+                continue
+            freed += os.path.getsize(path)
+            os.remove(path)
+            removed += 1
+    return removed, freed
+
+
+def segment_all(force: bool = False) -> bool:
+    sources, complete = collect_audio_sources()
+    if not sources:
+        print("AVVISO: Nessun audioSource con un file esistente.")
+        return True
+
+    os.makedirs(SEGMENTS_DIR, exist_ok=True)
+    build_manifest = BuildManifest()
+    params_tag = hash_text(SEGMENT_PARAMS)[:8]
+    results: Dict[str, Dict[str, Any]] = {}
+    live_sources = []
+    failures = split_count = 0
+
+    for path in sorted(sources):
+        cache_source = f"{path}#{params_tag}"
+        live_sources.append(cache_source)
+        source_hash = build_manifest.source_hash(BUILD_STAGE, cache_source)
+        if not force and build_manifest.is_up_to_date(BUILD_STAGE, cache_source, source_hash):
+            results[path] = build_manifest.entry(BUILD_STAGE, cache_source)["outputs"]["result"]
+            continue
+        try:
+            results[path] = split_mp3(path)
+        except (OSError, ValueError) as e:
+            print(f"ERRORE: {path} non segmentato: {e}")
+            failures += 1
+            continue
+        split_count += 1
+        build_manifest.record(BUILD_STAGE, cache_source, source_hash, {
+            "segments": [segment["src"] for segment in results[path]["segments"]],
+            "result": results[path],
+        })
+
+    build_manifest.prune_stage(BUILD_STAGE, live_sources)
+    build_manifest.save()
+
+    # --- Playlist per pagina e lingua ---
+    keep: Set[str] = set()
+    playlists: Dict[Tuple[str, str], str] = {}
+    written = 0
+    for path, result in results.items():
+        keep.update(segment["src"] for segment in result["segments"])
+        for lang, page_id in sources[path]:
+            target = playlist_path(lang, page_id)
+            playlist = {"source": path, "duration": result["duration"], "segments": result["segments"]}
+            written += _write_if_changed(target, json.dumps(playlist, indent=2, ensure_ascii=False, sort_keys=True))
+            playlists[(lang, page_id)] = target
+            keep.add(target)
+    if complete:
+        removed, freed = evict_stale(keep)
+    else:
+        # Le playlist delle lingue non lette risulterebbero obsolete: niente pulizia
+        print("AVVISO: texts.json non leggibili, segmenti e playlist obsoleti non eliminati.")
+        removed = freed = 0
+        failures += 1
+    texts_files = record_playlists(playlists)
+
+    segment_count = sum(len(result["segments"]) for result in results.values())
+    print("\n==================================================================")
+    print(f"SEGMENTI MP3: {len(results)} file ({split_count} segmentati), {segment_count} segmenti da "
+          f"~{SEGMENT_DURATION}s, {written} playlist scritte, {texts_files} texts.json aggiornati.")
+    print(f"Eliminati {removed} file obsoleti ({freed / 1024:.0f} KB).")
+    print("==================================================================")
+    return failures == 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Divide gli MP3 in segmenti per la riproduzione progressiva.")
+    parser.add_argument("--force", action="store_true", help="Risegmenta anche i file già aggiornati.")
+    args = parser.parse_args()
+
+    sys.exit(0 if segment_all(args.force) else 1)
@@ -0,0 +1,276 @@
+import os
+import sys
+import time
+import zipfile
+import argparse
+from io import BytesIO
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from build_cache import BuildManifest
+from asset_catalog import AssetCatalog, web_path, IMAGE_EXTENSIONS
+from image_previews import area_downsample
+
+# =================================================================
+# IMMAGINI QUASI DUPLICATE (hash percettivi)
+# =================================================================
+# Oltre alle copie identiche (dedup_assets.py) si accumulano versioni
+# riesportate, ricompresse o leggermente ritagliate della stessa foto.
+# Per ogni immagine si calcolano due hash percettivi a 64 bit su una
+# versione in scala di grigi ridotta con NumPy:
+#   - dHash (differenza): 9x8 pixel, bit = pixel più luminoso del vicino a destra;
+#   - aHash (media):      8x8 pixel, bit = pixel più luminoso della media.
+# Due immagini sono quasi duplicate se entrambi gli hash distano al massimo
+# 'soglia' bit (distanza di Hamming).
+#
+# La ricerca non confronta tutte le coppie: il dHash è diviso in soglia+1
+# blocchi di bit e ogni immagine finisce in un secchiello per blocco. Per il
+# principio dei cassetti due hash entro la soglia coincidono in almeno un
+# blocco, quindi basta confrontare le immagini che condividono un secchiello.
+
+# Cartelle analizzate (i DOCX vengono aperti per leggere le immagini incorporate)
+IMAGE_ROOTS = ("Assets/images", "public", "DOCS_DA_CONVERTIRE", "ricerche")
+DOCX_MEDIA_PREFIX = "word/media/"
+# Nome della fase nel manifest di build (build_cache.py): cache degli hash
+BUILD_STAGE = "near_duplicates"
+DEFAULT_THRESHOLD = 6
+HASH_WORKERS = min(8, os.cpu_count() or 1)
+# Lato usato per la decodifica ridotta dei JPEG (draft): bastano pochi pixel
+DECODE_SIZE = 64
+
+
+def _greyscale_pixels(data: bytes) -> np.ndarray:
+    """Immagine in scala di grigi (già ruotata secondo l'EXIF), decodificata in forma ridotta."""
+    with Image.open(BytesIO(data)) as original:
+        original.draft("L", (DECODE_SIZE, DECODE_SIZE))
+        image = ImageOps.exif_transpose(original)
+        if image.mode == "P":
+            image = image.convert("RGBA")  # palette con trasparenza: Pillow la vuole in RGBA
+        image = image.convert("L")
+        if image.width < 9 or image.height < 8:
+            # Icone minuscole: servono almeno 9x8 pixel per la riduzione per media d'area
+            image = image.resize((max(9, image.width), max(8, image.height)))
+        return np.asarray(image)
+
+
+def _pack_bits(bits: np.ndarray) -> np.ndarray:
+    """Matrice N x 64 di booleani -> vettore N di interi a 64 bit."""
+    return np.packbits(bits.astype(np.uint8), axis=1).view(">u8").ravel().astype(np.uint64)
+
+
+def perceptual_hashes(images: List[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    dHash e aHash di un lotto di immagini in scala di grigi, calcolati in
+    blocco: le miniature vengono impilate e confrontate con operazioni vettoriali.
+    """
+    small_d = np.stack([area_downsample(img[..., None], 9, 8)[..., 0] for img in images]).astype(np.int16)
+    small_a = np.stack([area_downsample(img[..., None], 8, 8)[..., 0] for img in images]).astype(np.float32)
+    dhash = _pack_bits((small_d[:, :, 1:] > small_d[:, :, :-1]).reshape(len(images), 64))
+    ahash = _pack_bits((small_a > small_a.mean(axis=(1, 2), keepdims=True)).reshape(len(images), 64))
+    return dhash, ahash
+
+
+# Numero di bit a 1 per ogni valore di un byte (conteggio vettoriale dei bit)
+POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def hamming(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Distanza di Hamming elemento per elemento tra due vettori di hash a 64 bit."""
+    xor = np.bitwise_xor(a, b)
+    return POPCOUNT_TABLE[xor.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+def candidate_pairs(hashes: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    Coppie (i, j), i < j, che condividono almeno un blocco di bit del dHash
+    (indice a blocchi multipli: soglia+1 blocchi, uno per secchiello).
+    Una coppia può comparire più volte (un blocco in comune per volta): la
+    verifica della distanza costa meno che eliminare le ripetizioni.
+    I secchielli si ottengono ordinando le chiavi: gli elementi dello stesso
+    secchiello sono contigui e le coppie si generano per scostamento, in blocco.
+    """
+    count = len(hashes)
+    chunks = np.array_split(np.arange(64), min(64, threshold + 1))
+    found = []
+    for chunk in chunks:
+        low, width = int(chunk[0]), len(chunk)
+        mask = np.uint64((1 << width) - 1)
+        keys = (hashes >> np.uint64(64 - low - width)) & mask
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        offset = 1
+        while offset < count:
+            same = sorted_keys[offset:] == sorted_keys[:-offset]
+            if not same.any():
+                break  # nessun secchiello ha più di 'offset' elementi
+            first, second = order[:-offset][same], order[offset:][same]
+            found.append(np.stack([np.minimum(first, second), np.maximum(first, second)], axis=1))
+            offset += 1
+    if not found:
+        return np.empty((0, 2), dtype=np.int64)
+    return np.concatenate(found).astype(np.int64)
+
+
+class UnionFind:
+    def __init__(self, size: int):
+        self.parent = list(range(size))
+
+    def find(self, x: int) -> int:
+        while self.parent[x] != x:
+            self.parent[x] = self.parent[self.parent[x]]
+            x = self.parent[x]
+        return x
+
+    def union(self, a: int, b: int):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a != root_b:
+            self.parent[max(root_a, root_b)] = min(root_a, root_b)
+
+
+def collect_images() -> List[str]:
+    """Immagini da analizzare: file immagine e DOCX (le immagini incorporate) nelle IMAGE_ROOTS."""
+    paths = []
+    for root in IMAGE_ROOTS:
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+            for filename in sorted(filenames):
+                lower = filename.lower()
+                if lower.endswith(IMAGE_EXTENSIONS) or (lower.endswith(".docx") and not filename.startswith("~$")):
+                    paths.append(web_path(os.path.join(dirpath, filename)))
+    return paths
+
+
+def _load_sources(path: str) -> List[Tuple[str, Optional[np.ndarray], int]]:
+    """(identificativo, pixel, byte) per un file immagine o per ogni immagine di un DOCX."""
+    if not path.lower().endswith(".docx"):
+        with open(path, 'rb') as f:
+            data = f.read()
+        return [(path, _greyscale_pixels(data), len(data))]
+
+    sources = []
+    with zipfile.ZipFile(path) as package:
+        for info in package.infolist():
+            if info.filename.startswith(DOCX_MEDIA_PREFIX) and info.filename.lower().endswith(IMAGE_EXTENSIONS):
+                try:
+                    sources.append((f"{path}#{info.filename}", _greyscale_pixels(package.read(info)), info.file_size))
+                except Exception as e:
+                    print(f"AVVISO: Immagine non leggibile {path}#{info.filename}: {e}")
+    return sources
+
+
+def build_index(paths: List[str], force: bool = False) -> Tuple[List[str], List[int], np.ndarray, np.ndarray]:
+    """
+    Hash di tutte le immagini. Gli hash sono in cache nel manifest di build:
+    vengono ricalcolati solo per i file nuovi o modificati.
+    """
+    manifest = BuildManifest()
+    names: List[str] = []
+    sizes: List[int] = []
+    dhashes: List[int] = []
+    ahashes: List[int] = []
+    to_hash = []
+
+    for path in paths:
+        content_hash = manifest.source_hash(BUILD_STAGE, path)
+        if not force and manifest.is_up_to_date(BUILD_STAGE, path, content_hash):
+            for name, size, dhash, ahash in manifest.entry(BUILD_STAGE, path)["outputs"]["result"]["images"]:
+                names.append(name)
+                sizes.append(size)
+                dhashes.append(int(dhash, 16))
+                ahashes.append(int(ahash, 16))
+        else:
+            to_hash.append((path, content_hash))
+
+    def load(job):
+        path, _ = job
+        try:
+            return _load_sources(path)
+        except Exception as e:
+            print(f"AVVISO: File non leggibile {path}: {e}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=HASH_WORKERS) as executor:
+        loaded = list(executor.map(load, to_hash))
+
+    for (path, content_hash), sources in zip(to_hash, loaded):
+        if sources is None:
+            continue
+        images = []
+        if sources:
+            dhash_batch, ahash_batch = perceptual_hashes([pixels for _, pixels, _ in sources])
+            for (name, _, size), dhash, ahash in zip(sources, dhash_batch.tolist(), ahash_batch.tolist()):
+                images.append([name, size, f"{dhash:016x}", f"{ahash:016x}"])
+                names.append(name)
+                sizes.append(size)
+                dhashes.append(dhash)
+                ahashes.append(ahash)
+        manifest.record(BUILD_STAGE, path, content_hash, {"result": {"images": images}})
+
+    manifest.prune_stage(BUILD_STAGE, paths)
+    manifest.save()
+    print(f"Immagini indicizzate: {len(names)} ({len(to_hash)} file analizzati, "
+          f"{len(paths) - len(to_hash)} dalla cache).")
+    return names, sizes, np.array(dhashes, dtype=np.uint64), np.array(ahashes, dtype=np.uint64)
+
+
+def find_clusters(dhashes: np.ndarray, ahashes: np.ndarray, threshold: int) -> List[List[int]]:
+    """Gruppi di immagini quasi duplicate (componenti connesse delle coppie entro la soglia)."""
+    pairs = candidate_pairs(dhashes, threshold)
+    if not len(pairs):
+        return []
+    close = ((hamming(dhashes[pairs[:, 0]], dhashes[pairs[:, 1]]) <= threshold)
+             & (hamming(ahashes[pairs[:, 0]], ahashes[pairs[:, 1]]) <= threshold))
+    close_pairs = set(map(tuple, pairs[close].tolist()))
+    union_find = UnionFind(len(dhashes))
+    for a, b in close_pairs:
+        union_find.union(a, b)
+    clusters: Dict[int, List[int]] = defaultdict(list)
+    for index in {i for pair in close_pairs for i in pair}:
+        clusters[union_find.find(index)].append(index)
+    return sorted((sorted(members) for members in clusters.values()), key=lambda c: (-len(c), c[0]))
+
+
+def _referencing_pages(catalog: AssetCatalog, name: str) -> List[str]:
+    """Pagine (chiavi dei texts.json) o file che usano l'immagine."""
+    path = name.split("#", 1)[0]
+    pages = set()
+    for source, location in catalog.references_to(path):
+        pages.add(location.split(".", 1)[0] if source.endswith("texts.json") else source)
+    return sorted(pages)
+
+
+def report(threshold: int = DEFAULT_THRESHOLD, force: bool = False) -> bool:
+    started = time.perf_counter()
+    names, sizes, dhashes, ahashes = build_index(collect_images(), force)
+    clusters = find_clusters(dhashes, ahashes, threshold)
+    elapsed = time.perf_counter() - started
+
+    with AssetCatalog() as catalog:
+        catalog.scan()
+        for number, members in enumerate(clusters, 1):
+            print(f"\nGruppo {number} ({len(members)} immagini):")
+            for index in members:
+                pages = _referencing_pages(catalog, names[index])
+                used = f" <- {', '.join(pages)}" if pages else ""
+                print(f"  {sizes[index] / 1024:>8.0f} KB  {names[index]}{used}")
+
+    print("\n==================================================================")
+    redundant = sum(len(members) - 1 for members in clusters)
+    print(f"QUASI DUPLICATI (soglia {threshold} bit): {len(clusters)} gruppi, {redundant} immagini ridondanti "
+          f"su {len(names)} ({elapsed:.2f}s).")
+    print("==================================================================")
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Trova le immagini quasi duplicate (hash percettivi).")
+    parser.add_argument("--soglia", type=int, default=DEFAULT_THRESHOLD,
+                        help=f"Distanza di Hamming massima su 64 bit (default: {DEFAULT_THRESHOLD}).")
+    parser.add_argument("--force", action="store_true", help="Ricalcola tutti gli hash.")
+    args = parser.parse_args()
+
+    sys.exit(0 if report(args.soglia, args.force) else 1)
@@ -2,10 +2,13 @@ import re
 import json
 import sys
 import os
-from typing import Dict, Tuple
+import html
+from typing import Dict, Tuple, List, Iterator, Optional
+
+from build_cache import BuildManifest, hash_text
 
 # NOTE: Rimozione dell'import di BeautifulSoup, in quanto l'analisi e la pulizia
-# vengono ora gestite con le espressioni regolari (re).
+# vengono ora gestite da una scansione lineare dell'HTML (iter_split_blocks).
 
 # --- CONFIGURAZIONE GLOBALE ---
 
@@ -13,19 +16,24 @@ from typing import Dict, Tuple
 TEMP_HTML_FILENAME = "raw_output.html"
 # Cartella dove verranno salvati i frammenti HTML e il file JSON di configurazione
 OUTPUT_DIR = "text_files"
+# Nome della fase nel manifest di build (build_cache.py)
+BUILD_STAGE = "post_process_html"
+
+# --- SCANSIONE DEI MARCATORI SPLIT ---
 
-# --- REGEX PER PULIZIA E SPLIT ---
+# Prefisso (case-insensitive) del testo visibile di un marcatore [SPLIT_BLOCK:nome.jpg]
+SPLIT_MARKER_PREFIX = "SPLIT_BLOCK:"
 
-# Rimuove tutti i tag <img>
-IMG_TAG_REGEX = re.compile(r'<img[^>]*?>', re.IGNORECASE | re.DOTALL)
+# Tag HTML completo, con '/' di chiusura (gruppo 1) e nome (gruppo 2).
+# Il lookahead impedisce al motore di riprovare nomi più corti: anche un '<'
+# senza '>' costa solo la distanza fino al '<' o '>' successivo.
+TAG_PATTERN = r'<(/?)(?:([a-zA-Z][a-zA-Z0-9]*)(?![a-zA-Z0-9]))?[^<>]*>'
+TAG_REGEX = re.compile(TAG_PATTERN)
+# Token della scansione: un tag oppure l'inizio di un possibile marcatore
+TOKEN_REGEX = re.compile(TAG_PATTERN + r'|\[')
 
-# Cattura il contenuto tra le parentesi quadre, es: [SPLIT_BLOCK:nomefile.jpg]
-# NOTA: Questo regex è usato solo per debug, non per lo split effettivo.
-SPLIT_BLOCK_CLEANING_REGEX = re.compile(
-    # Cattura TUTTI i caratteri (anche tag HTML e whitespace)
-    r'.*?(\[SPLIT_BLOCK:(.*?)\]).*?',
-    re.IGNORECASE | re.DOTALL
-)
+# Sequenze di spazi bianchi: quelle con almeno due a capo vengono ridotte a un solo '\n'
+WHITESPACE_RUN_REGEX = re.compile(r'\s+')
 
 # =========================================================================
 # FUNZIONE DI UTILITY PER DETERMINARE IL PREFISSO DEL NOME DEL FILE
@@ -43,48 +51,181 @@ def get_fragment_prefix(page_id: str) -> str:
     return page_id
 
 
-def clean_html_content(html_content: str) -> str:
-    """Rimuove i tag <img> e ripulisce le nuove linee/spazi superflui."""
-    cleaned = IMG_TAG_REGEX.sub('', html_content)
-    # Rimuove le doppie nuove righe/spazi e tag <p> e </p> vuoti dopo la rimozione immagini.
-    cleaned = re.sub(r'(<p[^>]*>\s*</p>|\n\s*\n)', '\n', cleaned).strip()
-    return cleaned
-
 # =========================================================================
-# FUNZIONE PER PULIZIA SPECIFICA DEI MARCATORI SPLIT
+# SCANSIONE LINEARE: FRAMMENTI E NOMI IMMAGINE IN UN SOLO PASSAGGIO
 # =========================================================================
-
-def sanitize_split_markers(html_content: str) -> str:
+# L'HTML viene letto una sola volta, da sinistra a destra. Ogni carattere è
+# esaminato al più due volte (un candidato marcatore non supera mai la '['
+# successiva), quindi il tempo resta lineare anche su documenti enormi o
+# malformati (migliaia di '[SPLIT_BLOCK' non chiusi, '<' senza '>', ...).
+# La pulizia avviene durante la scansione: i tag <img> vengono scartati e i
+# paragrafi rimasti vuoti rimossi, senza ulteriori passaggi con regex.
+
+class _FragmentBuilder:
+    """Accumula i pezzi di un frammento, eliminando <img> e <p> vuoti al volo."""
+
+    def __init__(self):
+        self.pieces: List[str] = []
+        # Indice dell'ultimo <p> aperto, finché dopo di esso c'è solo spazio bianco
+        self.empty_p_start: Optional[int] = None
+
+    def add_text(self, text: str):
+        if not text:
+            return
+        self.pieces.append(text)
+        if not text.isspace():
+            self.empty_p_start = None
+
+    def add_tag(self, tag: str, closing: str, name: str):
+        if name == "img" and not closing:
+            return
+        if name == "p" and not closing:
+            self.pieces.append(tag)
+            self.empty_p_start = len(self.pieces) - 1
+            return
+        if name == "p" and closing and self.empty_p_start is not None:
+            # <p ...> seguito solo da spazi (o da immagini rimosse): il paragrafo sparisce
+            del self.pieces[self.empty_p_start:]
+            self.pieces.append("\n")
+            self.empty_p_start = None
+            return
+        self.pieces.append(tag)
+        self.empty_p_start = None
+
+    def trim_before_marker(self):
+        """
+        Rimuove gli spazi e i tag di apertura subito prima di un marcatore
+        (es. '<p><u>' in '<p><u>[SPLIT_BLOCK:x.jpg]</u></p>'), fino al <p> compreso.
+        """
+        while self.pieces:
+            last = self.pieces[-1]
+            if last.startswith("<") and not last.startswith("</") and last.endswith(">"):
+                self.pieces.pop()
+                match = TAG_REGEX.match(last)
+                if match and (match.group(2) or "").lower() == "p":
+                    break
+            elif last.isspace():
+                self.pieces.pop()
+            else:
+                stripped = last.rstrip()
+                if stripped != last:
+                    self.pieces[-1] = stripped
+                break
+        self.empty_p_start = None
+
+    def finish(self) -> str:
+        """Restituisce il frammento con le righe vuote compresse, senza spazi ai bordi."""
+        return collapse_blank_lines("".join(self.pieces)).strip()
+
+
+def collapse_blank_lines(text: str) -> str:
+    """Riduce ogni sequenza di spazi bianchi con due o più a capo a un solo '\\n'."""
+    def collapse(match):
+        run = match.group(0)
+        first = run.find("\n")
+        if first == -1 or first == run.rfind("\n"):
+            return run
+        return run[:first] + "\n" + run[run.rfind("\n") + 1:]
+    return WHITESPACE_RUN_REGEX.sub(collapse, text)
+
+
+def _parse_marker(text: str, start: int, end: int) -> Tuple[Optional[str], int, bool]:
     """
-    Applica una pre-pulizia all'HTML per rimuovere i tag HTML indesiderati 
-    (come <u>, <strong>, <span>) che il convertitore DOCX introduce all'interno 
-    del marker [SPLIT_BLOCK:...], che altrimenti impedirebbero il riconoscimento 
-    della RegEx principale.
-    
-    Il pattern cerca il marcatore contaminato e rimuove tutti i tag <...> al suo interno.
+    Prova a leggere un marcatore che inizia con '[' in text[start], senza
+    superare 'end' (la '[' successiva). I tag HTML all'interno vengono ignorati.
+    Restituisce (nome immagine o None, posizione dopo la ']', prefisso riconosciuto).
     """
-    print("DEBUG: Pre-pulizia dei marcatori SPLIT...")
-    
-    # Pattern per trovare l'intera area che va da '[' a ']' contenente SPLIT_BLOCK
-    contamination_area_pattern = re.compile(r'\[[^\]]*?SPLIT_BLOCK[^\]]*?\]', re.IGNORECASE | re.DOTALL)
-    
-    def clean_match(match):
-        # Prende il testo trovato (es. [<u>SPLIT</u>_BLOCK:AdorazionePastori.jpg])
-        contaminated_text = match.group(0)
-        
-        # Rimuove tutti i tag HTML dall'interno (es. <u>, </u>)
-        cleaned_text = re.sub(r'<\/?\w+[^>]*?>', '', contaminated_text)
-        
-        # Rimuove spazi extra e ritorna la stringa pulita (es. [SPLIT_BLOCK:AdorazionePastori.jpg])
-        return cleaned_text.strip()
+    matched = 0
+    name_chars: List[str] = []
+    i = start + 1
+    while i < end:
+        char = text[i]
+        if char == "<":
+            tag_end = text.find(">", i, end)
+            if tag_end == -1:
+                break
+            i = tag_end + 1
+            continue
+        if char == "]":
+            if matched == len(SPLIT_MARKER_PREFIX):
+                return html.unescape("".join(name_chars)).strip(), i + 1, True
+            break
+        if matched < len(SPLIT_MARKER_PREFIX):
+            if char.upper() == SPLIT_MARKER_PREFIX[matched]:
+                matched += 1
+            elif not (matched == 0 and char.isspace()):
+                break
+        else:
+            name_chars.append(char)
+        i += 1
+    return None, start + 1, matched == len(SPLIT_MARKER_PREFIX)
+
+
+def iter_split_blocks(html_content: str,
+                      split_markers: bool = True) -> Iterator[Tuple[str, Optional[str]]]:
+    """
+    Scorre l'HTML una sola volta e produce coppie (frammento_pulito, nome_immagine):
+    nome_immagine è il marcatore che chiude il frammento (None per l'ultimo).
+    I tag annidati dentro il marcatore (es. '[<u>SPLIT</u>_BLOCK:a.jpg]') e quelli
+    che lo avvolgono (es. '<p><u>[SPLIT_BLOCK:a.jpg]</u></p>') vengono assorbiti.
+    """
+    text = html_content
+    length = len(text)
+    token_regex = TOKEN_REGEX if split_markers else TAG_REGEX
+    builder = _FragmentBuilder()
+    unterminated = 0
+    pos = 0
+
+    while pos < length:
+        token = token_regex.search(text, pos)
+        if token is None:
+            builder.add_text(text[pos:])
+            break
+        builder.add_text(text[pos:token.start()])
+
+        if token.group(0) != "[":
+            builder.add_tag(token.group(0), token.group(1), (token.group(2) or "").lower())
+            pos = token.end()
+            continue
 
-    # Sostituisce tutte le aree contaminate con la versione pulita
-    sanitized_content = contamination_area_pattern.sub(clean_match, html_content)
-    
-    if sanitized_content != html_content:
-        print("DEBUG: Trovati e puliti marcatori SPLIT contaminati da HTML.")
-    
-    return sanitized_content
+        # Un candidato marcatore non supera mai la '[' successiva
+        bracket = token.start()
+        region_end = text.find("[", bracket + 1)
+        if region_end == -1:
+            region_end = length
+        name, after, prefix_found = _parse_marker(text, bracket, region_end)
+        if name is None:
+            if prefix_found:
+                unterminated += 1
+            builder.add_text("[")
+            pos = bracket + 1
+            continue
+
+        builder.trim_before_marker()
+        yield builder.finish(), name
+        builder = _FragmentBuilder()
+
+        # Assorbe spazi e tag di chiusura dopo il marcatore, fino al </p> compreso
+        pos = after
+        while pos < length:
+            if text[pos].isspace():
+                pos += 1
+                continue
+            closing_tag = TAG_REGEX.match(text, pos)
+            if closing_tag is None or not closing_tag.group(1):
+                break
+            pos = closing_tag.end()
+            if (closing_tag.group(2) or "").lower() == "p":
+                break
+
+    if unterminated:
+        print(f"ATTENZIONE: {unterminated} marcatori [SPLIT_BLOCK non chiusi da ']' sono stati trattati come testo.")
+    yield builder.finish(), None
+
+
+def clean_html_content(html_content: str) -> str:
+    """Rimuove i tag <img> e ripulisce le nuove linee/spazi superflui."""
+    return next(iter_split_blocks(html_content, split_markers=False))[0]
 
 
 def process_document(html_input: str, lang: str, page_id: str) -> Tuple[Dict[str, str], Dict[str, str]]:
@@ -92,6 +233,12 @@ def process_document(html_input: str, lang: str, page_id: str) -> Tuple[Dict[str
     Processa l'HTML grezzo: pulisce il markup dell'immagine, suddivide il contenuto
     e genera la struttura JSON per il mapping.
     """
+    fragments_html, json_data, _ = split_document(html_input, lang, page_id)
+    return fragments_html, json_data
+
+
+def split_document(html_input: str, lang: str, page_id: str) -> Tuple[Dict[str, str], Dict[str, str], List[str]]:
+    """Come process_document, restituendo anche i nomi dei marcatori in ordine di documento."""
     page_id_lower = page_id.lower()
     print(f"Inizio Elaborazione e Split: Pagina '{page_id.upper()}', Lingua '{lang}'")
 
@@ -99,52 +246,17 @@ def process_document(html_input: str, lang: str, page_id: str) -> Tuple[Dict[str
     fragment_file_prefix = get_fragment_prefix(page_id_lower)
     print(f"DEBUG: Prefisso per i nomi dei file frammento: '{fragment_file_prefix}'")
 
-    # --- STEP 0: PRE-PULIZIA DEL MARKER SPLIT ---
-    # Risolve il problema del markup indesiderato (es. <u>) all'interno di [SPLIT_BLOCK:...]
-    html_input = sanitize_split_markers(html_input)
+    # --- STEP 1: SCANSIONE (frammenti già puliti + nomi delle immagini) ---
+    blocks = list(iter_split_blocks(html_input))
+    image_filenames = [name for _, name in blocks if name is not None]
 
-    # --- STEP 1: RIMOZIONE E TOKENIZZAZIONE ---
-
-    split_token = "---SPLIT-HERE---"
-    image_filenames = []
-    
-    # Pattern per trovare l'intero blocco, inclusi eventuali tag P circostanti
-    # Questo è più sicuro per l'estrazione: cattura il nome file nel gruppo 2
-    # Esempio: <p>[SPLIT_BLOCK:nome.jpg]</p>
-    extraction_regex = re.compile(
-        r'(<p[^>]*>)?\s*\[SPLIT_BLOCK:(.*?)\]\s*(</p>)?',
-        re.IGNORECASE | re.DOTALL
-    )
-
-    # 1. Trova TUTTE le occorrenze
-    split_matches = extraction_regex.findall(html_input)
-
-    # 2. Estrai solo i nomi dei file.
-    image_filenames = [match[1].strip() for match in split_matches]
-
-    # *** DEBUG CRITICO ***
-    print(f"\n--- RISULTATO DEBUG REGEX ---")
+    print(f"\n--- RISULTATO SCANSIONE MARCATORI ---")
     print(f"Trovati {len(image_filenames)} nomi file immagine. Lista: {image_filenames}")
-
-    if not image_filenames and '[SPLIT_BLOCK:' in html_input:
-        print("ATTENZIONE: Il marker [SPLIT_BLOCK] è presente, ma la REGEX non lo cattura [Controllare encoding/spazi non visibili].")
-    print("-----------------------------\n")
-
-    # 3. Sostituisce l'intero blocco sporco con un token di split pulito
-    # Usiamo lo stesso regex di estrazione per la sostituzione (sub)
-    content_with_tokens = extraction_regex.sub(split_token, html_input)
-
-    # 4. Suddivide il contenuto. I raw_fragments sono i blocchi di testo tra i marker.
-    raw_fragments = content_with_tokens.split(split_token)
-
-    # *** DEBUG CRITICO 2 ***
-    print(f"Trovati {len(raw_fragments)} frammenti di testo grezzi prima della pulizia.")
-    # Stampa i primi 50 caratteri di ogni frammento
-    for i, frag in enumerate(raw_fragments):
+    print(f"Trovati {len(blocks)} frammenti di testo.")
+    for i, (frag, _) in enumerate(blocks):
         print(f"  Frammento {i+1} (Inizio): {frag[:50].strip()}...")
     print("------------------------------------------------------\n")
 
-
     # --- STEP 2: GENERAZIONE DATI E FILE ---
 
     fragments_html = {}  # Contiene {nome_file_html: contenuto_html}
@@ -152,12 +264,10 @@ def process_document(html_input: str, lang: str, page_id: str) -> Tuple[Dict[str
     fragment_index = 1
 
     # Processa ogni frammento di testo
-    for i, raw_html in enumerate(raw_fragments):
-
-        cleaned_html = clean_html_content(raw_html)
+    for cleaned_html, _ in blocks:
 
         # Ignora i frammenti vuoti (spesso l'ultimo frammento dopo un marker di split finale)
-        # Il primo frammento (i=0) potrebbe essere vuoto se il marker è all'inizio.
+        # Il primo frammento potrebbe essere vuoto se il marker è all'inizio.
         if not cleaned_html:
             continue
 
@@ -194,13 +304,16 @@ def process_document(html_input: str, lang: str, page_id: str) -> Tuple[Dict[str
 
         fragment_index += 1
 
-    return fragments_html, json_data
+    return fragments_html, json_data, image_filenames
 
-# Questa funzione salva i frammenti HTML e il file JSON di configurazione
-def save_results(fragments: Dict[str, str], data_json: Dict[str, str], page_id: str, lang: str):
-    """Salva i frammenti HTML e il file JSON di configurazione nella cartella di output."""
+def save_results(fragments: Dict[str, str], data_json: Dict[str, str], page_id: str, lang: str) -> List[str]:
+    """
+    Salva i frammenti HTML e il file JSON di configurazione nella cartella di output.
+    Restituisce i percorsi dei file scritti (per il manifest di build).
+    """
 
     os.makedirs(OUTPUT_DIR, exist_ok=True)
+    written = []
 
     # Salva i file frammento HTML
     for filename, content in fragments.items():
@@ -208,6 +321,7 @@ def save_results(fragments: Dict[str, str], data_json: Dict[str, str], page_id:
         try:
             with open(filepath, 'w', encoding='utf-8') as f:
                 f.write(content)
+            written.append(filepath)
             print(f"Creato file frammento: {filepath}")
         except Exception as e:
             print(f"ERRORE nella scrittura del file {filepath}: {e}")
@@ -218,19 +332,81 @@ def save_results(fragments: Dict[str, str], data_json: Dict[str, str], page_id:
     try:
         with open(json_filepath, 'w', encoding='utf-8') as f:
             json.dump(data_json, f, indent=4, ensure_ascii=False)
+        written.append(json_filepath)
         print(f"\nCreato file JSON di configurazione: {json_filepath}")
         print("Il file JSON mappa le chiavi mainTextX e imageSourceX.")
         print("\nPROCESSO COMPLETATO CON SUCCESSO.")
     except Exception as e:
         print(f"ERRORE nella scrittura del file JSON {json_filepath}: {e}")
 
+    return written
+
+
+# =========================================================================
+# BENCHMARK DELLA SCANSIONE SU INPUT PATOLOGICI
+# =========================================================================
+
+# Unità ripetute per costruire gli input di prova (nome caso -> unità)
+BENCHMARK_CASES = {
+    "documento normale": "<p>Testo del paragrafo con <b>grassetto</b> e <i>corsivo</i>.</p>\n" * 40
+                         + "<p><u>[SPLIT_BLOCK:immagine.jpg]</u></p>\n",
+    "[SPLIT_BLOCK non chiusi": "[SPLIT_BLOCK:immagine_senza_chiusura.jpg ",
+    "'<' senza '>'": "<p <img src=x ",
+    "marcatori contaminati": "<p><span>[<u>SPLIT</u>_<b>BLOCK</b>:<i>x.jpg</i>]</span></p>\n",
+    "spazi e <p> vuoti": "\n \n\t<p class=\"x\">  <img src=\"a.jpg\">  </p>\n \n",
+}
+BENCHMARK_SIZES_MB = (1, 2, 4, 8)
+
+
+def benchmark_scanner():
+    """
+    Misura iter_split_blocks su input patologici di dimensione crescente.
+    Con un tempo lineare, raddoppiare l'input raddoppia (circa) il tempo.
+    """
+    import io
+    import time
+    import contextlib
+
+    print("==================================================================")
+    print("BENCHMARK SCANSIONE SPLIT_BLOCK (tempo in secondi per dimensione)")
+    print("==================================================================")
+    header = "".join(f"{size:>7} MB" for size in BENCHMARK_SIZES_MB)
+    print(f"{'caso':<26}{header}   rapporto {BENCHMARK_SIZES_MB[-1]}x/1x")
+
+    all_linear = True
+    for case, unit in BENCHMARK_CASES.items():
+        timings = []
+        for size in BENCHMARK_SIZES_MB:
+            document = unit * (size * 1024 * 1024 // len(unit) + 1)
+            # Gli avvisi della scansione (marcatori non chiusi) non interessano qui
+            with contextlib.redirect_stdout(io.StringIO()):
+                started = time.perf_counter()
+                for _ in iter_split_blocks(document):
+                    pass
+                timings.append(time.perf_counter() - started)
+        ratio = timings[-1] / timings[0] if timings[0] else 0.0
+        # Lineare: il rapporto resta vicino al rapporto tra le dimensioni (margine 2x per il rumore)
+        linear = ratio <= 2 * BENCHMARK_SIZES_MB[-1] / BENCHMARK_SIZES_MB[0]
+        all_linear = all_linear and linear
+        cells = "".join(f"{t:>10.3f}" for t in timings)
+        print(f"{case:<26}{cells}   {ratio:.1f}x {'OK' if linear else 'NON LINEARE'}")
+
+    print("==================================================================")
+    print("Esito: tempo lineare su tutti i casi." if all_linear
+          else "ATTENZIONE: almeno un caso cresce più che linearmente.")
+    return all_linear
+
 
 # Sezione principale per l'esecuzione dello script
 if __name__ == "__main__":
     # --- Gestione Argomenti da Linea di Comando ---
-    if len(sys.argv) != 4:
+    if sys.argv[1:] == ["--benchmark"]:
+        sys.exit(0 if benchmark_scanner() else 1)
+
+    if len(sys.argv) not in (4, 5):
         print(f"ERRORE: Argomenti mancanti.")
-        print(f"Utilizzo: python {sys.argv[0]} [page_id] [lang] [docx_dir]")
+        print(f"Utilizzo: python {sys.argv[0]} [page_id] [lang] [docx_dir] [--force]")
+        print(f"          python {sys.argv[0]} --benchmark")
         print("Esempio: python {sys.argv[0]} pioggia3 it DOCS_DA_CONVERTIRE")
         sys.exit(1)
 
@@ -257,11 +433,34 @@ if __name__ == "__main__":
         print(f"ERRORE durante la lettura del file HTML grezzo: {e}")
         sys.exit(1)
         
-    # --- ESECUZIONE ---
-    fragments, config_data = process_document(raw_html_content, LANG, PAGE_ID)
-    
-    # Chiamata alla funzione di salvataggio, passando la lingua
-    save_results(fragments, config_data, PAGE_ID, LANG)
+    # --- CONTROLLO CACHE DI BUILD ---
+    # La sorgente è il file temporaneo condiviso: la chiave include lingua e pagina,
+    # l'hash include anche lingua e pagina perché determinano i nomi degli output.
+    manifest = BuildManifest()
+    source_key = f"{full_html_path}#{LANG}_{PAGE_ID}"
+    content_hash = hash_text(f"{LANG}|{PAGE_ID}|{raw_html_content}")
+
+    if "--force" not in sys.argv[4:] and manifest.is_up_to_date(BUILD_STAGE, source_key, content_hash):
+        print("HTML sorgente invariato rispetto all'ultima build: frammenti e page_config non riscritti.")
+    else:
+        # --- ESECUZIONE ---
+        fragments, config_data = process_document(raw_html_content, LANG, PAGE_ID)
+        
+        # Chiamata alla funzione di salvataggio, passando la lingua
+        written = save_results(fragments, config_data, PAGE_ID, LANG)
+
+        # Segnala i frammenti prodotti in precedenza che questa build non ha rigenerato
+        previous = manifest.entry(BUILD_STAGE, source_key) or {}
+        for old_path in previous.get("outputs", {}).get("fragments", []):
+            if old_path not in written and os.path.exists(old_path):
+                print(f"ATTENZIONE: Frammento obsoleto non più generato: {old_path}")
+
+        json_filepath = os.path.join(OUTPUT_DIR, f"page_config_{LANG}_{PAGE_ID}.json")
+        manifest.record(BUILD_STAGE, source_key, content_hash, {
+            "fragments": [p for p in written if p != json_filepath],
+            "page_config": json_filepath,
+        }, persistent=False)
+        manifest.save()
     
     # --- PULIZIA DEL FILE TEMPORANEO ---
     print(f"Pulizia del file temporaneo {TEMP_HTML_FILENAME} in {DOCX_DIR}...")
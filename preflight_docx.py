@@ -0,0 +1,294 @@
+import os
+import re
+import sys
+import time
+import zipfile
+import argparse
+import posixpath
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple
+
+# =================================================================
+# PREFLIGHT DEI DOCX PRIMA DI UN'IMPORTAZIONE MASSIVA
+# =================================================================
+# Controlla in pochi secondi centinaia di DOCX senza convertirli: legge
+# 'word/document.xml' e le relazioni direttamente dallo zip con un parser
+# XML incrementale (nessun Document python-docx), quindi la memoria resta
+# costante anche su documenti grandi. Segnala in anticipo ciò che
+# extract_images.py / process_all_pages.py scoprirebbero solo a lavoro finito:
+#   - numero di marker [SPLIT_BLOCK:...] diverso dal numero di immagini;
+#   - nomi immagine mancanti, duplicati o con estensione non supportata;
+#   - immagini referenziate ma assenti nel pacchetto;
+#   - nomi file non conformi alle convenzioni della pipeline;
+#   - versioni linguistiche della stessa pagina con marker diversi.
+
+# Cartelle controllate per default
+DEFAULT_DIRS = ["DOCS_DA_CONVERTIRE", "text_files"]
+# Cartella letta da process_all_pages.py (nomi obbligatori 'xx-pagina.docx')
+PROCESS_ALL_PAGES_DIR = "text_files"
+
+# Convenzioni dei nomi file:
+#   - text_files: come process_all_pages.extract_metadata -> [lang]-[pageID].docx
+#   - DOCS_DA_CONVERTIRE: [pageID]_[lang].docx (accettato anche [lang]-[pageID].docx)
+LANG_PAGE_PATTERN = re.compile(r"(\w{2})-([\w-]+)\.docx$", re.IGNORECASE)
+PAGE_LANG_PATTERN = re.compile(r"([\w-]+)_(\w{2})\.docx$", re.IGNORECASE)
+
+# Qualsiasi marker chiuso (il nome viene validato a parte) e marker con estensione valida
+ANY_MARKER_PATTERN = re.compile(r'\[SPLIT_BLOCK:([^\]\[]*)\]', re.IGNORECASE)
+IMAGE_NAME_PATTERN = re.compile(r'^.+\.(?:jpg|jpeg|png|gif|bmp)$', re.IGNORECASE)
+
+# Formato atteso per estensione del marker e formato reale per estensione della parte
+FORMAT_BY_EXTENSION = {
+    ".jpg": "JPEG", ".jpeg": "JPEG", ".png": "PNG", ".gif": "GIF", ".bmp": "BMP",
+    ".tif": "TIFF", ".tiff": "TIFF", ".emf": "EMF", ".wmf": "WMF", ".svg": "SVG",
+}
+
+DOCUMENT_PART = "word/document.xml"
+DOCUMENT_RELS_PART = "word/_rels/document.xml.rels"
+
+W_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+R_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+PKG_REL_NS = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+P_TAG = f"{W_NS}p"
+T_TAG = f"{W_NS}t"
+BLIP_TAG = "{http://schemas.openxmlformats.org/drawingml/2006/main}blip"
+IMAGEDATA_TAG = "{urn:schemas-microsoft-com:vml}imagedata"
+
+
+def _in_process_dir(path: str) -> bool:
+    """True se il file si trova nella cartella letta da process_all_pages.py."""
+    return os.path.basename(os.path.dirname(os.path.abspath(path))) == PROCESS_ALL_PAGES_DIR
+
+
+def parse_filename(path: str) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+    """
+    Restituisce (lang, page_id, errore_convenzione) in base alla cartella del file.
+    """
+    filename = os.path.basename(path)
+    in_process_dir = _in_process_dir(path)
+
+    match = LANG_PAGE_PATTERN.match(filename)
+    if match:
+        return match.group(1).lower(), match.group(2).lower(), None
+    if in_process_dir:
+        return None, None, ("nome non conforme a '[lang]-[pagina].docx': "
+                            "process_all_pages.py lo salterà")
+
+    match = PAGE_LANG_PATTERN.match(filename)
+    if match:
+        return match.group(2).lower(), match.group(1).lower(), None
+    return None, None, "nome non conforme a '[pagina]_[lang].docx'"
+
+
+def _read_relationships(package: zipfile.ZipFile) -> Dict[str, Tuple[str, bool]]:
+    """Relazioni del documento: Id -> (parte nello zip, è esterna)."""
+    rels = {}
+    if DOCUMENT_RELS_PART not in package.namelist():
+        return rels
+    with package.open(DOCUMENT_RELS_PART) as stream:
+        for _, element in ET.iterparse(stream, events=("end",)):
+            if element.tag != f"{PKG_REL_NS}Relationship":
+                continue
+            target = element.get("Target", "")
+            external = element.get("TargetMode") == "External"
+            if not external:
+                # Le destinazioni sono relative a 'word/' (o assolute dalla radice del pacchetto)
+                target = target.lstrip("/") if target.startswith("/") else posixpath.normpath(
+                    posixpath.join("word", target))
+            rels[element.get("Id")] = (target, external)
+            element.clear()
+    return rels
+
+
+def _scan_document(package: zipfile.ZipFile) -> Tuple[List[str], List[str], int]:
+    """
+    Legge document.xml in streaming. Restituisce i nomi dei marker, gli Id
+    delle immagini nell'ordine del documento e il numero di marker non chiusi.
+    """
+    marker_names: List[str] = []
+    image_rel_ids: List[str] = []
+    unterminated = 0
+    paragraph_text: List[str] = []
+
+    with package.open(DOCUMENT_PART) as stream:
+        for _, element in ET.iterparse(stream, events=("end",)):
+            tag = element.tag
+            if tag == T_TAG:
+                paragraph_text.append(element.text or "")
+            elif tag == BLIP_TAG:
+                image_rel_ids.append(element.get(f"{R_NS}embed"))
+            elif tag == IMAGEDATA_TAG:
+                image_rel_ids.append(element.get(f"{R_NS}id"))
+            elif tag == P_TAG:
+                text = "".join(paragraph_text)
+                paragraph_text = []
+                found = ANY_MARKER_PATTERN.findall(text)
+                marker_names.extend(name.strip() for name in found)
+                unterminated += max(0, text.upper().count("[SPLIT_BLOCK") - len(found))
+                # Libera il sottoalbero già analizzato: memoria costante
+                element.clear()
+    return marker_names, image_rel_ids, unterminated
+
+
+def check_docx(path: str) -> Dict[str, Any]:
+    """Esegue tutti i controlli su un DOCX e restituisce il report del file."""
+    lang, page_id, naming_error = parse_filename(path)
+    report: Dict[str, Any] = {
+        "path": path, "lang": lang, "page_id": page_id,
+        "errors": [], "warnings": [], "markers": [], "images": 0,
+    }
+    if naming_error:
+        report["warnings"].append(naming_error)
+
+    try:
+        with zipfile.ZipFile(path) as package:
+            names = set(package.namelist())
+            if DOCUMENT_PART not in names:
+                report["errors"].append(f"'{DOCUMENT_PART}' assente: non è un DOCX di Word")
+                return report
+            rels = _read_relationships(package)
+            marker_names, image_rel_ids, unterminated = _scan_document(package)
+    except zipfile.BadZipFile:
+        report["errors"].append("file non leggibile come zip (DOCX corrotto o file temporaneo di Word)")
+        return report
+    except ET.ParseError as e:
+        report["errors"].append(f"XML del documento non valido: {e}")
+        return report
+    except OSError as e:
+        report["errors"].append(f"impossibile leggere il file: {e}")
+        return report
+
+    report["markers"] = marker_names
+
+    # --- Immagini nell'ordine del documento (stessa logica di extract_images.document_image_parts) ---
+    image_targets: List[str] = []
+    for rel_id in image_rel_ids:
+        rel = rels.get(rel_id)
+        if rel is None:
+            report["errors"].append(f"immagine con relazione '{rel_id}' inesistente")
+            continue
+        target, external = rel
+        if external:
+            report["warnings"].append(f"immagine collegata esternamente ({target}): non verrà estratta")
+            continue
+        if target not in names:
+            report["errors"].append(f"immagine '{target}' referenziata ma assente nel pacchetto")
+            continue
+        if target not in image_targets:
+            image_targets.append(target)
+    report["images"] = len(image_targets)
+
+    # --- Marker ---
+    if unterminated:
+        report["errors"].append(f"{unterminated} marker [SPLIT_BLOCK senza ']' di chiusura")
+    seen = set()
+    for name in marker_names:
+        if not name:
+            report["errors"].append("marker [SPLIT_BLOCK:] senza nome immagine")
+        elif not IMAGE_NAME_PATTERN.match(name):
+            report["errors"].append(f"nome immagine '{name}' senza estensione supportata (jpg, jpeg, png, gif, bmp)")
+        elif name.lower() in seen:
+            report["errors"].append(f"nome immagine duplicato: '{name}'")
+        seen.add(name.lower())
+
+    # I DOCX di text_files senza marker seguono il flusso process_all_pages (split su <hr/>):
+    # lì le immagini non vengono associate a marker
+    uses_markers = marker_names or not _in_process_dir(path)
+    if uses_markers and len(marker_names) != len(image_targets):
+        report["errors"].append(
+            f"{len(marker_names)} marker ma {len(image_targets)} immagini: "
+            f"l'associazione immagine/marker sarebbe sbagliata")
+
+    # Conversioni che extract_images dovrà fare (formato del blob diverso dall'estensione del marker)
+    for name, target in zip(marker_names, image_targets):
+        wanted = FORMAT_BY_EXTENSION.get(os.path.splitext(name)[1].lower())
+        actual = FORMAT_BY_EXTENSION.get(posixpath.splitext(target)[1].lower())
+        if wanted and actual and wanted != actual:
+            report["warnings"].append(f"'{name}': immagine {actual} nel DOCX, verrà convertita in {wanted}")
+
+    return report
+
+
+def find_docx(paths: List[str]) -> List[str]:
+    """Espande cartelle e file in una lista ordinata di DOCX (esclusi i file di lock '~$')."""
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            found.extend(os.path.join(path, f) for f in sorted(os.listdir(path))
+                         if f.lower().endswith(".docx") and not f.startswith("~$"))
+        elif os.path.isfile(path):
+            found.append(path)
+        else:
+            print(f"AVVISO: '{path}' non trovato. Ignorato.")
+    return found
+
+
+def check_languages(reports: List[Dict[str, Any]]) -> List[str]:
+    """Confronta i marker delle versioni linguistiche della stessa pagina."""
+    by_page: Dict[Tuple[str, str], Dict[str, List[str]]] = {}
+    for report in reports:
+        if report["page_id"] and not report["errors"]:
+            folder = os.path.dirname(report["path"])
+            by_page.setdefault((folder, report["page_id"]), {})[report["lang"]] = report["markers"]
+
+    warnings = []
+    for (folder, page_id), langs in sorted(by_page.items()):
+        variants = {tuple(m.lower() for m in markers) for markers in langs.values()}
+        if len(variants) > 1:
+            detail = ", ".join(f"{lang}: {len(markers)}" for lang, markers in sorted(langs.items()))
+            warnings.append(f"{os.path.join(folder, page_id)}: marker diversi tra le lingue ({detail})")
+    return warnings
+
+
+def preflight(paths: List[str], workers: int = 0) -> bool:
+    """Controlla tutti i DOCX indicati e stampa il report. True se non ci sono errori."""
+    files = find_docx(paths)
+    if not files:
+        print("AVVISO: Nessun file DOCX da controllare.")
+        return True
+
+    workers = workers or os.cpu_count() or 1
+    started = time.perf_counter()
+    if workers > 1 and len(files) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(files))) as executor:
+            # map() conserva l'ordine dei file: il report è deterministico
+            reports = list(executor.map(check_docx, files, chunksize=8))
+    else:
+        reports = [check_docx(f) for f in files]
+    elapsed = time.perf_counter() - started
+
+    error_files = 0
+    for report in reports:
+        if not report["errors"] and not report["warnings"]:
+            continue
+        print(f"\n{report['path']} ({len(report['markers'])} marker, {report['images']} immagini)")
+        for error in report["errors"]:
+            print(f"  ERRORE: {error}")
+        for warning in report["warnings"]:
+            print(f"  ATTENZIONE: {warning}")
+        if report["errors"]:
+            error_files += 1
+
+    language_warnings = check_languages(reports)
+    if language_warnings:
+        print("\nCONFRONTO TRA LINGUE:")
+        for warning in language_warnings:
+            print(f"  ATTENZIONE: {warning}")
+
+    print("\n==================================================================")
+    print(f"PREFLIGHT: {len(files)} DOCX controllati in {elapsed:.2f}s, "
+          f"{error_files} con errori.")
+    print("==================================================================")
+    return error_files == 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Controllo preliminare dei DOCX prima dell'importazione.")
+    parser.add_argument("paths", nargs="*", default=DEFAULT_DIRS,
+                        help=f"Cartelle o file DOCX da controllare (default: {' '.join(DEFAULT_DIRS)}).")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="Processi in parallelo (default: numero di CPU).")
+    args = parser.parse_args()
+
+    sys.exit(0 if preflight(args.paths, args.workers) else 1)
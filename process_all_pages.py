@@ -1,19 +1,34 @@
 import os
 import re
+import sys
+import time
+import argparse
+import tempfile
+import threading
 import subprocess
 import shutil
-from typing import Tuple, Optional
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Tuple, Optional, Callable, List, Dict, Any
 
 # Importa le costanti e la funzione di splitting dal file 'split_and_update_content.py'.
 # ASSICURATI che 'split_and_update_content.py' sia nella stessa cartella.
 try:
     # CONFIG_JSON_FILE e OUTPUT_DIR sono importate da split_and_update_content.py
-    from split_and_update_content import split_and_update_content, OUTPUT_DIR, CONFIG_JSON_FILE
+    from split_and_update_content import extract_page_entry, update_config_pages, OUTPUT_DIR, CONFIG_JSON_FILE
 except ImportError:
     print("ERRORE: Impossibile importare 'split_and_update_content.py'. Assicurati che il file sia nella stessa directory.")
     # Esci in caso di errore di importazione critico
     exit(1)
 
+from libreoffice_server import LibreOfficeServer, UNO_AVAILABLE
+from build_cache import BuildManifest, report_orphans
+from snapshot_store import take_snapshot
+from docx_to_html_base import docx_to_html, UnsupportedDocxContent
+
+# Nome della fase nel manifest di build (build_cache.py)
+BUILD_STAGE = "process_all_pages"
+
 # =================================================================
 # CONFIGURAZIONE UTENTE
 # =================================================================
@@ -37,9 +52,11 @@ def extract_metadata(filename: str) -> Optional[Tuple[str, str]]:
         return lang, page_id
     return None
 
-def word_to_html_converter(docx_path: str, html_output_path: str) -> bool:
+def word_to_html_converter(docx_path: str, html_output_path: str, profile_dir: Optional[str] = None) -> bool:
     """
     Esegue la conversione DOCX -> HTML utilizzando LibreOffice in modalità headless.
+    Se 'profile_dir' è indicato, LibreOffice usa quel profilo utente privato
+    (necessario quando più istanze girano in parallelo).
     """
     print(f"\n--- PASSO 1: CONVERSIONE DOCX -> HTML per: {os.path.basename(docx_path)} ---")
     
@@ -60,6 +77,8 @@ def word_to_html_converter(docx_path: str, html_output_path: str) -> bool:
         docx_path, # Il file da convertire
         '--outdir', output_dir # La directory dove salvare l'output
     ]
+    if profile_dir:
+        command.append(f"-env:UserInstallation={Path(profile_dir).resolve().as_uri()}")
     
     # Rimuovi eventuali file HTML generati in precedenza con lo stesso nome
     if os.path.exists(generated_path):
@@ -97,10 +116,50 @@ def word_to_html_converter(docx_path: str, html_output_path: str) -> bool:
         return False
 
 
-def process_all_pages():
+def python_docx_converter(docx_path: str, html_output_path: str,
+                          fallback: Optional[Callable[[str, str], bool]] = None) -> bool:
+    """
+    Esegue la conversione DOCX -> HTML in puro Python (docx_to_html_base).
+    Se il documento contiene elementi non gestiti, o la conversione fallisce,
+    ripiega sul convertitore LibreOffice 'fallback'.
+    """
+    print(f"\n--- PASSO 1: CONVERSIONE DOCX -> HTML (python-docx) per: {os.path.basename(docx_path)} ---")
+    try:
+        # Le immagini in linea vengono scritte accanto all'HTML, come fa LibreOffice
+        html_content = docx_to_html(docx_path, image_dir=os.path.dirname(html_output_path), strict=True)
+        with open(html_output_path, 'w', encoding='utf-8') as f:
+            f.write(html_content)
+        print(f"Conversione RIUSCITA. File salvato in: {html_output_path}")
+        return True
+    except UnsupportedDocxContent as e:
+        print(f"AVVISO: Contenuto non gestito dal convertitore Python ({e}).")
+    except Exception as e:
+        print(f"ERRORE durante la conversione Python: {e}")
+
+    if fallback is None:
+        return False
+    print("Fallback su LibreOffice...")
+    return fallback(docx_path, html_output_path)
+
+
+def find_docx_files() -> List[str]:
+    """Restituisce i file .docx presenti nella directory di output ('text_files')."""
+    return [f for f in os.listdir(OUTPUT_DIR) if f.lower().endswith('.docx')]
+
+
+def process_all_pages(engine: str = "python", workers: int = 1, force: bool = False):
     """
     Trova tutti i file DOCX, li converte in HTML e poi aggiorna il JSON
     tramite lo script di splitting.
+
+    engine:
+      - "python": conversione in puro Python, LibreOffice solo come fallback (default);
+      - "subprocess": un processo soffice per ogni file (comportamento storico);
+      - "server": una sola istanza LibreOffice in ascolto, riusata per tutti i file.
+    workers: numero di conversioni in parallelo. Ogni worker usa un proprio
+    LibreOffice con profilo utente privato; config.json viene scritto una sola
+    volta a fine batch.
+    force: ignora il manifest di build e riconverte anche i DOCX invariati.
     """
     # Assicurati che la directory OUTPUT_DIR esista
     if not os.path.exists(OUTPUT_DIR):
@@ -108,58 +167,261 @@ def process_all_pages():
         os.makedirs(OUTPUT_DIR)
         
     # Trova tutti i file .docx nella directory di output ('text_files')
-    docx_files = [f for f in os.listdir(OUTPUT_DIR) if f.lower().endswith('.docx')]
+    docx_files = find_docx_files()
     
     if not docx_files:
         print(f"AVVISO: Nessun file '.docx' trovato nella cartella '{OUTPUT_DIR}'. Nulla da processare.")
         return
 
     print(f"Trovati {len(docx_files)} file DOCX da processare...")
-    
-    total_processed = 0
 
+    if engine == "server" and not UNO_AVAILABLE:
+        print("AVVISO: Modulo 'uno' non disponibile. Uso la conversione per-file (subprocess).")
+        engine = "subprocess"
+
+    manifest = BuildManifest()
+    jobs = []
+    source_hashes = {}
+    skipped = 0
     for docx_filename in docx_files:
         metadata = extract_metadata(docx_filename)
         if not metadata:
             print(f"AVVISO: Nome file non valido '{docx_filename}' (formato atteso: 'xx-nomepagina.docx'). Saltato.")
             continue
-        
-        lang, base_id = metadata
         docx_filepath = os.path.join(OUTPUT_DIR, docx_filename)
-        
-        # 1. Definizione del nome del file HTML di input atteso dallo script di split
-        # Esempio: it_cavaticcio_maintext_INPUT.html
-        html_input_filename = f"{lang}_{base_id}_maintext_INPUT.html"
-        html_input_filepath = os.path.join(OUTPUT_DIR, html_input_filename)
-        
-        print(f"\n==================================================================")
-        print(f"PAGINA: {base_id} ({lang.upper()}) | File DOCX: {docx_filename}")
-        print(f"==================================================================")
-        
-        # --- PASSO 1: CONVERSIONE DOCX -> HTML (usa LibreOffice) ---
-        conversion_success = word_to_html_converter(docx_filepath, html_input_filepath)
-        
-        if not conversion_success:
-            print(f"SKIP: Conversione fallita per '{docx_filename}'. Passaggio alla pagina successiva.")
+        content_hash = manifest.source_hash(BUILD_STAGE, docx_filepath)
+        if not force and manifest.is_up_to_date(BUILD_STAGE, docx_filepath, content_hash):
+            skipped += 1
+            continue
+        source_hashes[docx_filename] = content_hash
+        jobs.append((docx_filename, *metadata))
+
+    if skipped:
+        print(f"{skipped} DOCX invariati rispetto all'ultima build: saltati.")
+    if not jobs:
+        print("Nessun DOCX modificato. Nulla da riconvertire.")
+        report_orphans(manifest, BUILD_STAGE)
+        return
+
+    workers = max(1, min(workers, len(jobs) or 1))
+    pool = _ConverterPool(engine)
+    try:
+        if workers == 1:
+            results = [_convert_and_split(job, pool.converter()) for job in jobs]
+        else:
+            print(f"Modalità parallela: {workers} worker, motore '{engine}' (profilo LibreOffice privato per worker).")
+            results = []
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(lambda job: _convert_and_split(job, pool.converter()), job) for job in jobs]
+                for future in as_completed(futures):
+                    results.append(future.result())
+    finally:
+        pool.close()
+
+    _report_results(results)
+
+    # Registra nel manifest solo le pagine completate con successo
+    for r in results:
+        if r["entry"] is None:
             continue
-            
-        # --- PASSO 2: SPLITTING E AGGIORNAMENTO JSON ---
-        print(f"\n--- PASSO 2: SPLIT HTML e AGGIORNAMENTO JSON ---")
-        try:
-            # Chiama la funzione di splitting importata da split_and_update_content.py
-            split_and_update_content(html_input_filepath, base_id, lang, CONFIG_JSON_FILE)
-            total_processed += 1
-            print(f"AGGIORNAMENTO RIUSCITO per {base_id} ({lang.upper()}).")
-        except Exception as e:
-            print(f"ERRORE CRITICO NELLO SPLIT per {docx_filename}: {e}")
-            
-        print(f"------------------------------------------------------------------")
+        lang, base_id = extract_metadata(r["file"])
+        manifest.record(BUILD_STAGE, os.path.join(OUTPUT_DIR, r["file"]), source_hashes[r["file"]], {
+            "html_input": os.path.join(OUTPUT_DIR, f"{lang}_{base_id}_maintext_INPUT.html"),
+            "debug_output": os.path.join(OUTPUT_DIR, f"{lang}_{base_id}_processed_OUTPUT.html"),
+            "config": CONFIG_JSON_FILE,
+        })
+    manifest.save()
+    report_orphans(manifest, BUILD_STAGE)
+    # Stato dei texts.json, dei frammenti e delle pagine dopo la conversione (snapshot_store.py)
+    take_snapshot(BUILD_STAGE)
+
+
+class _ConverterPool:
+    """
+    Fornisce a ogni thread worker il proprio convertitore DOCX -> HTML, con un
+    profilo utente LibreOffice privato (evita il blocco condiviso del profilo).
+    Con il motore "python" LibreOffice viene avviato solo se serve il fallback.
+    """
+
+    def __init__(self, engine: str):
+        self.engine = engine
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._servers = []
+        self._profiles = []
+
+    def converter(self) -> Callable[[str, str], bool]:
+        existing = getattr(self._local, 'converter', None)
+        if existing is not None:
+            return existing
+
+        if self.engine == "python":
+            converter = lambda docx_path, html_path: python_docx_converter(
+                docx_path, html_path, fallback=self._libreoffice_converter())
+        else:
+            converter = self._libreoffice_converter()
+
+        self._local.converter = converter
+        return converter
+
+    def _libreoffice_converter(self) -> Callable[[str, str], bool]:
+        """Convertitore LibreOffice del thread corrente, creato alla prima richiesta."""
+        existing = getattr(self._local, 'libreoffice', None)
+        if existing is not None:
+            return existing
+
+        if self.engine == "server":
+            server = LibreOfficeServer(SOFFICE_TOOL_PATH)
+            server.start()
+            with self._lock:
+                self._servers.append(server)
+            converter = server.convert
+        else:
+            profile_dir = None
+
+            def converter(docx_path, html_path):
+                # Il profilo privato viene creato solo alla prima conversione reale
+                nonlocal profile_dir
+                if profile_dir is None:
+                    profile_dir = tempfile.mkdtemp(prefix="lo_profile_")
+                    with self._lock:
+                        self._profiles.append(profile_dir)
+                return word_to_html_converter(docx_path, html_path, profile_dir)
+
+        self._local.libreoffice = converter
+        return converter
+
+    def close(self):
+        """Arresta i server e rimuove i profili temporanei creati dai worker."""
+        for server in self._servers:
+            if server.restarts:
+                print(f"NOTA: Un server LibreOffice è stato riavviato {server.restarts} volte.")
+            server.stop()
+        for profile_dir in self._profiles:
+            shutil.rmtree(profile_dir, ignore_errors=True)
+
+
+def _convert_and_split(job: Tuple[str, str, str], converter: Callable[[str, str], bool]) -> Dict[str, Any]:
+    """
+    Converte un DOCX e ne estrae il blocco pagina. Restituisce un dizionario con
+    l'esito (mai eccezioni): il salvataggio di config.json avviene dopo, una volta sola.
+    """
+    docx_filename, lang, base_id = job
+    result = {"file": docx_filename, "page_key": f"{lang}_{base_id}", "entry": None,
+              "error": None, "seconds": 0.0}
+    docx_filepath = os.path.join(OUTPUT_DIR, docx_filename)
+
+    # 1. Definizione del nome del file HTML di input atteso dallo script di split
+    # Esempio: it_cavaticcio_maintext_INPUT.html
+    html_input_filename = f"{lang}_{base_id}_maintext_INPUT.html"
+    html_input_filepath = os.path.join(OUTPUT_DIR, html_input_filename)
+
+    print(f"\nPAGINA: {base_id} ({lang.upper()}) | File DOCX: {docx_filename}")
+
+    # --- PASSO 1: CONVERSIONE DOCX -> HTML ---
+    started = time.perf_counter()
+    try:
+        conversion_success = converter(docx_filepath, html_input_filepath)
+    except Exception as e:
+        conversion_success = False
+        result["error"] = f"Conversione: {e}"
+    result["seconds"] = time.perf_counter() - started
+
+    if not conversion_success:
+        result["error"] = result["error"] or "Conversione fallita"
+        return result
+
+    # --- PASSO 2: SPLITTING (il JSON viene aggiornato a fine batch) ---
+    try:
+        entry = extract_page_entry(html_input_filepath, base_id, lang)
+        if entry is None:
+            result["error"] = "Split: HTML non valido o senza <body>"
+        else:
+            result["entry"] = entry
+    except Exception as e:
+        result["error"] = f"Split: {e}"
+    return result
+
+
+def _report_results(results: List[Dict[str, Any]]):
+    """Scrive config.json una sola volta e stampa il riepilogo per file."""
+    page_entries = {r["page_key"]: r["entry"] for r in results if r["entry"] is not None}
+    failures = [r for r in results if r["error"]]
+
+    if page_entries:
+        print(f"\n--- AGGIORNAMENTO JSON ({len(page_entries)} pagine) ---")
+        update_config_pages(CONFIG_JSON_FILE, page_entries)
+
+    conversion_seconds = sum(r["seconds"] for r in results)
 
     print("\n==================================================================")
-    print(f"PROCESSO COMPLETO. {total_processed} pagine aggiornate con successo.")
+    print(f"PROCESSO COMPLETO. {len(page_entries)} pagine aggiornate con successo.")
+    for r in sorted(failures, key=lambda r: r["file"]):
+        print(f"  ERRORE {r['file']}: {r['error']}")
+    if results:
+        print(f"Tempo di conversione: {conversion_seconds:.2f}s cumulativi, {conversion_seconds / len(results):.2f}s per file.")
     print(f"Verifica il file '{CONFIG_JSON_FILE}' e la cartella '{OUTPUT_DIR}'.")
     print("==================================================================")
 
 
+def benchmark_conversion(sample_size: int = 3):
+    """
+    Confronta la conversione per-file (un soffice per DOCX) con il server
+    LibreOffice sempre attivo, sugli stessi primi 'sample_size' file.
+    Gli HTML di prova vengono scritti in una cartella temporanea e poi rimossi.
+    """
+    if not UNO_AVAILABLE:
+        print("ERRORE: Il benchmark richiede il modulo 'uno' (Python di LibreOffice).")
+        return
+
+    sample = [f for f in find_docx_files() if extract_metadata(f)][:sample_size]
+    if not sample:
+        print(f"AVVISO: Nessun DOCX valido in '{OUTPUT_DIR}' per il benchmark.")
+        return
+
+    bench_dir = os.path.join(OUTPUT_DIR, "_benchmark_conversion")
+    os.makedirs(bench_dir, exist_ok=True)
+    try:
+        started = time.perf_counter()
+        for docx_filename in sample:
+            word_to_html_converter(os.path.join(OUTPUT_DIR, docx_filename),
+                                   os.path.join(bench_dir, f"sub_{docx_filename}.html"))
+        subprocess_seconds = time.perf_counter() - started
+
+        # Il tempo del server include avvio e arresto: è il costo reale di un batch
+        started = time.perf_counter()
+        with LibreOfficeServer(SOFFICE_TOOL_PATH) as server:
+            for docx_filename in sample:
+                server.convert(os.path.join(OUTPUT_DIR, docx_filename),
+                               os.path.join(bench_dir, f"srv_{docx_filename}.html"))
+        server_seconds = time.perf_counter() - started
+    finally:
+        shutil.rmtree(bench_dir, ignore_errors=True)
+
+    print("\n==================================================================")
+    print(f"BENCHMARK CONVERSIONE su {len(sample)} file")
+    print(f"  Per-file (subprocess): {subprocess_seconds:.2f}s ({subprocess_seconds / len(sample):.2f}s per file)")
+    print(f"  Server LibreOffice:    {server_seconds:.2f}s ({server_seconds / len(sample):.2f}s per file)")
+    if server_seconds > 0:
+        print(f"  Speedup: {subprocess_seconds / server_seconds:.1f}x")
+    print("==================================================================")
+
+
 if __name__ == "__main__":
-    process_all_pages()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Converte i DOCX in 'text_files' e aggiorna config.json.")
+    parser.add_argument("--engine", choices=["python", "subprocess", "server"], default="python",
+                        help="'python' (default) converte senza LibreOffice; 'server' riusa una sola "
+                             "istanza LibreOffice per tutti i file.")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Numero di conversioni in parallelo (default 1).")
+    parser.add_argument("--force", action="store_true",
+                        help="Riconverte tutti i DOCX ignorando il manifest di build.")
+    parser.add_argument("--benchmark", type=int, nargs="?", const=3, metavar="N",
+                        help="Confronta i due motori sui primi N file (default 3) e termina.")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark_conversion(args.benchmark)
+        sys.exit(0)
+
+    process_all_pages(args.engine, args.workers, args.force)
@@ -0,0 +1,345 @@
+import os
+import re
+import sys
+import json
+import zlib
+import time
+import difflib
+import hashlib
+import argparse
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from atomic_io import atomic_write_bytes, atomic_write_json, file_lock
+from translation_store import TranslationStore, TRANSLATIONS_DIR, TEXTS_JSON_FILENAME
+
+# =================================================================
+# ARCHIVIO DEGLI SNAPSHOT (TEXTS.JSON, FRAMMENTI, PAGINE HTML)
+# =================================================================
+# Per tornare indietro si usavano file HISTORY_BCK_*.txt, copie *.bak accanto
+# agli HTML e agli script e archivi interi data/translations_v1.7z, v2.7z:
+# lenti da creare e da ripristinare (si estrae tutto per recuperare una
+# pagina). Qui, dopo ogni esecuzione della pipeline, viene registrato uno
+# snapshot di texts.json, config.json, frammenti e pagine HTML generate:
+#   - ogni contenuto è un oggetto compresso (zlib) in .snapshots/objects/,
+#     indicato con il suo hash: i file invariati non occupano altro spazio;
+#   - una piccola modifica a un file viene salvata come differenza (per
+#     righe, difflib) rispetto alla sua versione precedente, con catene
+#     lunghe al massimo MAX_DELTA_CHAIN;
+#   - .snapshots/index.json elenca gli snapshot con i loro file: l'elenco
+#     non legge nessun oggetto;
+#   - il ripristino di una pagina o di una lingua legge solo gli oggetti
+#     che le appartengono (per una pagina: il suo blocco nei texts.json, i
+#     frammenti e l'HTML generato).
+#   python snapshot_store.py                       # nuovo snapshot
+#   python snapshot_store.py --elenco
+#   python snapshot_store.py --ripristina 20260110_174500 --pagina pioggia1 [--lingua it] [--prova]
+#   python snapshot_store.py --mantieni 50         # elimina gli snapshot più vecchi
+# Il ripristino riscrive solo i file diversi e non cancella quelli nati dopo lo snapshot.
+
+SNAPSHOT_DIR = ".snapshots"
+INDEX_VERSION = 1
+FRAGMENTS_DIR = "text_files"
+CONFIG_JSON_FILE = os.path.join(FRAGMENTS_DIR, "config.json")
+# Lunghezza massima di una catena di differenze (oltre si salva il file intero)
+MAX_DELTA_CHAIN = 16
+# La differenza si usa solo se compressa occupa meno di questa frazione del file intero
+DELTA_MAX_RATIO = 0.5
+# Tipo di oggetto (primo byte del contenuto decompresso)
+BLOB_FULL = b"B"
+BLOB_DELTA = b"D"
+
+# <lingua>_<pagina>_maintextN, <lingua>-<pagina>_mainTextN, <lingua>_<pagina>
+LANG_PAGE_REGEX = re.compile(r'^(?P<lang>[a-z]{2})[_-](?P<page>\w+?)(?:_maintext\w*)?$', re.IGNORECASE)
+# <pagina>-<lingua>
+PAGE_LANG_REGEX = re.compile(r'^(?P<page>[\w.]+)-(?P<lang>[a-z]{2})$', re.IGNORECASE)
+
+
+def snapshot_paths() -> List[str]:
+    """File registrati negli snapshot (percorsi relativi con '/')."""
+    paths = []
+    if os.path.isdir(TRANSLATIONS_DIR):
+        for lang in sorted(os.listdir(TRANSLATIONS_DIR)):
+            texts_path = os.path.join(TRANSLATIONS_DIR, lang, TEXTS_JSON_FILENAME)
+            if os.path.isfile(texts_path):
+                paths.append(texts_path)
+    if os.path.isfile(CONFIG_JSON_FILE):
+        paths.append(CONFIG_JSON_FILE)
+    if os.path.isdir(FRAGMENTS_DIR):
+        paths += sorted(os.path.join(FRAGMENTS_DIR, f) for f in os.listdir(FRAGMENTS_DIR) if f.endswith(".html"))
+    paths += sorted(f for f in os.listdir(".") if f.endswith(".html") and os.path.isfile(f))
+    return [p.replace(os.sep, "/") for p in paths]
+
+
+def file_scope(path: str, languages: List[str]) -> Tuple[Optional[str], Optional[str]]:
+    """(lingua, pagina) a cui appartiene il file; None dove non si applica."""
+    parts = path.split("/")
+    if len(parts) == 4 and "/".join(parts[:2]) == TRANSLATIONS_DIR.replace(os.sep, "/") and parts[3] == TEXTS_JSON_FILENAME:
+        return parts[2], None
+    name, extension = os.path.splitext(parts[-1])
+    if extension != ".html":
+        return None, None
+    match = PAGE_LANG_REGEX.match(name)
+    if match and match.group("lang").lower() in languages:
+        return match.group("lang").lower(), match.group("page")
+    match = LANG_PAGE_REGEX.match(name)
+    if match and match.group("lang").lower() in languages:
+        return match.group("lang").lower(), match.group("page")
+    return None, name
+
+
+def _make_delta(base: bytes, content: bytes) -> bytes:
+    """Differenza per righe: [inizio, fine] copia righe della base, una stringa inserisce testo."""
+    base_lines = base.splitlines(keepends=True)
+    new_lines = content.splitlines(keepends=True)
+    ops: List[Any] = []
+    matcher = difflib.SequenceMatcher(None, base_lines, new_lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            ops.append([i1, i2])
+        elif j2 > j1:
+            ops.append(b"".join(new_lines[j1:j2]).decode('utf-8', 'surrogateescape'))
+    return json.dumps(ops, separators=(",", ":")).encode('ascii')
+
+
+def _apply_delta(base: bytes, delta: bytes) -> bytes:
+    base_lines = base.splitlines(keepends=True)
+    chunks = []
+    for op in json.loads(delta):
+        if isinstance(op, list):
+            chunks.append(b"".join(base_lines[op[0]:op[1]]))
+        else:
+            chunks.append(op.encode('utf-8', 'surrogateescape'))
+    return b"".join(chunks)
+
+
+class SnapshotStore:
+    """Oggetti compressi e indice degli snapshot in SNAPSHOT_DIR."""
+
+    def __init__(self, root: str = SNAPSHOT_DIR):
+        self.root = root
+        self.objects_dir = os.path.join(root, "objects")
+        self.index_path = os.path.join(root, "index.json")
+        self.index = self._load_index()
+        self._cache: Dict[str, bytes] = {}
+
+    def _load_index(self) -> Dict[str, Any]:
+        empty = {"version": INDEX_VERSION, "snapshots": [], "objects": {}}
+        if not os.path.exists(self.index_path):
+            return empty
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+        except (json.JSONDecodeError, OSError) as e:
+            print(f"ERRORE: Indice degli snapshot illeggibile ({e}).")
+            raise
+        if index.get("version") != INDEX_VERSION:
+            print(f"ATTENZIONE: Versione dell'indice degli snapshot non supportata: {index.get('version')}.")
+        return index
+
+    def _save_index(self):
+        atomic_write_json(self.index_path, self.index, indent=1, sort_keys=True)
+
+    @property
+    def snapshots(self) -> List[Dict[str, Any]]:
+        return self.index["snapshots"]
+
+    def find(self, snapshot_id: str) -> Optional[Dict[str, Any]]:
+        """Snapshot con questo id (o l'unico che inizia così; "ultimo" = il più recente)."""
+        if snapshot_id == "ultimo":
+            return self.snapshots[-1] if self.snapshots else None
+        matches = [s for s in self.snapshots if s["id"].startswith(snapshot_id)]
+        exact = [s for s in matches if s["id"] == snapshot_id]
+        return (exact or matches)[0] if len(exact or matches) == 1 else None
+
+    # --- Oggetti ---
+
+    def _object_path(self, digest: str) -> str:
+        return os.path.join(self.objects_dir, digest[:2], digest[2:])
+
+    def _store(self, content: bytes, previous: Optional[str]) -> str:
+        """Salva il contenuto (se nuovo), come differenza da 'previous' quando conviene."""
+        digest = hashlib.sha256(content).hexdigest()
+        if digest in self.index["objects"]:
+            return digest
+        payload = zlib.compress(BLOB_FULL + content, 9)
+        info = {"base": None, "depth": 0, "size": len(content)}
+        base_info = self.index["objects"].get(previous) if previous else None
+        if base_info and base_info["depth"] < MAX_DELTA_CHAIN:
+            delta = zlib.compress(BLOB_DELTA + previous.encode('ascii') + b"\n"
+                                  + _make_delta(self.read(previous), content), 9)
+            if len(delta) < len(payload) * DELTA_MAX_RATIO:
+                payload = delta
+                info.update(base=previous, depth=base_info["depth"] + 1)
+        info["stored"] = len(payload)
+        path = self._object_path(digest)
+        if not os.path.exists(path):
+            atomic_write_bytes(path, payload)
+        self.index["objects"][digest] = info
+        self._cache[digest] = content
+        return digest
+
+    def read(self, digest: str) -> bytes:
+        """Contenuto dell'oggetto, ricostruendo l'eventuale catena di differenze."""
+        if digest in self._cache:
+            return self._cache[digest]
+        with open(self._object_path(digest), 'rb') as f:
+            payload = zlib.decompress(f.read())
+        if payload[:1] == BLOB_DELTA:
+            header, delta = payload[1:].split(b"\n", 1)
+            content = _apply_delta(self.read(header.decode('ascii')), delta)
+        else:
+            content = payload[1:]
+        if hashlib.sha256(content).hexdigest() != digest:
+            raise ValueError(f"oggetto {digest[:12]} corrotto")
+        self._cache[digest] = content
+        return content
+
+    # --- Snapshot ---
+
+    def take(self, label: str = "") -> Optional[Dict[str, Any]]:
+        """Registra lo stato attuale. Restituisce lo snapshot, None se nulla è cambiato dall'ultimo."""
+        with file_lock(self.index_path):
+            self.index = self._load_index()
+            previous = self.snapshots[-1]["files"] if self.snapshots else {}
+            files = {}
+            for path in snapshot_paths():
+                with open(path, 'rb') as f:
+                    files[path] = self._store(f.read(), previous.get(path))
+            if files == previous:
+                return None
+            snapshot_id = datetime.now().strftime("%Y%m%d_%H%M%S")
+            existing = {s["id"] for s in self.snapshots}
+            suffix = 2
+            while snapshot_id in existing:
+                snapshot_id = f"{snapshot_id[:15]}_{suffix}"
+                suffix += 1
+            snapshot = {"id": snapshot_id, "created": datetime.now().isoformat(timespec="seconds"),
+                        "label": label, "files": files}
+            self.snapshots.append(snapshot)
+            self._save_index()
+        return snapshot
+
+    def restore(self, snapshot: Dict[str, Any], lang: Optional[str] = None, page_id: Optional[str] = None,
+                dry_run: bool = False) -> List[str]:
+        """
+        Riporta i file (o solo quelli della lingua/pagina) allo stato dello
+        snapshot. Per una pagina, dei texts.json si ripristina solo il suo blocco.
+        Restituisce i file che cambiano.
+        """
+        languages = sorted({file_scope(path, [])[0] for path in snapshot["files"]} - {None})
+        changed = []
+        store = TranslationStore(languages=languages)
+        for path, digest in sorted(snapshot["files"].items()):
+            file_lang, file_page = file_scope(path, languages)
+            if lang and file_lang != lang:
+                continue
+            if page_id and path.endswith("/" + TEXTS_JSON_FILENAME):
+                # texts.json: solo il blocco della pagina
+                data = json.loads(self.read(digest)).get(page_id)
+                if store.replace_page(file_lang, page_id, data):
+                    changed.append(f"{path} [{page_id}]")
+                continue
+            if page_id and file_page != page_id:
+                continue
+            content = self.read(digest)
+            current = None
+            if os.path.isfile(path):
+                with open(path, 'rb') as f:
+                    current = f.read()
+            if current == content:
+                continue
+            changed.append(path)
+            if not dry_run:
+                with file_lock(path):
+                    atomic_write_bytes(path, content)
+        if not dry_run:
+            store.flush()
+        return changed
+
+    def prune(self, keep: int) -> Tuple[int, int]:
+        """Tiene gli ultimi 'keep' snapshot. Restituisce (snapshot eliminati, byte liberati)."""
+        with file_lock(self.index_path):
+            self.index = self._load_index()
+            removed = self.snapshots[:-keep] if keep > 0 else list(self.snapshots)
+            if not removed:
+                return 0, 0
+            del self.snapshots[:len(removed)]
+            live = set()
+            for snapshot in self.snapshots:
+                for digest in snapshot["files"].values():
+                    # Un oggetto serve anche come base delle differenze che lo usano
+                    while digest and digest not in live:
+                        live.add(digest)
+                        digest = self.index["objects"][digest]["base"]
+            freed = 0
+            for digest in [d for d in self.index["objects"] if d not in live]:
+                freed += self.index["objects"].pop(digest)["stored"]
+                try:
+                    os.remove(self._object_path(digest))
+                except OSError:
+                    pass
+            self._save_index()
+        return len(removed), freed
+
+
+def take_snapshot(label: str = "") -> Optional[Dict[str, Any]]:
+    """Snapshot a fine pipeline: non interrompe mai la fase che lo chiama."""
+    started = time.perf_counter()
+    try:
+        snapshot = SnapshotStore().take(label)
+    except Exception as e:
+        print(f"ATTENZIONE: Snapshot non registrato: {e}")
+        return None
+    if snapshot:
+        print(f"Snapshot {snapshot['id']} registrato ({len(snapshot['files'])} file, "
+              f"{(time.perf_counter() - started) * 1000:.0f} ms).")
+    return snapshot
+
+
+def print_snapshots(store: SnapshotStore):
+    objects = store.index["objects"]
+    print(f"{'snapshot':<20}{'file':>6}{'nuovi':>7}  etichetta")
+    seen = set()
+    for snapshot in store.snapshots:
+        digests = set(snapshot["files"].values())
+        print(f"{snapshot['id']:<20}{len(snapshot['files']):>6}{len(digests - seen):>7}  {snapshot['label']}")
+        seen |= digests
+    size = sum(info["size"] for info in objects.values())
+    stored = sum(info["stored"] for info in objects.values())
+    deltas = sum(1 for info in objects.values() if info["base"])
+    print(f"{len(store.snapshots)} snapshot, {len(objects)} oggetti ({deltas} come differenza): "
+          f"{size / 1024:.0f} KB di contenuto in {stored / 1024:.0f} KB.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Snapshot di texts.json, frammenti e pagine HTML generate.")
+    parser.add_argument("--etichetta", default="manuale", help="Descrizione del nuovo snapshot.")
+    parser.add_argument("--elenco", action="store_true", help="Elenca gli snapshot.")
+    parser.add_argument("--ripristina", metavar="ID", help="Snapshot da ripristinare ('ultimo' per il più recente).")
+    parser.add_argument("--lingua", help="Ripristina solo questa lingua.")
+    parser.add_argument("--pagina", help="Ripristina solo questa pagina.")
+    parser.add_argument("--prova", action="store_true", help="Mostra i file che cambierebbero, senza scriverli.")
+    parser.add_argument("--mantieni", type=int, metavar="N", help="Elimina tutti gli snapshot tranne gli ultimi N.")
+    args = parser.parse_args()
+
+    store = SnapshotStore()
+    if args.elenco:
+        print_snapshots(store)
+    elif args.ripristina:
+        snapshot = store.find(args.ripristina)
+        if snapshot is None:
+            print(f"ERRORE: Snapshot '{args.ripristina}' non trovato o ambiguo.")
+            sys.exit(1)
+        started = time.perf_counter()
+        changed = store.restore(snapshot, args.lingua, args.pagina, args.prova)
+        for path in changed:
+            print(f"  - {path}")
+        verb = "da ripristinare" if args.prova else "ripristinati"
+        print(f"Snapshot {snapshot['id']}: {len(changed)} file {verb} "
+              f"in {(time.perf_counter() - started) * 1000:.0f} ms.")
+    elif args.mantieni is not None:
+        removed, freed = store.prune(args.mantieni)
+        print(f"Eliminati {removed} snapshot ({freed / 1024:.0f} KB liberati).")
+    elif take_snapshot(args.etichetta) is None and store.snapshots:
+        print("Nessuna modifica dall'ultimo snapshot.")
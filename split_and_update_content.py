@@ -1,8 +1,19 @@
 import os
 import re
+import sys
 import json
-from bs4 import BeautifulSoup
-from typing import Dict, Any, List
+import html
+import time
+import shutil
+import tempfile
+from bs4 import BeautifulSoup, NavigableString, Tag
+from typing import Dict, Any, List, Optional
+
+try:
+    import lxml  # noqa: F401 (installato insieme a python-docx)
+    HTML_PARSER = "lxml"
+except ImportError:
+    HTML_PARSER = "html.parser"
 
 # =================================================================
 # COSTANTI DI CONFIGURAZIONE
@@ -15,6 +26,11 @@ OUTPUT_DIR = "text_files"
 # Nome del file JSON di configurazione principale da aggiornare
 CONFIG_JSON_FILE = os.path.join(OUTPUT_DIR, "config.json")
 
+# Tag contenitore generati da LibreOffice/Word: vengono rimossi lasciando il contenuto
+UNWRAPPED_TAGS = {"div", "span"}
+# Attributi di formattazione non necessari
+DROPPED_ATTRIBUTES = {"style", "class"}
+
 # =================================================================
 # FUNZIONI DI SUPPORTO
 # =================================================================
@@ -23,19 +39,63 @@ def clean_html_content(html_content: str) -> str:
     """
     Rimuove i tag indesiderati e le classi di formattazione non necessarie
     dal contenuto HTML grezzo generato da LibreOffice.
+    (Per l'HTML già analizzato, extract_page_entry pulisce durante la visita del DOM.)
     """
-    # 1. Rimuovi i tag superflui generati da LibreOffice/Word
-    html_content = re.sub(r'<(div|span)\s+[^>]*>', '', html_content)
-    html_content = re.sub(r'</(div|span)>', '', html_content)
+    soup = BeautifulSoup(html_content, HTML_PARSER)
+    root = soup.body or soup
+    return collapse_whitespace("".join(serialize_clean(child) for child in root.children))
 
-    # 2. Rimuovi gli attributi di stile e classe
-    html_content = re.sub(r' style="[^"]*"', '', html_content)
-    html_content = re.sub(r' class="[^"]*"', '', html_content)
 
-    # 3. Pulisci gli spazi bianchi multipli
-    html_content = re.sub(r'\s+', ' ', html_content).strip()
+def collapse_whitespace(html_content: str) -> str:
+    """Riduce ogni sequenza di spazi bianchi a un singolo spazio."""
+    return " ".join(html_content.split())
+
+
+def serialize_clean(node) -> str:
+    """
+    Serializza un nodo del DOM applicando la pulizia al volo:
+    div/span rimossi (resta il contenuto), attributi style/class eliminati.
+    """
+    if isinstance(node, NavigableString):
+        return node.output_ready(formatter="minimal")
+    if node.name in UNWRAPPED_TAGS:
+        return "".join(serialize_clean(child) for child in node.children)
+    attrs = "".join(
+        f' {name}="{html.escape(" ".join(value) if isinstance(value, list) else value)}"'
+        for name, value in node.attrs.items() if name not in DROPPED_ATTRIBUTES
+    )
+    if node.is_empty_element:
+        return f"<{node.name}{attrs}/>"
+    inner = "".join(serialize_clean(child) for child in node.children)
+    return f"<{node.name}{attrs}>{inner}</{node.name}>"
+
+
+def split_on_hr(body: Tag) -> List[str]:
+    """
+    Visita il DOM del body una sola volta e restituisce i segmenti già puliti
+    separati dai tag <hr>. Gli elementi che contengono un <hr> annidato vengono
+    attraversati (senza il loro tag) in modo che il separatore venga rispettato.
+    """
+    hr_ancestors = set()
+    for hr in body.find_all("hr"):
+        for parent in hr.parents:
+            if parent is body or id(parent) in hr_ancestors:
+                break
+            hr_ancestors.add(id(parent))
+
+    segments: List[List[str]] = [[]]
+
+    def walk(container):
+        for child in container.children:
+            if isinstance(child, Tag) and child.name == "hr":
+                segments.append([])
+            elif isinstance(child, Tag) and id(child) in hr_ancestors:
+                walk(child)
+            else:
+                segments[-1].append(serialize_clean(child))
 
-    return html_content
+    walk(body)
+    return [collapse_whitespace("".join(pieces)) for pieces in segments]
 
 def load_config_data(config_path: str) -> Dict[str, Any]:
     """Carica i dati JSON dal file di configurazione o inizializza se non esiste."""
@@ -68,10 +128,11 @@ def save_config_data(config_path: str, data: Dict[str, Any]):
 # LOGICA PRINCIPALE
 # =================================================================
 
-def split_and_update_content(html_filepath: str, page_id: str, lang: str, config_path: str):
+def extract_page_entry(html_filepath: str, page_id: str, lang: str) -> Optional[Dict[str, Any]]:
     """
-    Legge il contenuto HTML, lo suddivide in testo principale e testo modale,
-    e aggiorna il file JSON di configurazione.
+    Legge il contenuto HTML, lo suddivide in testo principale e testo modale
+    e restituisce il blocco della pagina da inserire in config.json.
+    Non tocca config.json: può essere chiamata in parallelo da più worker.
     """
     
     # 1. Leggi il contenuto HTML
@@ -80,11 +141,10 @@ def split_and_update_content(html_filepath: str, page_id: str, lang: str, config
             full_html = f.read()
     except FileNotFoundError:
         print(f"ERRORE: File HTML di input non trovato: {html_filepath}")
-        return
+        return None
     
-    # 2. Analizza l'HTML
-    # Utilizziamo BeautifulSoup per analizzare e navigare nell'albero DOM
-    soup = BeautifulSoup(full_html, 'html.parser')
+    # 2. Analizza l'HTML (UNA sola volta: split e pulizia avvengono sullo stesso DOM)
+    soup = BeautifulSoup(full_html, HTML_PARSER)
 
     # A. Estrai il TITOLO (usando il primo h1 trovato)
     title_element = soup.find('h1')
@@ -96,68 +156,24 @@ def split_and_update_content(html_filepath: str, page_id: str, lang: str, config
         
     # B. Estrai il testo principale e il testo del modale
     
-    # Ipotizziamo che il testo modale sia contenuto tra i tag <hr>
-    modal_content_raw = ""
-    main_content_raw = ""
-    
     # Trova il contenuto del BODY (o un contenitore più specifico se necessario)
     body_content = soup.find('body')
     if not body_content:
         print("AVVISO: Contenuto <body> non trovato nell'HTML.")
-        return
+        return None
 
-    # Dividi il contenuto in base a un separatore (es. <hr> o un tag specifico)
+    # Dividi il contenuto in base al separatore <hr> (LibreOffice spesso usa <hr/>).
     # Per semplicità, consideriamo il testo dopo l'ultimo <hr> come testo modale.
-    
-    content_parts = str(body_content).split('<hr/>') # LibreOffice spesso usa <hr/>
-    
-    if len(content_parts) > 1:
-        # Se c'è un separatore <hr>, l'ultimo pezzo è il contenuto modale.
-        # Rimuovi il tag body che è rimasto nel primo pezzo dello split
-        main_content_soup = BeautifulSoup(content_parts[0].replace('<body>', ''), 'html.parser')
-        
-        # Estraiamo tutto il contenuto testuale e strutturale del main content
-        main_content_raw = ''.join([str(tag) for tag in main_content_soup.body.contents])
-        
-        # Il contenuto modale è l'ultimo pezzo
-        modal_content_raw = content_parts[-1].replace('</body>', '')
-    else:
-        # Se non c'è separatore, tutto il contenuto è testo principale.
-        main_content_raw = ''.join([str(tag) for tag in body_content.contents])
-
+    content_parts = split_on_hr(body_content)
 
-    # 3. Pulizia e serializzazione
-    
-    # Pulisci il testo principale (rimuovi classi e tag superflui)
-    main_content_cleaned = clean_html_content(main_content_raw)
-    
-    # Il contenuto del modale lo manteniamo il più possibile fedele, 
-    # ma togliamo i tag superflui.
-    modal_content_cleaned = clean_html_content(modal_content_raw)
-    
-    # 4. Aggiorna la struttura JSON
-    config_data = load_config_data(config_path)
-
-    # Crea la chiave unica per lingua e ID della pagina (es. "it_cavaticcio")
-    page_key = f"{lang}_{page_id}"
-    
-    # Struttura di default
-    if 'pages' not in config_data:
-        config_data['pages'] = {}
+    # 3. Pulizia e serializzazione (già eseguite durante la visita del DOM)
+    main_content_cleaned = content_parts[0]
+    modal_content_cleaned = content_parts[-1] if len(content_parts) > 1 else ""
+    if len(content_parts) > 2 and any(content_parts[1:-1]):
+        print(f"AVVISO: {len(content_parts) - 1} separatori <hr> in {os.path.basename(html_filepath)}: "
+              f"il contenuto tra il primo e l'ultimo viene ignorato.")
 
-    # Aggiorna i dati della pagina
-    config_data['pages'][page_key] = {
-        "title": page_title,
-        "lang": lang,
-        "main_text": main_content_cleaned,
-        "modal_text": modal_content_cleaned,
-        "last_updated_file": os.path.basename(html_filepath)
-    }
-
-    # 5. Salva i dati aggiornati
-    save_config_data(config_path, config_data)
-    
-    # 6. Salvataggio del testo grezzo (opzionale, per debug)
+    # 4. Salvataggio del testo grezzo (opzionale, per debug)
     # Salva il contenuto pulito e formattato in un file di output HTML
     output_html_filename = os.path.join(OUTPUT_DIR, f"{lang}_{page_id}_processed_OUTPUT.html")
     try:
@@ -171,12 +187,233 @@ def split_and_update_content(html_filepath: str, page_id: str, lang: str, config
     except Exception as e:
         print(f"ERRORE nel salvataggio del file di output HTML: {e}")
 
+    return {
+        "title": page_title,
+        "lang": lang,
+        "main_text": main_content_cleaned,
+        "modal_text": modal_content_cleaned,
+        "last_updated_file": os.path.basename(html_filepath)
+    }
+
+
+class ConfigBatchWriter:
+    """
+    Accumula i blocchi pagina e aggiorna config.json UNA sola volta per batch
+    (un caricamento e un salvataggio, invece di uno per pagina).
+    Usare come context manager: il flush avviene all'uscita dal blocco.
+    """
+
+    def __init__(self, config_path: str = CONFIG_JSON_FILE):
+        self.config_path = config_path
+        self.pending: Dict[str, Dict[str, Any]] = {}
+
+    def add(self, page_key: str, page_entry: Dict[str, Any]):
+        """Registra il blocco di una pagina (chiave "lang_pageid"); l'ultimo vince."""
+        self.pending[page_key] = page_entry
+
+    def flush(self) -> int:
+        """Scrive le pagine accumulate. Restituisce il numero di pagine scritte."""
+        if not self.pending:
+            return 0
+        config_data = load_config_data(self.config_path)
+
+        # Struttura di default
+        if 'pages' not in config_data:
+            config_data['pages'] = {}
+
+        config_data['pages'].update(self.pending)
+        save_config_data(self.config_path, config_data)
+        written = len(self.pending)
+        self.pending = {}
+        return written
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.flush()
+        return False
+
+
+def update_config_pages(config_path: str, page_entries: Dict[str, Dict[str, Any]]):
+    """
+    Inserisce in config.json tutti i blocchi pagina indicati (chiave "lang_pageid")
+    con un solo caricamento e un solo salvataggio del file.
+    """
+    with ConfigBatchWriter(config_path) as writer:
+        for page_key, page_entry in page_entries.items():
+            writer.add(page_key, page_entry)
+
+
+def split_and_update_content(html_filepath: str, page_id: str, lang: str, config_path: str,
+                             writer: Optional[ConfigBatchWriter] = None):
+    """
+    Legge il contenuto HTML, lo suddivide in testo principale e testo modale,
+    e aggiorna il file JSON di configurazione.
+    Con 'writer' il blocco viene solo accumulato: config.json sarà scritto al flush.
+    """
+    page_entry = extract_page_entry(html_filepath, page_id, lang)
+    if page_entry is None:
+        return
+
+    # Crea la chiave unica per lingua e ID della pagina (es. "it_cavaticcio")
+    page_key = f"{lang}_{page_id}"
+    if writer is not None:
+        writer.add(page_key, page_entry)
+    else:
+        update_config_pages(config_path, {page_key: page_entry})
+
+
+# =================================================================
+# BENCHMARK: IMPLEMENTAZIONE PRECEDENTE vs VISITA UNICA + SCRITTURA IN BATCH
+# =================================================================
+
+def _legacy_clean_html_content(html_content: str) -> str:
+    """Pulizia con regex dell'implementazione precedente (solo per il benchmark)."""
+    html_content = re.sub(r'<(div|span)\s+[^>]*>', '', html_content)
+    html_content = re.sub(r'</(div|span)>', '', html_content)
+    html_content = re.sub(r' style="[^"]*"', '', html_content)
+    html_content = re.sub(r' class="[^"]*"', '', html_content)
+    return re.sub(r'\s+', ' ', html_content).strip()
+
+
+def _legacy_split_and_update(html_filepath: str, page_id: str, lang: str, config_path: str,
+                             parser: str = 'html.parser'):
+    """
+    Implementazione precedente (solo per il benchmark): parse, serializzazione,
+    split della stringa su '<hr/>', secondo parse, pulizia regex e
+    caricamento/salvataggio completo di config.json per ogni pagina.
+    L'originale usava sempre 'html.parser'; 'parser' permette di misurarla
+    anche con lo stesso parser dell'implementazione attuale.
+    """
+    with open(html_filepath, 'r', encoding='utf-8') as f:
+        soup = BeautifulSoup(f.read(), parser)
+    title_element = soup.find('h1')
+    page_title = title_element.get_text().strip() if title_element else "Titolo mancante"
+    if title_element:
+        title_element.decompose()
+    body_content = soup.find('body')
+    content_parts = str(body_content).split('<hr/>')
+    modal_content_raw = ""
+    if len(content_parts) > 1:
+        main_content_soup = BeautifulSoup(content_parts[0].replace('<body>', ''), parser)
+        # L'originale usava main_content_soup.body, che con 'html.parser' è None (AttributeError);
+        # 'lxml' invece avvolge il frammento in <html><body>
+        main_content_raw = ''.join([str(tag) for tag in (main_content_soup.body or main_content_soup).contents])
+        modal_content_raw = content_parts[-1].replace('</body>', '')
+    else:
+        main_content_raw = ''.join([str(tag) for tag in body_content.contents])
+
+    config_data = load_config_data(config_path)
+    config_data.setdefault('pages', {})[f"{lang}_{page_id}"] = {
+        "title": page_title,
+        "lang": lang,
+        "main_text": _legacy_clean_html_content(main_content_raw),
+        "modal_text": _legacy_clean_html_content(modal_content_raw),
+        "last_updated_file": os.path.basename(html_filepath),
+    }
+    save_config_data(config_path, config_data)
+
+
+def _synthetic_page(index: int) -> str:
+    """HTML simile all'export di LibreOffice, con titolo, testo principale e modale."""
+    paragraphs = "\n".join(
+        f'<p class="western" style="margin-bottom: 0.28cm; line-height: 116%">'
+        f'<span style="font-family: Calibri">Paragrafo {n} della pagina {index}: '
+        f'<b>testo</b> di <i>esempio</i> &amp; contenuto.</span></p>'
+        for n in range(12)
+    )
+    modal = "\n".join(f'<p class="western">Nota {n} del modale.</p>' for n in range(4))
+    return (f'<!DOCTYPE html>\n<html><head><meta charset="utf-8"/><title>p{index}</title></head>\n'
+            f'<body>\n<h1 class="western">Pagina {index}</h1>\n{paragraphs}\n<hr/>\n{modal}\n</body></html>')
+
+
+def benchmark_split(pages: int = 500):
+    """
+    Confronta l'implementazione precedente con quella attuale su 'pages'
+    pagine sintetiche, a parità di parser, e misura a parte l'effetto del
+    parser (html.parser contro lxml, se installato). Tutto avviene in una
+    cartella temporanea.
+    """
+    global OUTPUT_DIR, HTML_PARSER
+    bench_dir = tempfile.mkdtemp(prefix="bench_split_")
+    original_output_dir = OUTPUT_DIR
+    original_parser = HTML_PARSER
+    parsers = ["html.parser"] + ([original_parser] if original_parser != "html.parser" else [])
+    # I file di debug '_processed_OUTPUT.html' finiscono nella cartella temporanea
+    OUTPUT_DIR = bench_dir
+    # parser -> (secondi precedente, secondi attuale)
+    timings = {}
+    try:
+        inputs = []
+        for i in range(pages):
+            path = os.path.join(bench_dir, f"it_page{i}_maintext_INPUT.html")
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(_synthetic_page(i))
+            inputs.append((path, f"page{i}"))
+
+        # I messaggi per pagina falserebbero i tempi: vengono scartati
+        devnull = open(os.devnull, 'w', encoding='utf-8')
+        stdout = sys.stdout
+        sys.stdout = devnull
+        try:
+            for parser in parsers:
+                legacy_config = os.path.join(bench_dir, f"config_legacy_{parser}.json")
+                started = time.perf_counter()
+                for path, page_id in inputs:
+                    _legacy_split_and_update(path, page_id, "it", legacy_config, parser)
+                legacy_seconds = time.perf_counter() - started
+
+                # L'implementazione attuale legge il parser dalla costante del modulo
+                HTML_PARSER = parser
+                batch_config = os.path.join(bench_dir, f"config_batch_{parser}.json")
+                started = time.perf_counter()
+                with ConfigBatchWriter(batch_config) as writer:
+                    for path, page_id in inputs:
+                        split_and_update_content(path, page_id, "it", batch_config, writer=writer)
+                timings[parser] = (legacy_seconds, time.perf_counter() - started)
+        finally:
+            sys.stdout = stdout
+            devnull.close()
+
+        with open(batch_config, 'r', encoding='utf-8') as f:
+            batch_pages = len(json.load(f)["pages"])
+    finally:
+        OUTPUT_DIR = original_output_dir
+        HTML_PARSER = original_parser
+        shutil.rmtree(bench_dir, ignore_errors=True)
+
+    print("==================================================================")
+    print(f"BENCHMARK SPLIT + CONFIG su {pages} pagine sintetiche")
+    for parser, (legacy_seconds, batch_seconds) in timings.items():
+        print(f"  Parser {parser}:")
+        print(f"    Precedente (2 parse + JSON per pagina): {legacy_seconds:.2f}s "
+              f"({pages} caricamenti/salvataggi di config.json)")
+        print(f"    Attuale (1 visita + JSON per batch):    {batch_seconds:.2f}s "
+              f"(1 caricamento/salvataggio, {batch_pages} pagine scritte)")
+        if batch_seconds > 0:
+            print(f"    Speedup a parità di parser: {legacy_seconds / batch_seconds:.1f}x")
+    if len(parsers) > 1:
+        # Effetto del solo cambio di parser, con la stessa implementazione
+        slow, fast = timings["html.parser"], timings[original_parser]
+        print(f"  Effetto del parser (html.parser -> {original_parser}): "
+              f"precedente {slow[0] / fast[0]:.1f}x, attuale {slow[1] / fast[1]:.1f}x")
+        print(f"  Totale (precedente con html.parser -> attuale con {original_parser}): "
+              f"{slow[0] / fast[1]:.1f}x")
+    else:
+        print("  lxml non installato: effetto del parser non misurato.")
+    print("==================================================================")
+
 
 if __name__ == "__main__":
     # Esempio di utilizzo (per testare solo questo file)
     # Nota: Assicurati che esista un file HTML di input con il nome corretto
     # Esempio: "text_files/it_testpage_maintext_INPUT.html"
     
+    if "--benchmark" in sys.argv[1:]:
+        benchmark_split()
+        sys.exit(0)
+
     # Creazione della directory se non esiste
     if not os.path.exists(OUTPUT_DIR):
         os.makedirs(OUTPUT_DIR)
@@ -1,8 +1,13 @@
 import os
 import json
 import re
+from contextlib import ExitStack
 from typing import Dict, Any, Tuple
 
+from atomic_io import atomic_write_json, file_lock
+from mp3_index import resolve_audio_source
+from snapshot_store import take_snapshot
+
 # --- CONFIGURAZIONE GLOBALE ---
 
 # Cartella che contiene i file page_config_*.json generati (con i soli percorsi dei frammenti).
@@ -72,9 +77,8 @@ def save_language_config(lang: str, data: Dict[str, Any]):
     try:
         # Assicura che la directory esista (già fatto nel load, ma meglio qui)
         os.makedirs(os.path.dirname(filepath), exist_ok=True) 
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=4, ensure_ascii=False)
-        
+        # Scrittura atomica: un crash non lascia mai un texts.json troncato
+        atomic_write_json(filepath, data)
         print(f"  ✅ SALVATAGGIO COMPLETO: Aggiornato config lingua '{lang}' in: {filepath}")
         
     except Exception as e:
@@ -118,7 +122,16 @@ def sync_config(input_dir: str):
     Sincronizza la configurazione centrale: pulisce le vecchie chiavi dinamiche
     e aggiorna con le nuove generate. Aggiunge le chiavi statiche mancanti.
     Gestisce i file texts.json separati per lingua nella struttura data/translations/xx/.
+    Ogni texts.json resta sotto lock (atomic_io.py) dalla lettura al salvataggio,
+    così altri passi della pipeline in esecuzione non perdono le loro modifiche.
     """
+    with ExitStack() as locks:
+        _sync_config(input_dir, locks)
+    # Stato dopo la sincronizzazione, per poterlo ripristinare (snapshot_store.py)
+    take_snapshot("sync_config")
+
+
+def _sync_config(input_dir: str, locks: ExitStack):
     config_files = get_config_files(input_dir)
     if not config_files:
         print(f"ATTENZIONE: Nessun file 'page_config_*.json' trovato nella cartella '{input_dir}'. Nessun aggiornamento eseguito.")
@@ -147,6 +160,7 @@ def sync_config(input_dir: str):
 
                 # 1. Carica la configurazione della lingua se non è già in memoria
                 if lang not in language_configs:
+                    locks.enter_context(file_lock(os.path.join(TRANSLATIONS_BASE_DIR, lang, CONFIG_FILENAME)))
                     language_configs[lang] = load_language_config(lang)
                 
                 lang_config = language_configs[lang] # Riferimento al dict in memoria
@@ -168,9 +182,9 @@ def sync_config(input_dir: str):
                     page_block['headImage'] = DEFAULT_HEAD_IMAGE
                     added_static_keys.append('headImage')
                     
-                # 2. audioSource
+                # 2. audioSource (solo se il file esiste, altrimenti vuoto: main.js nasconde il pulsante)
                 if 'audioSource' not in page_block:
-                    page_block['audioSource'] = f"{lang.lower()}/{target_key.lower()}.mp3"
+                    page_block['audioSource'] = resolve_audio_source(lang, target_key)
                     added_static_keys.append('audioSource')
 
                 if added_static_keys:
@@ -0,0 +1,343 @@
+import os
+import sys
+import json
+import argparse
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from atomic_io import atomic_write_json, file_lock
+
+# =================================================================
+# ARCHIVIO DELLE TRADUZIONI (TEXTS.JSON CARICATI UNA SOLA VOLTA)
+# =================================================================
+# Gli script di aggiornamento (update_json_key.py, update_json.py,
+# update_json_image.py, update_image_sources.py, json_updater.py,
+# manual_key_updater.py, add_page.py) rileggevano e riscrivevano un intero
+# data/translations/<lingua>/texts.json per ogni singola chiave, e le
+# sessioni batch li invocano centinaia di volte. Qui:
+#   - ogni texts.json viene letto al primo uso e poi resta in memoria;
+#   - le modifiche (set, delete, rename, immagini in blocco) segnano il file
+#     come modificato solo se cambiano davvero qualcosa;
+#   - flush() scrive ogni file modificato una sola volta per batch, in modo
+#     atomico e sotto lock (atomic_io.py). Se nel frattempo un altro processo
+#     ha riscritto il file, questo viene riletto e le modifiche del batch
+#     (registrate in un giornale) vengono riapplicate: nessuna va persa.
+# Anche le fasi che scrivono chiavi derivate accanto alla loro chiave
+# (image_dimensions.py, image_previews.py, mp3_index.py, mp3_segmenter.py)
+# passano da qui, con place_keys().
+# Le modifiche arrivano dall'API Python (gli script sono front-end sottili
+# che accettano uno store condiviso) o da un manifest JSON:
+#   python translation_store.py modifiche.json
+# con una lista di operazioni, per esempio:
+#   [{"op": "set", "lang": "it", "page": "manifattura", "key": "pageTitle", "value": "..."},
+#    {"op": "set", "lang": "*", "page": "manifattura", "key": "mainText", "file": "testo.html"},
+#    {"op": "delete", "lang": "en", "page": "manifattura", "key": "mainText5"},
+#    {"op": "rename", "lang": "*", "page": "manifattura", "key": "title", "to": "pageTitle"},
+#    {"op": "images", "page": "manifattura", "files": ["a.jpg", "b.jpg"]}]
+# "lang": "*" (o assente) applica l'operazione a tutte le lingue.
+
+TRANSLATIONS_DIR = os.path.join("data", "translations")
+TEXTS_JSON_FILENAME = "texts.json"
+# Chiavi imageSourceN gestite dall'assegnazione in blocco delle immagini
+MAX_IMAGE_SOURCES = 5
+ALL_LANGUAGES = "*"
+
+
+class TranslationStore:
+    """
+    I texts.json di tutte le lingue, caricati una volta e scritti una volta
+    per batch. Usabile come context manager: all'uscita senza eccezioni
+    vengono salvati i file modificati.
+    """
+
+    def __init__(self, base_dir: str = TRANSLATIONS_DIR, languages: Optional[Iterable[str]] = None):
+        self.base_dir = base_dir
+        self._languages = list(languages) if languages is not None else None
+        self._texts: Dict[str, Dict[str, Any]] = {}
+        # (mtime_ns, dimensione) del file al momento della lettura, None se mancava
+        self._stamps: Dict[str, Optional[Tuple[int, int]]] = {}
+        # Modifiche in attesa di flush(), per lingua: (metodo, argomenti)
+        self._journal: Dict[str, List[Tuple[str, tuple]]] = {}
+        self._replaying = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.flush()
+        return False
+
+    # --- Lettura ---
+
+    def languages(self) -> List[str]:
+        """Lingue gestite: quelle indicate o le cartelle di base_dir con un texts.json."""
+        if self._languages is None:
+            self._languages = sorted(
+                lang for lang in os.listdir(self.base_dir)
+                if os.path.isfile(self.path(lang))
+            ) if os.path.isdir(self.base_dir) else []
+        return self._languages
+
+    def path(self, lang: str) -> str:
+        return os.path.join(self.base_dir, lang, TEXTS_JSON_FILENAME)
+
+    def texts(self, lang: str) -> Dict[str, Any]:
+        """Contenuto del texts.json della lingua (letto solo al primo accesso; {} se il file manca)."""
+        if lang not in self._texts:
+            path = self.path(lang)
+            self._stamps[lang] = self._stamp(path)
+            if self._stamps[lang] is not None:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self._texts[lang] = json.load(f)
+            else:
+                self._texts[lang] = {}
+        return self._texts[lang]
+
+    @staticmethod
+    def _stamp(path: str) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def _changed(self, lang: str, method: str, *args):
+        """Segna la lingua come modificata e registra l'operazione nel giornale."""
+        if not self._replaying:
+            self._journal.setdefault(lang, []).append((method, args))
+
+    def get(self, lang: str, page_id: str, key: str, default: Any = None) -> Any:
+        page = self.texts(lang).get(page_id)
+        return page.get(key, default) if isinstance(page, dict) else default
+
+    def page(self, lang: str, page_id: str, create: bool = False) -> Optional[Dict[str, Any]]:
+        """Blocco della pagina (creato vuoto se create=True), None se manca."""
+        texts = self.texts(lang)
+        if page_id not in texts and create:
+            texts[page_id] = {}
+            self._changed(lang, "page", page_id, True)
+        page = texts.get(page_id)
+        return page if isinstance(page, dict) else None
+
+    def _targets(self, lang: Optional[str]) -> List[str]:
+        return self.languages() if lang in (None, ALL_LANGUAGES) else [lang]
+
+    # --- Modifiche ---
+
+    def set(self, lang: str, page_id: str, key: str, value: Any, create_page: bool = False) -> bool:
+        """Imposta page_id.key. Restituisce False se la pagina non esiste (e create_page è False)."""
+        page = self.page(lang, page_id, create=create_page)
+        if page is None:
+            print(f"ERRORE: Pagina '{page_id}' non trovata in {lang}/{TEXTS_JSON_FILENAME}.")
+            return False
+        if key not in page or page[key] != value:
+            page[key] = value
+            self._changed(lang, "set", page_id, key, value, create_page)
+        return True
+
+    def set_path(self, lang: str, key_path: str, value: Any) -> bool:
+        """Imposta una chiave annidata indicata con i punti (es. "nav.navHome")."""
+        keys = key_path.split('.')
+        current = self.texts(lang)
+        for key in keys[:-1]:
+            current = current.get(key) if isinstance(current, dict) else None
+            if current is None:
+                print(f"ERRORE: Chiave non trovata in {lang}/{TEXTS_JSON_FILENAME}: {key_path}")
+                return False
+        if not isinstance(current, dict):
+            print(f"ERRORE: Chiave non trovata in {lang}/{TEXTS_JSON_FILENAME}: {key_path}")
+            return False
+        if keys[-1] not in current or current[keys[-1]] != value:
+            current[keys[-1]] = value
+            self._changed(lang, "set_path", key_path, value)
+        return True
+
+    def update(self, lang: str, page_id: str, values: Dict[str, Any], create_page: bool = False) -> List[str]:
+        """Imposta più chiavi della pagina. Restituisce le chiavi effettivamente cambiate."""
+        page = self.page(lang, page_id, create=create_page)
+        if page is None:
+            print(f"ERRORE: Pagina '{page_id}' non trovata in {lang}/{TEXTS_JSON_FILENAME}.")
+            return []
+        changed = [key for key, value in values.items() if key not in page or page[key] != value]
+        for key in changed:
+            page[key] = values[key]
+        if changed:
+            self._changed(lang, "update", page_id, {key: values[key] for key in changed}, create_page)
+        return changed
+
+    def delete(self, lang: str, page_id: str, key: str) -> bool:
+        """Rimuove page_id.key. Restituisce True se la chiave c'era."""
+        page = self.page(lang, page_id)
+        if page is None or key not in page:
+            return False
+        del page[key]
+        self._changed(lang, "delete", page_id, key)
+        return True
+
+    def rename(self, lang: str, page_id: str, old_key: str, new_key: str) -> bool:
+        """Rinomina una chiave mantenendone la posizione (sovrascrive new_key se esiste già)."""
+        page = self.page(lang, page_id)
+        if page is None or old_key not in page or old_key == new_key:
+            return False
+        renamed = {(new_key if key == old_key else key): value
+                   for key, value in page.items() if key != new_key}
+        page.clear()
+        page.update(renamed)
+        self._changed(lang, "rename", page_id, old_key, new_key)
+        return True
+
+    def replace_page(self, lang: str, page_id: str, data: Optional[Dict[str, Any]]) -> bool:
+        """
+        Sostituisce l'intero blocco della pagina mantenendone la posizione
+        (in coda se manca); con data=None la pagina viene rimossa.
+        Restituisce True se il contenuto è cambiato.
+        """
+        texts = self.texts(lang)
+        if texts.get(page_id) == data and (data is not None or page_id not in texts):
+            return False
+        if data is None:
+            del texts[page_id]
+        else:
+            texts[page_id] = dict(data)
+        self._changed(lang, "replace_page", page_id, data)
+        return True
+
+    def place_keys(self, lang: str, page_id: str, inserts: Dict[str, Dict[str, Any]],
+                   managed: Iterable[str] = ()) -> bool:
+        """
+        Riposiziona le chiavi derivate da un'altra chiave (dimensioni, anteprime,
+        metadati audio...): le chiavi di 'inserts' e di 'managed' vengono tolte
+        dal blocco e inserts[ancora] viene reinserito, nell'ordine, subito dopo
+        la chiave 'ancora' (scartato se l'ancora manca). Restituisce True se il
+        blocco è cambiato, anche solo nell'ordine delle chiavi.
+        """
+        page = self.page(lang, page_id)
+        if page is None:
+            return False
+        managed = set(managed).union(*inserts.values())
+        updated = {}
+        for key, value in page.items():
+            if key in managed:
+                continue
+            updated[key] = value
+            updated.update(inserts.get(key, {}))
+        if list(updated.items()) == list(page.items()):
+            return False
+        page.clear()
+        page.update(updated)
+        self._changed(lang, "place_keys", page_id, inserts, managed)
+        return True
+
+    def set_images(self, page_id: str, image_files: List[str], lang: Optional[str] = None) -> List[str]:
+        """
+        Assegna imageSource1..MAX_IMAGE_SOURCES (vuote quelle in eccesso) in una
+        o in tutte le lingue. Restituisce le lingue in cui la pagina esiste.
+        """
+        image_data = {f"imageSource{i}": image_files[i - 1] if i <= len(image_files) else ""
+                      for i in range(1, MAX_IMAGE_SOURCES + 1)}
+        updated = []
+        for target in self._targets(lang):
+            if self.page(target, page_id) is None:
+                print(f"ATTENZIONE: ID Pagina '{page_id}' non trovato in {target}/{TEXTS_JSON_FILENAME}. Saltato.")
+                continue
+            self.update(target, page_id, image_data)
+            updated.append(target)
+        return updated
+
+    # --- Manifest di operazioni ---
+
+    def apply(self, operations: List[Dict[str, Any]], base_dir: str = ".") -> int:
+        """Applica una lista di operazioni (vedi l'intestazione). Restituisce gli errori."""
+        errors = 0
+        for index, operation in enumerate(operations, 1):
+            op = operation.get("op")
+            page_id = operation.get("page")
+            key = operation.get("key")
+            if op == "images":
+                if not self.set_images(page_id, operation.get("files", []), operation.get("lang")):
+                    errors += 1
+                continue
+            if op not in ("set", "delete", "rename") or not page_id or not key or (op == "rename" and not operation.get("to")):
+                print(f"ERRORE: Operazione {index} non valida: {operation}")
+                errors += 1
+                continue
+
+            value = operation.get("value")
+            if op == "set" and "file" in operation:
+                try:
+                    with open(os.path.join(base_dir, operation["file"]), 'r', encoding='utf-8') as f:
+                        value = f.read().strip()
+                except OSError as e:
+                    print(f"ERRORE: Operazione {index}: file non leggibile: {e}")
+                    errors += 1
+                    continue
+
+            for lang in self._targets(operation.get("lang")):
+                if op == "set":
+                    errors += not self.set(lang, page_id, key, value, create_page=operation.get("create", False))
+                elif op == "delete":
+                    self.delete(lang, page_id, key)
+                else:
+                    self.rename(lang, page_id, key, operation["to"])
+        return errors
+
+    # --- Scrittura ---
+
+    @property
+    def dirty(self) -> List[str]:
+        return sorted(self._journal)
+
+    def _replay(self, lang: str):
+        """Rilegge il file (cambiato da un altro processo) e riapplica le modifiche del batch."""
+        print(f"AVVISO: {self.path(lang)} modificato da un altro processo: riapplico "
+              f"{len(self._journal[lang])} modifiche sul contenuto aggiornato.")
+        del self._texts[lang]
+        self._replaying = True
+        try:
+            for method, args in self._journal[lang]:
+                getattr(self, method)(lang, *args)
+        finally:
+            self._replaying = False
+
+    def flush(self) -> List[str]:
+        """
+        Scrive una volta ogni texts.json modificato (atomico, sotto lock).
+        Restituisce i percorsi scritti.
+        """
+        written = []
+        for lang in sorted(self._journal):
+            path = self.path(lang)
+            with file_lock(path):
+                if self._stamp(path) != self._stamps.get(lang):
+                    self._replay(lang)
+                atomic_write_json(path, self._texts[lang])
+                self._stamps[lang] = self._stamp(path)
+            written.append(path)
+        self._journal.clear()
+        return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Applica in un solo passaggio un manifest di modifiche ai texts.json.")
+    parser.add_argument("manifest", help="File JSON con la lista delle operazioni.")
+    parser.add_argument("--prova", action="store_true", help="Mostra i file che cambierebbero, senza scriverli.")
+    args = parser.parse_args()
+
+    try:
+        with open(args.manifest, 'r', encoding='utf-8') as f:
+            operations = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"ERRORE: Manifest non leggibile ({args.manifest}): {e}")
+        sys.exit(1)
+    if not isinstance(operations, list):
+        print("ERRORE: Il manifest deve contenere una lista di operazioni.")
+        sys.exit(1)
+
+    store = TranslationStore()
+    errors = store.apply(operations, base_dir=os.path.dirname(os.path.abspath(args.manifest)))
+    if args.prova:
+        print(f"PROVA: {len(operations)} operazioni, file da riscrivere: {', '.join(store.dirty) or 'nessuno'}.")
+    else:
+        written = store.flush()
+        print(f"✅ {len(operations)} operazioni applicate, {len(written)} texts.json scritti.")
+    sys.exit(1 if errors else 0)
@@ -1,16 +1,18 @@
 import sys
 import os
-import json
+
+from translation_store import TranslationStore
 
 # --- CONFIGURAZIONE ---
 JSON_BASE_PATH = "data/translations"
 IMAGE_LIST_FILE = "image_list.txt"
 LANGUAGES = ['it', 'en', 'es', 'fr']
 
-def update_image_sources_from_list(page_id):
+def update_image_sources_from_list(page_id, store=None):
     """
     Legge la lista delle immagini (image_list.txt) e aggiorna le chiavi imageSourceX 
     nel JSON per una specifica pagina e per tutte le lingue.
+    Con uno 'store' condiviso (TranslationStore) la scrittura è rimandata al suo flush().
     """
     # Determina il percorso dello script in esecuzione per trovare image_list.txt
     script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -47,15 +49,15 @@ def update_image_sources_from_list(page_id):
         print(f"AVVISO: Nessuna immagine trovata per la pagina '{page_id}' nel file di lista. Continuo.")
         return True 
 
-    # Inizia l'aggiornamento dei file JSON per ogni lingua
+    # Inizia l'aggiornamento dei file JSON per ogni lingua (caricati una sola volta dallo store)
+    owns_store = store is None
+    if owns_store:
+        store = TranslationStore(JSON_BASE_PATH, LANGUAGES)
     success = True
     for lang_code in LANGUAGES:
-        # Costruisce il percorso del file JSON (es. data/translations/it/texts.json)
-        json_path = os.path.join(JSON_BASE_PATH, lang_code, "texts.json")
-        
         # NOTE: Si assume che i percorsi BASE_PATH_IMAGES e BASE_PATH_TEXT_FILES
         # siano definiti in main.js e non qui. Qui salviamo solo il percorso relativo.
-
+        json_path = store.path(lang_code)
         if not os.path.exists(json_path):
             print(f"AVVISO: File JSON non trovato per la lingua '{lang_code}' in: {json_path}. Saltato.")
             continue
@@ -63,27 +65,23 @@ def update_image_sources_from_list(page_id):
         print(f"-> Aggiornamento immagini in {lang_code}/texts.json per la pagina {page_id}...")
 
         try:
-            # Legge il file JSON
-            with open(json_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                
-            if page_id in data:
+            if page_id in store.texts(lang_code):
                 # Applica gli aggiornamenti
-                for key, value in updates.items():
-                    data[page_id][key] = value
-                
-                # Scrive il file JSON
-                with open(json_path, 'w', encoding='utf-8') as f:
-                    # ensure_ascii=False per preservare i caratteri UTF-8
-                    json.dump(data, f, ensure_ascii=False, indent=4)
-                    
+                store.update(lang_code, page_id, updates)
                 print(f"✅ Immagini aggiornate con successo nel JSON '{lang_code}'.")
             else:
                 print(f"ERRORE: ID pagina '{page_id}' non trovato nel file JSON '{lang_code}'.")
                 success = False
         
         except Exception as e:
-            print(f"ERRORE durante la scrittura su texts.json ({lang_code}): {e}")
+            print(f"ERRORE durante la lettura di texts.json ({lang_code}): {e}")
+            success = False
+
+    if owns_store:
+        try:
+            store.flush()
+        except Exception as e:
+            print(f"ERRORE durante la scrittura su texts.json: {e}")
             success = False
             
     return success
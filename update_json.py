@@ -1,21 +1,26 @@
 import sys
 import os
-import json
 import datetime
 
+from translation_store import TranslationStore
+
 # --- CONFIGURAZIONI GLOBALI ---
 LANGUAGES = ['it', 'en', 'es', 'fr']
 # ------------------------------
 
-def update_json_file(repo_root, page_id, key_id, language, text_file_path):
+def update_json_file(repo_root, page_id, key_id, language, text_file_path, store=None):
     """
     Aggiorna il valore di una singola chiave (key_id) per una specifica pagina (page_id)
     in un determinato file texts.json (specificato da language), leggendo il nuovo testo 
     da un file esterno.
+    Con uno 'store' condiviso (TranslationStore) la scrittura è rimandata al suo flush().
     """
     
-    # Costruisci il percorso del file JSON specifico (es. .../data/translations/it/texts.json)
-    json_path = os.path.join(repo_root, 'data', 'translations', language, 'texts.json')
+    owns_store = store is None
+    if owns_store:
+        store = TranslationStore(os.path.join(repo_root, 'data', 'translations'))
+    # Percorso del file JSON specifico (es. .../data/translations/it/texts.json)
+    json_path = store.path(language)
     
     try:
         # 1. Leggi il nuovo contenuto dal file di testo
@@ -24,9 +29,10 @@ def update_json_file(repo_root, page_id, key_id, language, text_file_path):
             
         print(f"Letto nuovo testo per la chiave '{key_id}' nella lingua '{language}'.")
 
-        # 2. Carica il file JSON
-        with open(json_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        # 2. Carica il file JSON (una sola volta per store)
+        if not os.path.exists(json_path):
+            raise FileNotFoundError(json_path)
+        data = store.texts(language)
         
         # 3. Verifica e Aggiorna il testo e la data
         if page_id not in data:
@@ -37,15 +43,15 @@ def update_json_file(repo_root, page_id, key_id, language, text_file_path):
             print(f"ERRORE: La chiave '{key_id}' non esiste nella pagina '{page_id}' in {language}/texts.json.")
             return
             
-        # Aggiorna il testo
-        data[page_id][key_id] = new_text_content
-        
-        # Aggiorna la data di modifica (opzionale, ma consigliato)
-        data[page_id]['lastUpdate'] = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        # Aggiorna il testo e la data di modifica (opzionale, ma consigliato)
+        store.update(language, page_id, {
+            key_id: new_text_content,
+            'lastUpdate': datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        })
 
         # 4. Scrivi il JSON modificato
-        with open(json_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=4, ensure_ascii=False)
+        if owns_store:
+            store.flush()
             
         print(f"✅ Aggiornamento completato: Chiave '{key_id}' in {language}/texts.json.")
             
@@ -1,7 +1,8 @@
-import json
 import sys
 import os
 
+from translation_store import TranslationStore
+
 # Definisci il percorso base dei file JSON di traduzione
 REPO_ROOT = os.path.dirname(os.path.abspath(__file__))
 DATA_PATH = os.path.join(REPO_ROOT, "data", "translations")
@@ -9,57 +10,36 @@ DATA_PATH = os.path.join(REPO_ROOT, "data", "translations")
 # Lista delle lingue supportate
 LANGUAGES = ["it", "en", "es", "fr"]
 
-def update_image_sources(page_id, image_files):
+def update_image_sources(page_id, image_files, store=None):
     """
     Aggiorna i campi imageSource per la pagina specificata in tutti i file JSON.
     :param page_id: L'ID della pagina (es. 'arcoxy').
     :param image_files: Lista di nomi di file immagine (massimo 5).
+    :param store: TranslationStore condiviso (la scrittura è rimandata al suo flush()).
     """
     print(f"Aggiornamento di {len(image_files)} immagini per la pagina: {page_id}")
-    
-    # Prepara il dizionario dei percorsi immagine
-    image_data = {}
-    for i in range(1, 6):
-        key = f"imageSource{i}"
-        # Assegna il nome del file se presente, altrimenti stringa vuota
-        if i <= len(image_files):
-            image_data[key] = image_files[i-1]
-        else:
-            image_data[key] = ""
 
-    # Itera su tutte le lingue
+    owns_store = store is None
+    if owns_store:
+        store = TranslationStore(DATA_PATH, LANGUAGES)
+
     for lang in LANGUAGES:
-        json_file_path = os.path.join(DATA_PATH, lang, "texts.json")
-        
-        if not os.path.exists(json_file_path):
-            print(f"ERRORE: File JSON non trovato per {lang}: {json_file_path}", file=sys.stderr)
+        if not os.path.exists(store.path(lang)):
+            print(f"ERRORE: File JSON non trovato per {lang}: {store.path(lang)}", file=sys.stderr)
             continue
-
         try:
-            with open(json_file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            # Aggiorna i campi imageSource1 a imageSource5 (vuoti quelli senza immagine)
+            if store.set_images(page_id, image_files, lang):
+                print(f"  > Aggiornamento JSON {lang}/texts.json...")
         except Exception as e:
             print(f"ERRORE di lettura JSON per {lang}: {e}", file=sys.stderr)
-            continue
 
-        # --- Logica di Aggiornamento ---
-        # Si aspetta che i dati siano un dizionario dove la chiave è l'ID della pagina
-        if page_id in data:
-            print(f"  > Aggiornamento JSON {lang}/texts.json...")
-            
-            # Aggiorna i campi imageSource1 a imageSource5
-            for key, value in image_data.items():
-                data[page_id][key] = value
-            
-            # Scrivi il file JSON aggiornato
-            try:
-                with open(json_file_path, 'w', encoding='utf-8') as f:
-                    json.dump(data, f, ensure_ascii=False, indent=4)
-                print(f"  > Successo: {lang} aggiornato.")
-            except Exception as e:
-                print(f"ERRORE di scrittura JSON per {lang}: {e}", file=sys.stderr)
-        else:
-            print(f"ATTENZIONE: ID Pagina '{page_id}' non trovato in {lang}/texts.json. Saltato.", file=sys.stderr)
+    if owns_store:
+        try:
+            for path in store.flush():
+                print(f"  > Successo: {path} aggiornato.")
+        except Exception as e:
+            print(f"ERRORE di scrittura JSON: {e}", file=sys.stderr)
 
 
 if __name__ == '__main__':
@@ -1,6 +1,7 @@
 import sys
 import os
-import json
+
+from translation_store import TranslationStore
 
 # --- CONFIGURAZIONE ---
 # Questa costante punta alla cartella dove si trovano i file HTML/TXT da caricare
@@ -29,10 +30,11 @@ def read_file_content(filename):
         print(f"ERRORE di lettura del file {filename}: {e}")
         return None
 
-def update_json_key(lang_code, full_key, value_or_filename):
+def update_json_key(lang_code, full_key, value_or_filename, store=None):
     """
     Aggiorna il valore di una chiave annidata. Se il valore fornito è un nome di file,
     legge il contenuto di quel file e lo inserisce nel JSON.
+    Con uno 'store' condiviso (TranslationStore) la scrittura è rimandata al suo flush().
     """
     if lang_code not in LANGUAGES:
         print(f"ERRORE: Codice lingua '{lang_code}' non valido. Deve essere tra {LANGUAGES}.")
@@ -44,7 +46,10 @@ def update_json_key(lang_code, full_key, value_or_filename):
         print(f"ERRORE: Chiave non valida. Formato atteso: 'page_id.key'. Ricevuto: '{full_key}'")
         return False
 
-    json_path = os.path.join(JSON_BASE_PATH, lang_code, "texts.json")
+    owns_store = store is None
+    if owns_store:
+        store = TranslationStore(JSON_BASE_PATH)
+    json_path = store.path(lang_code)
     
     if not os.path.exists(json_path):
         print(f"ERRORE: File JSON non trovato per la lingua '{lang_code}' in: {json_path}")
@@ -71,23 +76,12 @@ def update_json_key(lang_code, full_key, value_or_filename):
         final_value = content
         print("-> Contenuto letto con successo. Passaggio alla scrittura nel JSON.")
 
-    # --- SCRITTURA NEL JSON ---
+    # --- SCRITTURA NEL JSON (tramite lo store: un solo salvataggio per batch) ---
     try:
-        # Legge il file JSON
-        with open(json_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            
-        if page_id not in data:
-            print(f"ERRORE: ID pagina '{page_id}' non trovato nel file JSON.")
+        if not store.set(lang_code, page_id, key_name, final_value):
             return False
-            
-        # Aggiorna la chiave specifica all'interno del blocco della pagina
-        data[page_id][key_name] = final_value
-        
-        # Scrive il file JSON
-        with open(json_path, 'w', encoding='utf-8') as f:
-            # ensure_ascii=False per preservare i caratteri UTF-8 come gli emoji
-            json.dump(data, f, ensure_ascii=False, indent=4)
+        if owns_store:
+            store.flush()
             
         print(f"✅ Aggiornato con successo: '{full_key}'. Valore finale (truncate): '{final_value[:50]}...'")
         return True
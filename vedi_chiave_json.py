@@ -1,54 +1,58 @@
-import json
 import os
 import sys
 
+from content_index import ContentIndex, CONTENT_INDEX_FILE
+from translation_store import TRANSLATIONS_DIR
+
+ALL_PAGES = "*"
+# Ordine di stampa delle lingue
+LANGUAGES = ["it", "en", "es", "fr"]
+
+
 def vedi_chiave_json(page_id, key_name, root_dir="."):
     """
-    Legge i file texts.json nelle diverse lingue ed estrae il valore di una chiave specifica.
+    Mostra il valore di una chiave nelle diverse lingue, dall'indice dei
+    texts.json (content_index.py). Con page_id "*" la chiave viene mostrata
+    per tutte le pagine.
     """
-    languages = ["it", "en", "es", "fr"]
-    results = []
+    index = ContentIndex(os.path.join(root_dir, CONTENT_INDEX_FILE), os.path.join(root_dir, TRANSLATIONS_DIR))
+    try:
+        indexed = set(index.languages())
+        table = index.key_table(key_name, None if page_id == ALL_PAGES else page_id)
+    finally:
+        index.close()
+    languages = [lang for lang in LANGUAGES if lang in indexed] + sorted(indexed - set(LANGUAGES))
+
+    if page_id == ALL_PAGES:
+        print(f"--- Chiave '{key_name}' in tutte le pagine ---\n")
+        print(f"{'pagina':<20}" + "".join(f"{lang:<30}" for lang in languages))
+        for page, values in table.items():
+            cells = []
+            for lang in languages:
+                value = values.get(lang)
+                cells.append("(pagina assente)" if lang not in values else "(mancante)" if value is None else value)
+            print(f"{page:<20}" + "".join(f"{cell[:28]:<30}" for cell in cells))
+        return
 
     print(f"--- Ricerca per Pagina: '{page_id}' | Chiave: '{key_name}' ---\n")
+    values = table.get(page_id, {})
+    for lang in LANGUAGES:
+        if lang not in indexed:
+            json_path = os.path.join(root_dir, 'data', 'translations', lang, 'texts.json')
+            print(f"[{lang}] ❌ File non trovato: {json_path}")
+        elif lang not in values:
+            print(f"[{lang}] ⚠️ Pagina '{page_id}' non trovata")
+        elif values[lang] is None:
+            print(f"[{lang}] ⚠️ Chiave '{key_name}' non presente in '{page_id}'")
+        else:
+            # Formattazione richiesta: "id"; "chiave": "valore"
+            print(f"[{lang}] \"{page_id}\"; \"{key_name}\": \"{values[lang]}\"")
 
-    for lang in languages:
-        # Costruzione del percorso dinamico
-        json_path = os.path.join(root_dir, 'data', 'translations', lang, 'texts.json')
-        
-        if not os.path.exists(json_path):
-            results.append(f"[{lang}] ❌ File non trovato: {json_path}")
-            continue
-
-        try:
-            with open(json_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            
-            # Controllo se l'ID pagina esiste nel JSON
-            if page_id in data:
-                page_data = data[page_id]
-                # Controllo se la chiave esiste nel blocco della pagina
-                if key_name in page_data:
-                    valore = page_data[key_name]
-                    # Formattazione richiesta: "id"; "chiave": "valore"
-                    results.append(f"[{lang}] \"{page_id}\"; \"{key_name}\": \"{valore}\"")
-                else:
-                    results.append(f"[{lang}] ⚠️ Chiave '{key_name}' non presente in '{page_id}'")
-            else:
-                results.append(f"[{lang}] ⚠️ Pagina '{page_id}' non trovata")
-                
-        except json.JSONDecodeError:
-            results.append(f"[{lang}] ❌ Errore di decodifica JSON in {json_path}")
-        except Exception as e:
-            results.append(f"[{lang}] ❌ Errore imprevisto: {str(e)}")
-
-    # Stampa i risultati
-    for res in results:
-        print(res)
 
 if __name__ == "__main__":
     # Controllo argomenti da riga di comando
     if len(sys.argv) < 3:
-        print("Uso: python vedi_chiave_json.py <page_id> <key_name> [root_path]")
+        print("Uso: python vedi_chiave_json.py <page_id|*> <key_name> [root_path]")
         print("Esempio: python vedi_chiave_json.py cavaticcio audioSource")
         sys.exit(1)
 
@@ -57,4 +61,4 @@ if __name__ == "__main__":
     # Se passi il percorso root come terzo argomento, lo usa, altrimenti usa la cartella corrente
     r_path = sys.argv[3] if len(sys.argv) > 3 else "."
 
-    vedi_chiave_json(p_id, k_name, r_path)
\ No newline at end of file
+    vedi_chiave_json(p_id, k_name, r_path)